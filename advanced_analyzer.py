@@ -5,7 +5,7 @@ from selenium.webdriver.firefox.service import Service as FirefoxService
 from selenium.webdriver.firefox.options import Options as FirefoxOptions
 from webdriver_manager.firefox import GeckoDriverManager
 from airbnb_calendar_checker import check_calendar_availability, export_to_excel
-from price_checker import check_room_price
+from price_checker import check_room_price, check_room_price_matrix
 from logger_config import get_logger
 import re
 import os
@@ -18,11 +18,32 @@ import hmac
 import hashlib
 import base64
 import shutil
-from bit_browser_manager import BitBrowserManager
+from bit_browser_manager import BitBrowserManager, BrowserPool
+from page_fixtures import PageRecorder, set_recorder
+from data_export import exporter
+from summary_engine import SummaryAccumulator
+from room_list import load_room_list, log_report
+from incremental_planner import load_previous_state
+from quote_cache import quote_cache
+from rate_limiter import rate_limiter
+from page_readiness import reset_wait_stats, log_wait_stats
+from run_journal import RunJournal, set_journal, journal_room_failed
+from room_scheduler import prioritize_room_ids
 import threading
+import queue
+import argparse
 
 # 在文件顶部添加配置变量
 MAX_CONCURRENT_THREADS = 1 # 最大并发线程数
+MAX_TABS_PER_PROFILE = 2  # 每个浏览器配置文件最多保留的标签页数
+MAX_ROOM_ATTEMPTS = 2  # 浏览器失效时单个房源的最大尝试次数
+PRICE_MATRIX_MODE = False  # 是否额外获取 住宿天数 x 入住人数 的报价矩阵
+SCHEDULE_BY_PRIORITY = True  # 按陈旧度/波动性/最近可预订日期排序房源，False时按表格顺序
+INCREMENTAL_MODE = False  # 只重新报价日历有变化、新开放或报价过期的日期，其余沿用历史报价
+RECORD_FIXTURES = False  # 是否保存页面快照，用于离线回放和基准测试
+FIXTURE_DIR = 'fixtures'
+ASYNC_EXPORT = True  # 日历/价格数据由后台线程批量写盘
+PARTIAL_SUMMARY_INTERVAL = 10  # 每完成多少个房源更新一次运行中的汇总报告
 GECKODRIVER_VERSION = "v0.33.0"  # 指定版本
 GECKODRIVER_PATH = os.path.join(os.path.dirname(__file__), "drivers", "geckodriver.exe")
 GECKODRIVER_URL = "https://github.com/mozilla/geckodriver/releases/download/v0.33.0/geckodriver-v0.33.0-win64.zip"
@@ -76,26 +97,15 @@ class KookeeyProxy:
             return None
 
 def read_room_ids(filename='RoomID.xlsx'):
-    """读取房间ID"""
+    """读取房间ID，支持xlsx/csv/txt，去重并校验格式，文件未变化时直接使用缓存"""
     logger = get_logger()
     try:
         if not os.path.exists(filename):
             logger.error(f"文件不存在: {filename}")
             return None
             
-        # 读取Excel文件，将第一列作为字符串读取
-        df = pd.read_excel(filename, dtype={0: str})  # 指定第一列为字符串类型
-        
-        # 获取房间ID列表，确保是字符串格式
-        room_ids = []
-        for _, row in df.iterrows():
-            room_id = str(row.iloc[0]).strip()  # 转换为字符串并去除空白
-            if pd.notna(row.iloc[0]) and room_id:  # 检查是否为空
-                # 移除可能的小数点和科学计数法
-                room_id = room_id.split('.')[0]  # 移除小数部分
-                room_id = room_id.split('E')[0]  # 移除科学计数法部分
-                room_ids.append(room_id)
-                logger.debug(f"读取到房间ID: {room_id}")
+        room_ids, report = load_room_list(filename)
+        log_report(filename, report)
         
         logger.info(f"成功读取 {len(room_ids)} 个房间ID")
         if room_ids:
@@ -197,6 +207,11 @@ def analyze_listing(url_info, driver):
     logger.info(f"\n开始分析房源: {url}")
     
     try:
+        # 增量模式：在新日历写入历史库之前读取上一次的日历和报价
+        previous_state = None
+        if INCREMENTAL_MODE:
+            previous_state = load_previous_state(exporter.history_db, _get_room_id_from_url(url))
+        
         # 1. 获取日历数据
         calendar_data, excel_file, driver = check_calendar_availability(url, driver)
         if not calendar_data:
@@ -206,17 +221,23 @@ def analyze_listing(url_info, driver):
         logger.info(f"成功获取日历数据: {len(calendar_data)} 条记录")
         
         # 2. 获取价格数据
-        price_info = check_room_price(url_info, calendar_data, driver)
+        price_info = check_room_price(url_info, calendar_data, driver, previous_state=previous_state)
         if not price_info:
             logger.error(f"获取格数据失败: {url}")
         else:
             logger.info("成功获取价格数据")
         
+        # 报价矩阵模式：复用当前标签页和日历数据
+        price_matrix = None
+        if PRICE_MATRIX_MODE:
+            price_matrix = check_room_price_matrix(url_info, calendar_data, driver)
+        
         # 3. 合并数据
         result = {
             'url': url,
             'calendar_data': calendar_data,
             'price_info': price_info,
+            'price_matrix': price_matrix,
             'calendar_excel': excel_file
         }
         
@@ -226,17 +247,47 @@ def analyze_listing(url_info, driver):
         logger.error(f"分析房源时发生错误: {str(e)}")
         return None
 
-def analyze_multiple_listings(urls):
-    """并发分析多个房源"""
+# 结果队列中的线程结束标记
+_WORKER_DONE = object()
+
+def _get_room_id_from_url(url):
+    """从URL中提取房间ID"""
+    return url.split('rooms/')[-1].split('?')[0]
+
+def log_worker_utilization(worker_stats, wall_seconds):
+    """输出每个工作线程的利用率统计"""
+    logger = get_logger()
+    logger.info("\n=== 工作线程利用率 ===")
+    logger.info(f"总耗时: {wall_seconds:.1f} 秒")
+    for stats in sorted(worker_stats, key=lambda s: s['worker']):
+        utilization = stats['busy_seconds'] / wall_seconds if wall_seconds > 0 else 0.0
+        logger.info(
+            f"线程 #{stats['worker']} (浏览器 {', '.join(sorted(stats['browsers'])) or '-'}): "
+            f"完成 {stats['rooms_done']} 个, 失败 {stats['rooms_failed']} 个, "
+            f"忙碌 {stats['busy_seconds']:.1f} 秒, 利用率 {utilization:.1%}"
+        )
+
+def iter_listing_results(urls):
+    """并发分析多个房源，每完成一个房源就产出一个结果
+
+    所有房源放入共享队列，每个线程处理完一个房源后再从队列中取下一个，
+    避免某个慢房源拖住预先分配好的整组URL。浏览器通过BrowserPool按房源租借，
+    某个浏览器失效只会让当前房源重新排队，不会影响其他房源。
+    完成的结果经结果队列交给调用方，调用方处理完即可释放，不在内存中累积。
+    """
     logger = get_logger()
     logger.info("=== 开始批量分析房源 ===")
+    if not urls:
+        logger.info("没有需要分析的房源")
+        return
     
     # 创建时间戳目录
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     date_dir = f'data/{timestamp}'
     os.makedirs(date_dir, exist_ok=True)
     
-    results = []
+    quote_cache.reset_stats()
+    reset_wait_stats(run=True)
     max_workers = min(MAX_CONCURRENT_THREADS, len(urls))
     logger.info(f"设置并发线程数: {max_workers}")
 
@@ -247,7 +298,7 @@ def analyze_multiple_listings(urls):
         browsers = browser_manager.get_all_browsers()
         if not browsers:
             logger.error("没有可用的浏览器实例")
-            return []
+            return
             
         # 确保有足够的浏览器实例
         if len(browsers) < max_workers:
@@ -261,203 +312,238 @@ def analyze_multiple_listings(urls):
             logger.info(f"备注: {browser['remark']}")
             logger.info(f"PID: {browser['pid']}\n")
             
-        # 将URLs平均分配给每个线程
-        urls_per_thread = len(urls) // max_workers
-        remainder = len(urls) % max_workers
-        
-        url_chunks = []
-        start = 0
-        for i in range(max_workers):
-            # 如果有余数，前几个线程多分配一个URL
-            chunk_size = urls_per_thread + (1 if i < remainder else 0)
-            end = start + chunk_size
-            url_chunks.append(urls[start:end])
-            start = end
+        browser_pool = BrowserPool(
+            manager=browser_manager,
+            browser_ids=[browser['id'] for browser in browsers[:max_workers]],
+            max_tabs_per_profile=MAX_TABS_PER_PROFILE
+        )
             
-        logger.info("\n=== URL分配情况 ===")
-        for i, chunk in enumerate(url_chunks):
-            logger.info(f"线程 {i+1} 分配到 {len(chunk)} 个URL:")
-            for url in chunk:
-                room_id = url['url'].split('rooms/')[-1].split('?')[0]
-                logger.info(f"  - Room ID: {room_id}")
+        # 所有房源进入共享工作队列，由空闲线程按需领取
+        room_queue = queue.Queue()
+        for url_info in urls:
+            room_queue.put(url_info)
+        logger.info(f"工作队列中共有 {room_queue.qsize()} 个房源")
+        attempts = {}
+        attempts_lock = threading.Lock()
+        # 完成的房源结果和线程结束标记都放入结果队列；调用方提前停止时通知线程不再领取新房源
+        result_queue = queue.Queue()
+        stop_event = threading.Event()
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = []
+        def requeue_room(url_info, room_id, reason="浏览器失效"):
+            """浏览器失效或无法租借导致的失败，在重试次数内放回队列"""
+            with attempts_lock:
+                attempts[room_id] = attempts.get(room_id, 0) + 1
+                retry = attempts[room_id] < MAX_ROOM_ATTEMPTS
+            if retry:
+                logger.warning(f"Room ID {room_id} 因{reason}重新排队 (第 {attempts[room_id]} 次失败)")
+                room_queue.put(url_info)
+            return retry
+        
+        def process_queue(thread_index):
+            thread_id = threading.get_ident()
+            logger.info(f"线程 {thread_id} (#{thread_index+1}) 启动")
+            stats = {
+                'worker': thread_index + 1,
+                'browsers': set(),
+                'rooms_done': 0,
+                'rooms_failed': 0,
+                'busy_seconds': 0.0
+            }
             
-            # 为每个线程分配一个浏览器实例和一组URL
-            for i, (browser, urls_chunk) in enumerate(zip(browsers[:max_workers], url_chunks)):
-                browser_id = browser['id']
-                
-                def process_urls(urls_chunk, browser_id, thread_index):
-                    thread_id = threading.get_ident()
-                    logger.info(f"线程 {thread_id} (#{thread_index+1}) 使用浏览器 {browser_id}")
-                    thread_results = []
+            def room_failed(room_id, error):
+                """房源本次失败；记入运行日志，失败次数达到上限后--resume不再重试"""
+                stats['rooms_failed'] += 1
+                journal_room_failed(room_id, error)
+            
+            # 持续从队列领取房源，直到队列为空
+            while not stop_event.is_set():
+                try:
+                    url_info = room_queue.get_nowait()
+                except queue.Empty:
+                    break
                     
-                    try:
-                        # 连接到指定的浏览器实例
-                        driver = browser_manager.connect_browser(browser_id=browser_id)
-                        if not driver:
-                            logger.error(f"无法连接到浏览器实例 {browser_id}")
-                            return None
-                            
-                        # 处理分配给这个线程的所有URL
-                        for url_info in urls_chunk:
-                            room_id = url_info['url'].split('rooms/')[-1].split('?')[0]
-                            logger.info(f"线程 #{thread_index+1} 开始处理 Room ID: {room_id}")
-                            
-                            try:
-                                # 在新标签页中打开URL
-                                result = browser_manager.open_url_in_new_tab(driver, url_info['url'])
-                                if not result:
-                                    logger.error(f"无法在浏览器 {browser_id} 中打开URL {url_info['url']}")
+                room_id = _get_room_id_from_url(url_info['url'])
+                logger.info(f"线程 #{thread_index+1} 开始处理 Room ID: {room_id} (队列剩余 {room_queue.qsize()})")
+                started = time.time()
+                
+                try:
+                    lease = browser_pool.lease()
+                    if not lease:
+                        logger.error(f"线程 #{thread_index+1} 无法租借浏览器: Room ID {room_id}")
+                        if not requeue_room(url_info, room_id, "无法租借浏览器"):
+                            room_failed(room_id, "无法租借浏览器")
+                        continue
+                        
+                    with lease:
+                        driver = lease.driver
+                        stats['browsers'].add(lease.browser_id)
+                        
+                        # 在新标签页中打开URL
+                        result = browser_manager.open_url_in_new_tab(driver, url_info['url'])
+                        if not result:
+                            logger.error(f"无法在浏览器 {lease.browser_id} 中打开URL {url_info['url']}")
+                            if not browser_manager.is_driver_alive(driver):
+                                lease.mark_unhealthy()
+                                if requeue_room(url_info, room_id):
                                     continue
-                                    
-                                # 分析房源
-                                result = analyze_listing(url_info, driver)
-                                if result:
-                                    thread_results.append(result)
-                                    logger.info(f"线程 #{thread_index+1} 完成 Room ID: {room_id}")
-                                
-                                # 关闭标签页但保持浏览器实例
-                                browser_manager.close_tab(driver)
-                                
-                            except Exception as e:
-                                logger.error(f"处理 Room ID {room_id} 时发生错误: {str(e)}")
-                                continue
-                                
-                        return thread_results
+                            room_failed(room_id, "无法打开房源页面")
+                            continue
+                            
+                        # 分析房源
+                        result = analyze_listing(url_info, driver)
+                        if result:
+                            result_queue.put(result)
+                            stats['rooms_done'] += 1
+                            logger.info(f"线程 #{thread_index+1} 完成 Room ID: {room_id}")
+                        elif not browser_manager.is_driver_alive(driver):
+                            lease.mark_unhealthy()
+                            if not requeue_room(url_info, room_id):
+                                room_failed(room_id, "浏览器失效")
+                            continue
+                        else:
+                            room_failed(room_id, "分析房源失败")
                         
-                    except Exception as e:
-                        logger.error(f"线程 #{thread_index+1} 发生错误: {str(e)}")
-                        return None
+                        # 关闭标签页但保持浏览器实例
+                        browser_manager.close_tab(driver)
+                    
+                except Exception as e:
+                    room_failed(room_id, str(e))
+                    logger.error(f"处理 Room ID {room_id} 时发生错误: {str(e)}")
+                finally:
+                    stats['busy_seconds'] += time.time() - started
+                    room_queue.task_done()
+                    
+            return stats
+
+        def run_worker(thread_index):
+            try:
+                return process_queue(thread_index)
+            finally:
+                result_queue.put(_WORKER_DONE)
+
+        run_started = time.time()
+        worker_stats = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run_worker, i) for i in range(max_workers)]
 
-                futures.append(executor.submit(process_urls, urls_chunk, browser_id, i))
+            # 边完成边产出结果，所有线程结束后退出
+            try:
+                finished_workers = 0
+                while finished_workers < max_workers:
+                    item = result_queue.get()
+                    if item is _WORKER_DONE:
+                        finished_workers += 1
+                        continue
+                    room_dir = f'data/room_{_get_room_id_from_url(item["url"])}'
+                    os.makedirs(room_dir, exist_ok=True)
+                    yield item
+            finally:
+                stop_event.set()
 
-            # 收集所有线程的结果
-            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+            for i, future in enumerate(futures):
                 try:
-                    thread_results = future.result()
-                    if thread_results:
-                        results.extend(thread_results)
-                        # 处理每个结果...
-                        for result in thread_results:
-                            # 复制文件等操作...
-                            room_id = result['url'].split('rooms/')[-1].split('?')[0]
-                            room_dir = f'data/room_{room_id}'
-                            os.makedirs(room_dir, exist_ok=True)
-                            
-                            # 复制到日期目录和房间目录
-                            # ... 其余代码保持不变 ...
-                            
+                    worker_stats.append(future.result())
                 except Exception as e:
                     logger.error(f"处理线程 {i+1} 的结果时发生错误: {str(e)}")
 
-        return results
+        log_worker_utilization(worker_stats, time.time() - run_started)
+        browser_pool.log_stats()
+        quote_cache.log_stats()
+        rate_limiter.log_stats()
+        log_wait_stats(run=True)
         
     except Exception as e:
         logger.error(f"批量分析过程中发生错误: {str(e)}")
-        return results
 
-def create_summary_data(results):
-    """创建汇总数据"""
-    summary_data = []
-    for result in results:
-        if result:
-            room_id = result['url'].split('rooms/')[-1]
-            
-            # 基础信息
-            summary_info = {
-                'Room ID': room_id,
-                'URL': result['url'],
-                '总天数': len(result['calendar_data']),
-                '可预订天数': sum(1 for d in result['calendar_data'] if d['status'] == "可预订"),
-                '不可预订天数': sum(1 for d in result['calendar_data'] if d['status'] == "不可预订"),
-                '数据文件': result['calendar_excel']
-            }
-            
-            # 添加价格统计
-            if result['price_info'] and isinstance(result['price_info'], list):
-                prices = [float(re.search(r'\$(\d+)', p['nightly_price']).group(1)) 
-                         for p in result['price_info'] if p['nightly_price']]
-                if prices:
-                    summary_info.update({
-                        '平均每晚价格': f"${sum(prices)/len(prices):.2f}",
-                        '最高每晚价格': f"${max(prices):.2f}",
-                        '最低每晚价格': f"${min(prices):.2f}",
-                        '价格样本数': len(prices)
-                    })
-            
-            summary_data.append(summary_info)
-    return summary_data
+def analyze_multiple_listings(urls):
+    """并发分析多个房源，返回全部结果的列表（结果较多时使用iter_listing_results逐个处理）"""
+    return list(iter_listing_results(urls))
 
-def main():
+def main(resume=False):
+    """
+    resume: 继续最近一次未完成的运行，跳过运行日志中已完成的房源和报价
+    """
     logger = get_logger()
     logger.info("=== 开始Airbnb数据收集程序 ===")
     
+    if RECORD_FIXTURES:
+        set_recorder(PageRecorder(FIXTURE_DIR))
+        logger.info(f"页面快照录制已开启: {FIXTURE_DIR}")
+    
     try:
-        # 1. 读取房间ID
-        room_ids = read_room_ids()
-        if not room_ids:
-            logger.error("未能读取房间信息，程序退出")
-            return
+        journal = RunJournal()
+        run_id = journal.last_unfinished_run() if resume else None
+        completed = {}
+        if run_id:
+            # 1. 继续中断的运行：使用当时保存的房源列表
+            room_ids = journal.run_rooms(run_id)
+            completed = journal.completed_rooms(run_id)
+            logger.info(f"继续第 {run_id} 次运行: 共 {len(room_ids)} 个房源, 已完成 {len(completed)} 个")
+        else:
+            if resume:
+                logger.info("没有未完成的运行，开始新的运行")
+            # 1. 读取房间ID
+            room_ids = read_room_ids()
+            if not room_ids:
+                logger.error("未能读取房间信息，程序退出")
+                return
+            # 按历史数据排序，运行被提前中止时也先完成最需要更新的房源
+            if SCHEDULE_BY_PRIORITY:
+                room_ids = prioritize_room_ids(room_ids, exporter.history_db)
+            run_id = journal.start_run(room_ids)
+        set_journal(journal, run_id)
             
-        # 2. 生成URL列表
-        urls = generate_urls(room_ids)
+        # 2. 生成URL列表（跳过已完成的房源）
+        urls = generate_urls([room_id for room_id in room_ids if room_id not in completed])
         logger.info(f"生成 {len(urls)} 个URL")
         
         # 3. 创建数据存储目录
         data_dir = create_data_directory()
         logger.info(f"创建数据目录: {data_dir}")
         
-        # 4. 执行数据收集
-        results = analyze_multiple_listings(urls)
+        # 4. 执行数据收集，每完成一个房源就汇总并释放原始数据，
+        #    运行中定期刷新汇总报告；后台线程负责写盘，结束时确保所有数据落盘
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        summary_file = f'{data_dir}/airbnb_summary_{timestamp}.xlsx'
+        accumulator = SummaryAccumulator()
+        accumulator.restore(completed.values())
+        last_partial = len(accumulator)
+        if ASYNC_EXPORT:
+            exporter.start_background_writer()
+        try:
+            for result in iter_listing_results(urls):
+                record = accumulator.add(result)
+                journal.mark_room_done(run_id, _get_room_id_from_url(result['url']), record)
+                del result
+                if len(accumulator) - last_partial >= PARTIAL_SUMMARY_INTERVAL:
+                    last_partial = len(accumulator)
+                    accumulator.write_excel(summary_file)
+                    logger.info(f"部分汇总已更新: {len(accumulator)}/{len(urls)} 个房源 -> {summary_file}")
+        finally:
+            exporter.stop_background_writer()
+        
+        # 所有房源都完成后运行才结束，否则可以用 --resume 继续
+        unfinished = len(room_ids) - len(journal.completed_rooms(run_id))
+        failed = journal.failed_rooms(run_id)
+        if failed:
+            logger.warning(f"{len(failed)} 个房源失败次数达到上限，不再重试: {', '.join(sorted(failed))}")
+        if unfinished:
+            logger.warning(f"还有 {unfinished} 个房源未完成，可使用 --resume 继续第 {run_id} 次运行")
+        else:
+            journal.finish_run(run_id)
         
         # 5. 生成汇总报告
-        if results:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            summary_file = f'{data_dir}/airbnb_summary_{timestamp}.xlsx'
-            
-            # 创建汇总数据
-            summary_data = []
-            for result in results:
-                if result:  # 确保结果有效
-                    room_id = result['url'].split('rooms/')[-1]
-                    
-                    # 基础信息
-                    summary_info = {
-                        'Room ID': room_id,
-                        'URL': result['url'],
-                        '总天数': len(result['calendar_data']),
-                        '可预订天数': sum(1 for d in result['calendar_data'] if d['status'] == "可预订"),
-                        '不可预订天数': sum(1 for d in result['calendar_data'] if d['status'] == "不可预订"),
-                        '数据文件': result['calendar_excel']
-                    }
-                    
-                    # 添加价格统计
-                    if result['price_info'] and isinstance(result['price_info'], list):
-                        prices = [float(re.search(r'\$(\d+)', p['nightly_price']).group(1)) 
-                                for p in result['price_info'] if p['nightly_price']]
-                        if prices:
-                            summary_info.update({
-                                '平均每晚价格': f"${sum(prices)/len(prices):.2f}",
-                                '最高每晚价格': f"${max(prices):.2f}",
-                                '最低每晚价格': f"${min(prices):.2f}",
-                                '价格样本数': len(prices)
-                            })
-                    
-                    summary_data.append(summary_info)
+        summary_data = accumulator.summary()
+        if not summary_data.empty:
+            accumulator.write_excel(summary_file)
+            logger.info(f"汇总报告已保存到: {summary_file}")
             
-            # 保存汇总报告
-            if summary_data:
-                pd.DataFrame(summary_data).to_excel(summary_file, index=False)
-                logger.info(f"汇总报告已保存到: {summary_file}")
-                
-                # 打印统计信息
-                print("\n=== 数据收集完成 ===")
-                print(f"总房源数: {len(room_ids)}")
-                print(f"成功收集: {len(summary_data)}")
-                print(f"失败数量: {len(room_ids) - len(summary_data)}")
-                print(f"汇总报告: {summary_file}")
+            # 打印统计信息
+            print("\n=== 数据收集完成 ===")
+            print(f"总房源数: {len(room_ids)}")
+            print(f"成功收集: {len(summary_data)}")
+            print(f"失败数量: {len(room_ids) - len(summary_data)}")
+            print(f"汇总报告: {summary_file}")
         
     except Exception as e:
         logger.error(f"程序执行过程中发生错误: {str(e)}")
@@ -465,4 +551,7 @@ def main():
         logger.info("=== 程序执行完成 ===")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Airbnb数据收集程序")
+    parser.add_argument('--resume', action='store_true', help="继续最近一次未完成的运行")
+    args = parser.parse_args()
+    main(resume=args.resume)
\ No newline at end of file
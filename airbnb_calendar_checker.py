@@ -1,4 +1,6 @@
 import time
+import json
+import re
 import logging
 import os
 import pandas as pd
@@ -14,8 +16,11 @@ from bs4 import BeautifulSoup
 from webdriver_manager.chrome import ChromeDriverManager
 from logger_config import get_logger
 from data_export import exporter
+from page_fixtures import record_page, CALENDAR_STAGE
+from rate_limiter import rate_limiter
 
-__all__ = ['check_calendar_availability', 'export_to_excel']
+__all__ = ['check_calendar_availability', 'export_to_excel', 'build_calendar_data',
+           'extract_calendar_cells_js', 'extract_calendar_cells_html', 'parse_min_nights']
 
 def export_to_excel(calendar_data, url):
     """导出数据到Excel文件"""
@@ -65,14 +70,146 @@ def export_to_excel(calendar_data, url):
         logger.error(f"导出数据到Excel时发生错误: {str(e)}")
         raise
 
-def check_calendar_availability(url, driver=None):
-    """检查房源日历可用性"""
+# 日历数据提取方式: 'js' 一次脚本调用取回所有单元格; 'html' 拉取整页源码用BeautifulSoup解析
+CALENDAR_EXTRACTION_MODE = 'js'
+
+# 在浏览器内收集所有日历单元格，只返回需要的字段，避免传输整个DOM
+CALENDAR_CELLS_SCRIPT = """
+const cells = [];
+document.querySelectorAll("td[role='button']").forEach(function (cell) {
+    const dateDiv = cell.querySelector("div[data-testid^='calendar-day-']");
+    if (!dateDiv) { cells.push(null); return; }
+    cells.push([
+        dateDiv.getAttribute('data-testid'),
+        dateDiv.getAttribute('data-is-day-blocked'),
+        cell.classList.length ? cell.classList[0] : '',
+        Array.from(dateDiv.classList),
+        cell.getAttribute('aria-label') || '',
+        cell.getAttribute('aria-disabled')
+    ]);
+});
+return JSON.stringify(cells);
+"""
+
+# aria-label中最小入住天数的匹配模式
+MIN_NIGHTS_PATTERNS = [
+    r'(\d+)\s*night minimum stay',
+    r'minimum stay[:\s]+(\d+)',
+    r'minimum stay is (\d+) night',
+    r'至少住(\d+)晚',
+    r'最少(\d+)晚'
+]
+
+def parse_min_nights(aria_label):
+    """从日期单元格的aria-label中解析最小入住天数，未找到返回None"""
+    if not aria_label:
+        return None
+    for pattern in MIN_NIGHTS_PATTERNS:
+        min_stay_match = re.search(pattern, aria_label, re.IGNORECASE)
+        if min_stay_match:
+            return int(min_stay_match.group(1))
+    return None
+
+def _raw_cell(testid, blocked_attr, cell_class, div_class, aria_label, aria_disabled):
+    """统一两种提取方式的单元格结构"""
+    return {
+        'testid': testid or '',
+        'blocked_attr': blocked_attr,
+        'cell_class': cell_class,
+        'div_class': list(div_class),
+        'aria_label': aria_label,
+        'aria_disabled': aria_disabled
+    }
+
+def extract_calendar_cells_js(driver):
+    """通过一次execute_script提取所有日历单元格，失败返回None"""
+    logger = get_logger()
+    try:
+        payload = driver.execute_script(CALENDAR_CELLS_SCRIPT)
+        cells = json.loads(payload)
+        logger.info(f"JavaScript提取日历单元格完成，数据大小: {len(payload)/1024:.2f} KB")
+        return [_raw_cell(*cell) if cell else None for cell in cells]
+    except Exception as e:
+        logger.error(f"JavaScript提取日历单元格失败: {str(e)}")
+        return None
+
+def extract_calendar_cells_html(page_source):
+    """用BeautifulSoup从页面源码中提取所有日历单元格"""
+    soup = BeautifulSoup(page_source, 'html.parser')
+    cells = []
+    for cell in soup.find_all('td', attrs={'role': 'button'}):
+        date_div = cell.find('div', {'data-testid': lambda x: x and x.startswith('calendar-day-')})
+        if not date_div:
+            cells.append(None)
+            continue
+        cells.append(_raw_cell(
+            date_div.get('data-testid', ''),
+            date_div.get('data-is-day-blocked'),
+            cell.get('class', [])[0] if cell.get('class') else '',
+            date_div.get('class', []),
+            cell.get('aria-label', ''),
+            cell.get('aria-disabled')
+        ))
+    return cells
+
+def build_calendar_data(raw_cells):
+    """把提取到的单元格转换为calendar_data，返回(calendar_data, 已处理日期集合)"""
+    logger = get_logger()
+    calendar_data = []
+    processed_dates = set()  # 用于跟踪已处理的日期
+    
+    for cell in raw_cells:
+        if not cell:
+            continue
+            
+        # 解析日期信息
+        date_str = cell['testid'].replace('calendar-day-', '')
+        
+        # 检查是否已处理过这个日期
+        if date_str in processed_dates:
+            logger.debug(f"跳过重复日期: {date_str}")
+            continue
+            
+        processed_dates.add(date_str)  # 添加到已处理集合
+        
+        is_blocked = cell['blocked_attr'] == 'true'
+        aria_label = cell['aria_label']
+        
+        # 确定可用性状态
+        availability_status = "不可预订"
+        if not is_blocked and cell['aria_disabled'] != 'true':
+            if "Available" in aria_label:
+                if "only available for checkout" in aria_label:
+                    availability_status = "仅可退房"
+                elif "no eligible checkout date" in aria_label:
+                    availability_status = "无法选择退房日期"
+                else:
+                    availability_status = "可预订"
+        
+        # 收集日期信息
+        calendar_data.append({
+            'date': date_str,
+            'status': availability_status,
+            'cell_class': cell['cell_class'],
+            'div_class': cell['div_class'],
+            'aria_label': aria_label,
+            'is_blocked': is_blocked,
+            'min_nights': parse_min_nights(aria_label)
+        })
+        
+    return calendar_data, processed_dates
+
+def check_calendar_availability(url, driver=None, extraction_mode=None):
+    """检查房源日历可用性
+
+    extraction_mode: 'js' 或 'html'，默认使用CALENDAR_EXTRACTION_MODE
+    """
     logger = get_logger()
     logger.info(f"开始检查房源日历: {url}")
     
     try:
-        # 1. 访问页面
-        driver.get(url)
+        # 1. 访问页面（与报价页面共用该浏览器配置文件的限速）
+        rate_limiter.open_page(driver, url)
         logger.info("页面加载中...")
         
         # 等待页面基本元素加载
@@ -202,59 +339,24 @@ def check_calendar_availability(url, driver=None):
             logger.error(f"等待日期单元格加载失败: {str(e)}")
             return None, None, driver
             
-        # 解析日历数据
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        calendar_data = []
-        processed_dates = set()  # 用于跟踪已处理的日期
-        
-        # 获取所有日期单元格
-        date_cells = soup.find_all('td', attrs={'role': 'button'})
-        logger.info(f"找到 {len(date_cells)} 个日期单元格")
-        
-        for cell in date_cells:
-            # 获取日期信息
-            date_div = cell.find('div', {'data-testid': lambda x: x and x.startswith('calendar-day-')})
-            if not date_div:
-                continue
-                
-            # 解析日期信息
-            date_str = date_div.get('data-testid', '').replace('calendar-day-', '')
-            
-            # 检查是否已处理过这个日期
-            if date_str in processed_dates:
-                logger.debug(f"跳过重复日期: {date_str}")
-                continue
-                
-            processed_dates.add(date_str)  # 添加到已处理集合
-            
-            is_blocked = date_div.get('data-is-day-blocked') == 'true'
-            cell_class = cell.get('class', [])[0] if cell.get('class') else ''
-            aria_label = cell.get('aria-label', '')
+        # 录制开启时保存日历展开后的页面快照
+        record_page(driver, url, CALENDAR_STAGE)
             
-            # 确定可用性状态
-            availability_status = "不可预订"
-            if not is_blocked and cell.get('aria-disabled') != 'true':
-                if "Available" in aria_label:
-                    if "only available for checkout" in aria_label:
-                        availability_status = "仅可退房"
-                    elif "no eligible checkout date" in aria_label:
-                        availability_status = "无法选择退房日期"
-                    else:
-                        availability_status = "可预订"
-            
-            # 收集日期信息
-            date_info = {
-                'date': date_str,
-                'status': availability_status,
-                'cell_class': cell_class,
-                'div_class': date_div.get('class', []),
-                'aria_label': aria_label,
-                'is_blocked': is_blocked
-            }
-            calendar_data.append(date_info)
+        # 解析日历数据：优先一次execute_script取回所有单元格，失败时退回解析整页HTML
+        mode = extraction_mode or CALENDAR_EXTRACTION_MODE
+        raw_cells = None
+        if mode == 'js':
+            raw_cells = extract_calendar_cells_js(driver)
+            if raw_cells is None:
+                logger.warning("JavaScript提取日历失败，改用BeautifulSoup解析")
+        if raw_cells is None:
+            raw_cells = extract_calendar_cells_html(driver.page_source)
+        logger.info(f"找到 {len(raw_cells)} 个日期单元格")
+        
+        calendar_data, processed_dates = build_calendar_data(raw_cells)
             
         # 验证数据
-        logger.info(f"原始单元格数量: {len(date_cells)}")
+        logger.info(f"原始单元格数量: {len(raw_cells)}")
         logger.info(f"去重后数据条数: {len(calendar_data)}")
         logger.info(f"处理的唯一日期数: {len(processed_dates)}")
         
@@ -5,10 +5,12 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from logger_config import get_logger
 import base64
+import threading
 import traceback
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
+from rate_limiter import rate_limiter
 
 class BitBrowserManager:
     def __init__(self):
@@ -16,8 +18,9 @@ class BitBrowserManager:
         self.headers = {'Content-Type': 'application/json'}
         self.logger = get_logger()
         
-        # 存储所有活动的浏览器实例
+        # 存储所有活动的浏览器实例（多线程共享，访问时需加锁）
         self.active_drivers = {}  # {browser_id: driver}
+        self._lock = threading.RLock()
         
         # 等待时间配置
         self.page_load_timeout = 30
@@ -92,18 +95,22 @@ class BitBrowserManager:
                         self.logger.info(f"   备注: {browser['remark']}")
                         self.logger.info(f"   PID: {browser['pid']}")
                     
-                    # 让用户选择浏览器
-                    browser_id = browsers[0]['id']  # 默认使用第一个
+                    # 优先选择尚未连接的实例，避免多个调用方抢同一个浏览器
+                    with self._lock:
+                        free_browsers = [b for b in browsers if b['id'] not in self.active_drivers]
+                    browser_id = (free_browsers or browsers)[0]['id']
+                    self.logger.warning(f"未指定browser_id，自动选择浏览器实例: {browser_id}")
             
             # 检查是否已经连接到这个浏览器
-            if browser_id in self.active_drivers:
-                driver = self.active_drivers[browser_id]
+            with self._lock:
+                driver = self.active_drivers.get(browser_id)
+            if driver:
                 # 创建新标签页
                 if url:
                     driver.execute_script("window.open('about:blank', '_blank');")
                     time.sleep(self.tab_switch_wait)
                     driver.switch_to.window(driver.window_handles[-1])
-                    driver.get(url)
+                    rate_limiter.open_page(driver, url)
                 return driver
                 
             # 连接到新的浏览器实例
@@ -134,11 +141,14 @@ class BitBrowserManager:
                 
                 # 保存到活动实例字典
                 driver.browser_id = browser_id
-                self.active_drivers[browser_id] = driver
+                with self._lock:
+                    self.active_drivers[browser_id] = driver
+                # 每个配置文件使用独立代理，按配置文件限速
+                rate_limiter.bind(driver, browser_id)
                 
                 # 如果提供了URL，打开页面
                 if url:
-                    driver.get(url)
+                    rate_limiter.open_page(driver, url)
                     
                 return driver
                 
@@ -151,10 +161,10 @@ class BitBrowserManager:
     def close_browser(self, browser_id):
         """关闭指定的浏览器实例"""
         try:
-            if browser_id in self.active_drivers:
-                driver = self.active_drivers[browser_id]
+            with self._lock:
+                driver = self.active_drivers.pop(browser_id, None)
+            if driver:
                 driver.quit()
-                del self.active_drivers[browser_id]
                 
             requests.post(
                 f"{self.url}/browser/close",
@@ -170,9 +180,35 @@ class BitBrowserManager:
 
     def close_all_browsers(self):
         """关闭所有活动的浏览器实例"""
-        for browser_id in list(self.active_drivers.keys()):
+        with self._lock:
+            browser_ids = list(self.active_drivers.keys())
+        for browser_id in browser_ids:
             self.close_browser(browser_id)
 
+    def get_driver(self, browser_id):
+        """获取已连接的driver，未连接时返回None"""
+        with self._lock:
+            return self.active_drivers.get(browser_id)
+
+    def is_driver_alive(self, driver):
+        """存活探测：执行一次最简单的脚本确认会话仍然可用"""
+        try:
+            return driver.execute_script("return 1;") == 1 and bool(driver.window_handles)
+        except Exception as e:
+            self.logger.warning(f"浏览器存活探测失败: {str(e)}")
+            return False
+
+    def discard_driver(self, browser_id):
+        """丢弃失效的driver引用（不关闭BitBrowser窗口），下次连接时重新建立会话"""
+        with self._lock:
+            return self.active_drivers.pop(browser_id, None) is not None
+
+    def reconnect_browser(self, browser_id):
+        """重新连接指定的浏览器实例"""
+        self.logger.info(f"重新连接浏览器实例: {browser_id}")
+        self.discard_driver(browser_id)
+        return self.connect_browser(browser_id=browser_id)
+
     def open_url_in_new_tab(self, driver, url):
         """在指定浏览器的新标签页中打开URL"""
         try:
@@ -185,7 +221,7 @@ class BitBrowserManager:
             
             # 访问URL
             self.logger.info(f"正在导航到: {url}")
-            driver.get(url)
+            rate_limiter.open_page(driver, url)
             
             # 等待页面加载
             try:
@@ -216,4 +252,172 @@ class BitBrowserManager:
             return False
         except Exception as e:
             self.logger.error(f"切换标签页失败: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    def close_tab(self, driver):
+        """关闭当前标签页并切换回剩余的标签页"""
+        try:
+            if len(driver.window_handles) > 1:
+                driver.close()
+            driver.switch_to.window(driver.window_handles[-1])
+            return True
+        except Exception as e:
+            self.logger.error(f"关闭标签页失败: {str(e)}")
+            return False
+
+    def trim_tabs(self, driver, max_tabs):
+        """关闭多余的标签页，使标签页数量不超过max_tabs"""
+        try:
+            handles = driver.window_handles
+            for handle in handles[max(max_tabs, 1):]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+            closed = max(len(handles) - max(max_tabs, 1), 0)
+            if closed:
+                self.logger.info(f"关闭了 {closed} 个多余的标签页")
+            return closed
+        except Exception as e:
+            self.logger.error(f"清理标签页失败: {str(e)}")
+            return 0
+
+
+class BrowserLease:
+    """一次浏览器租借，配合with语句使用，退出时自动归还"""
+
+    def __init__(self, pool, browser_id, driver):
+        self.pool = pool
+        self.browser_id = browser_id
+        self.driver = driver
+        self.healthy = True
+        self.leased_at = time.time()
+
+    def mark_unhealthy(self):
+        """标记driver已失效，归还时会被丢弃并在下次租借前重连"""
+        self.healthy = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None and not self.pool.manager.is_driver_alive(self.driver):
+            self.healthy = False
+        self.pool.release(self)
+        return False
+
+
+class BrowserPool:
+    """线程安全的BitBrowser租借池
+
+    每个配置文件同一时间只借给一个线程（Selenium会话本身不是线程安全的），
+    借出前做存活探测，失效的实例自动重连，重连失败的配置文件进入冷却期。
+    """
+
+    def __init__(self, manager=None, browser_ids=None, max_tabs_per_profile=2,
+                 lease_timeout=600, reconnect_cooldown=30):
+        self.manager = manager or BitBrowserManager()
+        self.logger = get_logger()
+        self.max_tabs_per_profile = max_tabs_per_profile
+        self.lease_timeout = lease_timeout
+        self.reconnect_cooldown = reconnect_cooldown
+
+        if browser_ids is None:
+            browser_ids = [browser['id'] for browser in self.manager.get_all_browsers()]
+        self.browser_ids = list(browser_ids)
+
+        self._condition = threading.Condition()
+        self._idle = list(self.browser_ids)  # 空闲的配置文件
+        self._leased = {}  # {browser_id: 线程ID}
+        self._cooldown_until = {}  # {browser_id: 可再次使用的时间戳}
+        self.stats = {'leases': 0, 'reconnects': 0, 'failed_probes': 0, 'lease_timeouts': 0}
+
+    def __len__(self):
+        return len(self.browser_ids)
+
+    def lease(self, timeout=None):
+        """借出一个健康的浏览器，超时返回None"""
+        deadline = time.time() + (self.lease_timeout if timeout is None else timeout)
+        while True:
+            browser_id = self._acquire_profile(deadline)
+            if browser_id is None:
+                with self._condition:
+                    self.stats['lease_timeouts'] += 1
+                self.logger.error("在超时时间内没有可用的浏览器实例")
+                return None
+
+            driver = self._ensure_healthy_driver(browser_id)
+            if driver:
+                with self._condition:
+                    self.stats['leases'] += 1
+                # 每个配置文件使用独立代理，按配置文件限速
+                rate_limiter.bind(driver, browser_id)
+                return BrowserLease(self, browser_id, driver)
+
+            # 重连失败，进入冷却期后再尝试
+            self.logger.error(f"浏览器实例 {browser_id} 不可用，{self.reconnect_cooldown} 秒内不再分配")
+            with self._condition:
+                self._cooldown_until[browser_id] = time.time() + self.reconnect_cooldown
+                self._leased.pop(browser_id, None)
+                self._idle.append(browser_id)
+                self._condition.notify_all()
+
+    def release(self, lease):
+        """归还浏览器"""
+        if lease.healthy:
+            self.manager.trim_tabs(lease.driver, self.max_tabs_per_profile)
+        else:
+            self.logger.warning(f"浏览器实例 {lease.browser_id} 已失效，下次租借前将重连")
+            self.manager.discard_driver(lease.browser_id)
+
+        with self._condition:
+            self._leased.pop(lease.browser_id, None)
+            self._idle.append(lease.browser_id)
+            self._condition.notify_all()
+
+    def _acquire_profile(self, deadline):
+        """等待并占用一个空闲且不在冷却期的配置文件"""
+        with self._condition:
+            while True:
+                now = time.time()
+                for browser_id in self._idle:
+                    if self._cooldown_until.get(browser_id, 0) <= now:
+                        self._idle.remove(browser_id)
+                        self._leased[browser_id] = threading.get_ident()
+                        return browser_id
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    return None
+
+                # 冷却期结束时也需要醒来重新检查
+                cooling = [self._cooldown_until[b] - now for b in self._idle
+                           if self._cooldown_until.get(b, 0) > now]
+                self._condition.wait(min([remaining] + cooling))
+
+    def _ensure_healthy_driver(self, browser_id):
+        """返回通过存活探测的driver，必要时重连"""
+        driver = self.manager.get_driver(browser_id)
+        if driver is None:
+            driver = self.manager.connect_browser(browser_id=browser_id)
+            return driver if driver and self.manager.is_driver_alive(driver) else None
+
+        if self.manager.is_driver_alive(driver):
+            return driver
+
+        with self._condition:
+            self.stats['failed_probes'] += 1
+        driver = self.manager.reconnect_browser(browser_id)
+        if driver and self.manager.is_driver_alive(driver):
+            with self._condition:
+                self.stats['reconnects'] += 1
+            return driver
+        return None
+
+    def log_stats(self):
+        """输出租借池统计信息"""
+        with self._condition:
+            stats = dict(self.stats)
+        self.logger.info(
+            f"浏览器池统计: 租借 {stats['leases']} 次, 探测失败 {stats['failed_probes']} 次, "
+            f"重连成功 {stats['reconnects']} 次, 租借超时 {stats['lease_timeouts']} 次"
+        )
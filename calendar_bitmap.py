@@ -0,0 +1,158 @@
+import zlib
+import struct
+import numpy as np
+from datetime import date, datetime, timedelta
+
+# 每天2位的状态编码
+STATUS_BLOCKED = 0
+STATUS_AVAILABLE = 1
+STATUS_CHECKOUT_ONLY = 2
+STATUS_NO_CHECKOUT = 3
+
+STATUS_CODES = {
+    "不可预订": STATUS_BLOCKED,
+    "可预订": STATUS_AVAILABLE,
+    "仅可退房": STATUS_CHECKOUT_ONLY,
+    "无法选择退房日期": STATUS_NO_CHECKOUT,
+}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# 头部: 起始日期的ordinal(uint32) + 天数(uint16)
+_HEADER = struct.Struct('<IH')
+
+def _parse_date(date_str):
+    return datetime.strptime(date_str, '%d/%m/%Y').date()
+
+def _pack_2bit(codes):
+    """每4天打包为一个字节"""
+    padded = np.zeros(((len(codes) + 3) // 4) * 4, dtype=np.uint8)
+    padded[:len(codes)] = codes
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] | (quads[:, 1] << 2) | (quads[:, 2] << 4) | (quads[:, 3] << 6)).astype(np.uint8)
+
+def _unpack_2bit(packed, length):
+    packed = np.asarray(packed, dtype=np.uint8)
+    quads = np.stack([(packed >> shift) & 0b11 for shift in (0, 2, 4, 6)], axis=1)
+    return quads.reshape(-1)[:length]
+
+class CalendarBitmap:
+    """
+    一个房源一次抓取的紧凑日历
+    start_date: 第一天
+    status: 每天的状态码(uint8数组，持久化时每天2位)
+    min_nights: 每天的最小入住天数(uint8数组，0表示未知)
+    """
+
+    __slots__ = ('start_date', 'status', 'min_nights')
+
+    def __init__(self, start_date, status, min_nights):
+        self.start_date = start_date
+        self.status = np.asarray(status, dtype=np.uint8)
+        self.min_nights = np.asarray(min_nights, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.status)
+
+    def __eq__(self, other):
+        return (isinstance(other, CalendarBitmap) and self.start_date == other.start_date
+                and np.array_equal(self.status, other.status)
+                and np.array_equal(self.min_nights, other.min_nights))
+
+    @property
+    def end_date(self):
+        return self.start_date + timedelta(days=len(self) - 1)
+
+    @classmethod
+    def from_calendar_data(cls, calendar_data):
+        """从calendar_data编码，缺失的日期按不可预订处理"""
+        days = {}
+        for date_info in calendar_data:
+            try:
+                days[_parse_date(date_info['date'])] = date_info
+            except (KeyError, ValueError):
+                continue
+        if not days:
+            return cls(date.today(), [], [])
+
+        start_date = min(days)
+        length = (max(days) - start_date).days + 1
+        status = np.zeros(length, dtype=np.uint8)
+        min_nights = np.zeros(length, dtype=np.uint8)
+        for day, date_info in days.items():
+            offset = (day - start_date).days
+            status[offset] = STATUS_CODES.get(date_info.get('status'), STATUS_BLOCKED)
+            min_nights[offset] = min(date_info.get('min_nights') or 0, 255)
+        return cls(start_date, status, min_nights)
+
+    def to_calendar_data(self):
+        """解码为calendar_data格式的行（只含date/status/is_blocked/min_nights）"""
+        return [
+            {
+                'date': (self.start_date + timedelta(days=offset)).strftime('%d/%m/%Y'),
+                'status': STATUS_NAMES[int(code)],
+                'is_blocked': int(code) == STATUS_BLOCKED,
+                'min_nights': int(nights) or None
+            }
+            for offset, (code, nights) in enumerate(zip(self.status, self.min_nights))
+        ]
+
+    def to_bytes(self):
+        """序列化：头部 + 2位状态 + 最小入住天数，整体zlib压缩"""
+        payload = (_HEADER.pack(self.start_date.toordinal(), len(self))
+                   + _pack_2bit(self.status).tobytes() + self.min_nights.tobytes())
+        return zlib.compress(payload, 9)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        payload = zlib.decompress(blob)
+        ordinal, length = _HEADER.unpack_from(payload)
+        offset = _HEADER.size
+        packed_length = (length + 3) // 4
+        packed = np.frombuffer(payload, dtype=np.uint8, count=packed_length, offset=offset)
+        min_nights = np.frombuffer(payload, dtype=np.uint8, count=length, offset=offset + packed_length)
+        return cls(date.fromordinal(ordinal), _unpack_2bit(packed, length), min_nights.copy())
+
+    @staticmethod
+    def day_from_bytes(blob, day):
+        """
+        只解码某一天，不展开整份日历：返回 (状态码, 最小入住天数，0表示未知)
+        day: date，不在日历范围内时返回None
+        """
+        payload = zlib.decompress(blob)
+        ordinal, length = _HEADER.unpack_from(payload)
+        offset = day.toordinal() - ordinal
+        if not 0 <= offset < length:
+            return None
+        status = (payload[_HEADER.size + offset // 4] >> (2 * (offset % 4))) & 0b11
+        return status, payload[_HEADER.size + (length + 3) // 4 + offset]
+
+    def _aligned(self, other):
+        """按日期对齐两个日历的重叠部分"""
+        start = max(self.start_date, other.start_date)
+        end = min(self.end_date, other.end_date)
+        if end < start:
+            return start, slice(0, 0), slice(0, 0)
+        length = (end - start).days + 1
+        a = (start - self.start_date).days
+        b = (start - other.start_date).days
+        return start, slice(a, a + length), slice(b, b + length)
+
+    def diff(self, other):
+        """
+        与另一次快照（通常是更早的一次）比较重叠日期
+        返回变化列表 [{'date', 'old_status', 'new_status', 'old_min_nights', 'new_min_nights'}]
+        """
+        start, mine, theirs = self._aligned(other)
+        changed = np.flatnonzero(
+            (self.status[mine] != other.status[theirs]) | (self.min_nights[mine] != other.min_nights[theirs])
+        )
+        return [
+            {
+                'date': (start + timedelta(days=int(i))).strftime('%d/%m/%Y'),
+                'old_status': STATUS_NAMES[int(other.status[theirs][i])],
+                'new_status': STATUS_NAMES[int(self.status[mine][i])],
+                'old_min_nights': int(other.min_nights[theirs][i]) or None,
+                'new_min_nights': int(self.min_nights[mine][i]) or None
+            }
+            for i in changed
+        ]
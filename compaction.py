@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import argparse
+from datetime import datetime
+import pandas as pd
+from logger_config import get_logger
+from snapshot_store import PARQUET_AVAILABLE
+
+# DataExporter 旧版Excel导出的文件名:
+#   by_date/<prefix>_<room_id>_<YYYYmmdd_HHMMSS>.xlsx
+#   by_room/<room_id>/<prefix>_<YYYYmmdd_HHMMSS>.xlsx  (与by_date中的文件内容相同)
+LEGACY_FILE_PATTERN = re.compile(
+    r'^(?P<prefix>price_matrix|calendar|price|summary)_(?:(?P<room_id>[^_]+)_)?(?P<stamp>\d{8}_\d{6})\.xlsx$'
+)
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+
+# 默认只合并按房源导出的数据，汇总报告保留原文件
+COMPACT_TYPES = ('calendar', 'price', 'price_matrix')
+
+# 最近修改时间在这个秒数内的文件可能还在写入，本次不合并
+MIN_FILE_AGE = 600
+
+# 锁文件超过这个秒数视为上次合并异常退出留下的
+LOCK_STALE_SECONDS = 6 * 3600
+
+LOCK_FILE = '.compaction.lock'
+
+def parse_legacy_name(filename, room_id=None):
+    """解析旧版导出文件名，返回 (数据类型, 房源ID, 抓取时间)，不是旧版文件返回None"""
+    match = LEGACY_FILE_PATTERN.match(filename)
+    if not match:
+        return None
+    room_id = match.group('room_id') or room_id
+    if not room_id:
+        return None
+    return match.group('prefix'), room_id, datetime.strptime(match.group('stamp'), TIMESTAMP_FORMAT)
+
+def source_key(data_type, room_id, scraped_at):
+    """一次导出的唯一标识，by_date和by_room中的同一次导出得到相同的标识"""
+    return f"{data_type}_{room_id}_{scraped_at.strftime(TIMESTAMP_FORMAT)}"
+
+class LegacyCompactor:
+    """
+    把 data/by_date 和 data/by_room 下每次导出一个的小xlsx文件
+    合并为 <output_dir>/<数据类型>/room_id=<房源>/month=<YYYY-MM>/data.<parquet|xlsx>
+    每行带 scraped_at 和 source_key 列，已合并过的导出会被跳过，可以重复运行
+    """
+
+    def __init__(self, base_dir='data', output_dir=None, data_types=COMPACT_TYPES,
+                 min_age_seconds=MIN_FILE_AGE, delete_sources=True):
+        self.logger = get_logger()
+        self.base_dir = base_dir
+        self.output_dir = output_dir or os.path.join(base_dir, 'compacted')
+        self.data_types = tuple(data_types)
+        self.min_age_seconds = min_age_seconds
+        self.delete_sources = delete_sources
+        self.file_format = 'parquet' if PARQUET_AVAILABLE else 'xlsx'
+        self.stats = {}
+
+    def partition_path(self, data_type, room_id, month):
+        """合并后的分区文件"""
+        return os.path.join(self.output_dir, data_type, f'room_id={room_id}', f'month={month}',
+                            f'data.{self.file_format}')
+
+    def scan(self):
+        """
+        扫描旧版导出文件，按 (数据类型, 房源, 月份) 分组
+        返回 {(data_type, room_id, month): {source_key: (抓取时间, [文件路径...])}}
+        """
+        now = time.time()
+        candidates = []
+        date_dir = os.path.join(self.base_dir, 'by_date')
+        room_dir = os.path.join(self.base_dir, 'by_room')
+        if os.path.isdir(date_dir):
+            candidates.extend((entry, None) for entry in os.scandir(date_dir) if entry.is_file())
+        if os.path.isdir(room_dir):
+            for room_entry in os.scandir(room_dir):
+                if room_entry.is_dir():
+                    candidates.extend((entry, room_entry.name) for entry in os.scandir(room_entry.path) if entry.is_file())
+
+        groups = {}
+        for entry, room_id in candidates:
+            parsed = parse_legacy_name(entry.name, room_id)
+            if not parsed or parsed[0] not in self.data_types:
+                continue
+            self.stats['files_scanned'] += 1
+            # 抓取程序可能正在写入的文件留到下次
+            if now - entry.stat().st_mtime < self.min_age_seconds:
+                self.stats['skipped_recent'] += 1
+                continue
+            data_type, room_id, scraped_at = parsed
+            group = groups.setdefault((data_type, room_id, scraped_at.strftime('%Y-%m')), {})
+            group.setdefault(source_key(data_type, room_id, scraped_at), (scraped_at, []))[1].append(entry.path)
+        return groups
+
+    def _read_partition(self, path):
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_excel(path)
+
+    def _write_partition(self, df, path):
+        """先写临时文件再替换，合并中断不会损坏已有分区"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        root, ext = os.path.splitext(path)
+        tmp_path = f'{root}.tmp{ext}'
+        if ext == '.parquet':
+            # xlsx读出的object列可能混有数字和文本，统一为字符串列
+            df = df.copy()
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].astype('string')
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_excel(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _read_source(self, paths):
+        """读取一次导出，by_date中的文件读取失败时尝试by_room中的副本"""
+        for path in paths:
+            try:
+                return pd.read_excel(path)
+            except Exception as e:
+                self.logger.warning(f"读取旧版导出文件失败 {path}: {str(e)}")
+        return None
+
+    def _remove_sources(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+                self.stats['files_removed'] += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                self.logger.warning(f"删除已合并的文件失败 {path}: {str(e)}")
+            # 房间目录清空后一并删除
+            parent = os.path.dirname(path)
+            if os.path.basename(os.path.dirname(parent)) == 'by_room':
+                try:
+                    os.rmdir(parent)
+                except OSError:
+                    pass
+
+    def compact_partition(self, data_type, room_id, month, sources, dry_run=False):
+        """把一组导出合并进对应的月份分区，返回新合并的导出数"""
+        path = self.partition_path(data_type, room_id, month)
+        existing = self._read_partition(path)
+        merged_keys = set(existing['source_key']) if 'source_key' in existing.columns else set()
+
+        frames = []
+        compacted_keys = []
+        for key, (scraped_at, paths) in sorted(sources.items()):
+            if key in merged_keys:
+                continue
+            df = self._read_source(paths)
+            if df is None:
+                self.stats['errors'] += 1
+                continue
+            df['room_id'] = room_id
+            df['scraped_at'] = pd.Timestamp(scraped_at)
+            df['source_key'] = key
+            frames.append(df)
+            compacted_keys.append(key)
+
+        if dry_run:
+            self.logger.info(f"[预览] {path}: 新合并 {len(compacted_keys)} 次导出, 已合并 {len(sources) - len(compacted_keys)} 次")
+            return len(compacted_keys)
+
+        if frames:
+            partition = pd.concat([existing, *frames], ignore_index=True).sort_values(['scraped_at'], kind='stable')
+            self._write_partition(partition, path)
+            self.stats['partitions_written'] += 1
+            self.stats['rows'] += sum(len(df) for df in frames)
+            self.logger.info(f"分区已更新: {path} (新合并 {len(frames)} 次导出, 共 {len(partition)} 行)")
+
+        # 只删除已经写入分区（本次或以前）的导出文件
+        if self.delete_sources:
+            done = merged_keys.union(compacted_keys)
+            self._remove_sources([p for key, (_, paths) in sources.items() if key in done for p in paths])
+        return len(compacted_keys)
+
+    def _acquire_lock(self):
+        """同一时间只允许一个合并任务运行"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        lock_path = os.path.join(self.output_dir, LOCK_FILE)
+        if os.path.exists(lock_path) and time.time() - os.path.getmtime(lock_path) > LOCK_STALE_SECONDS:
+            self.logger.warning(f"移除过期的合并锁文件: {lock_path}")
+            os.remove(lock_path)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return lock_path
+
+    def compact(self, dry_run=False):
+        """合并所有旧版导出文件，返回统计信息；已有合并任务在运行时返回None"""
+        self.stats = {
+            'files_scanned': 0, 'skipped_recent': 0, 'exports_compacted': 0, 'rows': 0,
+            'partitions_written': 0, 'files_removed': 0, 'errors': 0
+        }
+        lock_path = self._acquire_lock()
+        if not lock_path:
+            self.logger.error("另一个合并任务正在运行，本次退出")
+            return None
+
+        started = time.time()
+        try:
+            groups = self.scan()
+            self.logger.info(f"扫描到 {self.stats['files_scanned']} 个旧版导出文件, {len(groups)} 个待处理分区")
+            for (data_type, room_id, month), sources in sorted(groups.items()):
+                try:
+                    self.stats['exports_compacted'] += self.compact_partition(data_type, room_id, month, sources, dry_run)
+                except Exception as e:
+                    self.stats['errors'] += 1
+                    self.logger.error(f"合并分区 {data_type}/{room_id}/{month} 时发生错误: {str(e)}")
+        finally:
+            os.remove(lock_path)
+
+        self.logger.info(
+            f"合并完成 ({time.time() - started:.1f} 秒): 合并 {self.stats['exports_compacted']} 次导出/{self.stats['rows']} 行, "
+            f"写入 {self.stats['partitions_written']} 个分区, 删除 {self.stats['files_removed']} 个文件, "
+            f"跳过最近写入 {self.stats['skipped_recent']} 个, 错误 {self.stats['errors']} 个"
+        )
+        return self.stats
+
+    def read(self, data_type, room_id=None, month=None):
+        """读取合并后的数据"""
+        data_dir = os.path.join(self.output_dir, data_type)
+        if not os.path.isdir(data_dir):
+            return pd.DataFrame()
+        frames = []
+        for room_entry in sorted(os.scandir(data_dir), key=lambda e: e.name):
+            if room_id and room_entry.name != f'room_id={room_id}':
+                continue
+            for month_entry in sorted(os.scandir(room_entry.path), key=lambda e: e.name):
+                if month and month_entry.name != f'month={month}':
+                    continue
+                path = os.path.join(month_entry.path, f'data.{self.file_format}')
+                if os.path.exists(path):
+                    frames.append(self._read_partition(path))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把by_date/by_room下的旧版xlsx导出合并为按房源/月份的分区")
+    parser.add_argument('--base-dir', default='data', help="数据目录")
+    parser.add_argument('--output-dir', default=None, help="合并后的输出目录，默认<base-dir>/compacted")
+    parser.add_argument('--types', nargs='+', default=list(COMPACT_TYPES), help="要合并的数据类型")
+    parser.add_argument('--min-age', type=int, default=MIN_FILE_AGE, help="只合并修改时间早于N秒前的文件")
+    parser.add_argument('--keep-sources', action='store_true', help="合并后保留原文件")
+    parser.add_argument('--dry-run', action='store_true', help="只显示将要合并的内容")
+    args = parser.parse_args()
+
+    LegacyCompactor(
+        base_dir=args.base_dir,
+        output_dir=args.output_dir,
+        data_types=args.types,
+        min_age_seconds=args.min_age,
+        delete_sources=not args.keep_sources
+    ).compact(dry_run=args.dry_run)
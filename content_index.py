@@ -0,0 +1,107 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from logger_config import get_logger
+
+# 参与内容哈希的字段，页面结构相关的字段（class名、aria-label原文）和抓取时间不参与
+CONTENT_FIELDS = {
+    'calendar': ['date', 'status', 'is_blocked', 'min_nights'],
+    'price': ['check_in', 'check_out', 'nights', 'guests', 'min_nights',
+              'nightly_price', 'cleaning_fee', 'service_fee', 'taxes', 'total'],
+    'price_matrix': ['check_in', 'check_out', 'nights', 'guests', 'quote_status',
+                     'nightly_price', 'cleaning_fee', 'service_fee', 'taxes', 'total'],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content_heads (
+    data_type     TEXT NOT NULL,
+    room_id       TEXT NOT NULL,
+    content_hash  TEXT NOT NULL,
+    file          TEXT,
+    written_at    TEXT NOT NULL,
+    last_seen_at  TEXT NOT NULL,
+    seen_count    INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (data_type, room_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS content_seen (
+    data_type     TEXT NOT NULL,
+    room_id       TEXT NOT NULL,
+    seen_at       TEXT NOT NULL,
+    content_hash  TEXT NOT NULL,
+    PRIMARY KEY (data_type, room_id, seen_at)
+) WITHOUT ROWID;
+"""
+
+def _normalize_value(value):
+    """统一数值/空值的表示，避免 2 与 2.0、None 与 NaN 产生不同的哈希"""
+    if value is None or value != value:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if hasattr(value, 'item'):
+        return _normalize_value(value.item())
+    return value
+
+def content_hash(data_type, records):
+    """按数据类型取关键字段、排序后计算内容哈希，无法识别的类型返回None"""
+    fields = CONTENT_FIELDS.get(data_type)
+    if not fields:
+        return None
+    rows = sorted(
+        json.dumps([_normalize_value(record.get(field)) for field in fields], ensure_ascii=False, default=str)
+        for record in records
+    )
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+class ContentIndex:
+    """记录每个 (数据类型, 房源) 最近一次写入内容的哈希，内容未变化时只记录一次"看到" """
+
+    def __init__(self, db_path=os.path.join('data', 'content_index.db')):
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def head(self, data_type, room_id):
+        """最近一次写入的记录，返回dict或None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, file, written_at, last_seen_at, seen_count FROM content_heads "
+                "WHERE data_type = ? AND room_id = ?", (data_type, room_id)
+            ).fetchone()
+        if not row:
+            return None
+        return dict(zip(['content_hash', 'file', 'written_at', 'last_seen_at', 'seen_count'], row))
+
+    def mark_seen(self, data_type, room_id, digest, seen_at):
+        """内容未变化：只更新最近看到时间并记录一条看到标记"""
+        seen = seen_at.isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE content_heads SET last_seen_at = ?, seen_count = seen_count + 1 "
+                "WHERE data_type = ? AND room_id = ?", (seen, data_type, room_id)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_seen (data_type, room_id, seen_at, content_hash) VALUES (?, ?, ?, ?)",
+                (data_type, room_id, seen, digest)
+            )
+
+    def mark_written(self, data_type, room_id, digest, file, written_at):
+        """内容有变化并已写入"""
+        written = written_at.isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_heads "
+                "(data_type, room_id, content_hash, file, written_at, last_seen_at, seen_count) "
+                "VALUES (?, ?, ?, ?, ?, ?, 1)", (data_type, room_id, digest, file, written, written)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO content_seen (data_type, room_id, seen_at, content_hash) VALUES (?, ?, ?, ?)",
+                (data_type, room_id, written, digest)
+            )
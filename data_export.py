@@ -1,8 +1,13 @@
 import os
 import pandas as pd
 import traceback
+from contextlib import contextmanager
 from datetime import datetime
 from logger_config import get_logger
+from snapshot_store import SnapshotStore, PARQUET_AVAILABLE
+from export_writer import BackgroundExportWriter
+from history_db import HistoryDB
+from content_index import ContentIndex, content_hash
 
 class DataExporter:
     """数据导出管理类"""
@@ -17,6 +22,17 @@ class DataExporter:
         # 默认配置
         self.default_config = {
             'base_dir': 'data',
+            # 存储后端: parquet 按房源/抓取日期分区追加列式快照; excel 每次导出写一对xlsx文件
+            'backend': 'parquet',
+            'snapshot_dir': 'snapshots',
+            # 始终导出为Excel的数据类型（给人看的报表）
+            'excel_types': ['summary'],
+            # 嵌入式历史库文件名（位于base_dir下），None表示不写入
+            'history_db': 'history.db',
+            # 只保存在历史库中的数据类型：日历以历史库中的紧凑日历为准，不再写按天的快照行
+            'history_only_types': ['calendar'],
+            # 内容去重索引文件名（位于base_dir下），None表示每次都写入
+            'content_index': 'content_index.db',
             'subdirs': {
                 'date': 'by_date',
                 'room': 'by_room'
@@ -24,11 +40,13 @@ class DataExporter:
             'file_prefix': {
                 'calendar': 'calendar',
                 'price': 'price',
+                'price_matrix': 'price_matrix',
                 'summary': 'summary'
             },
             'required_fields': {
                 'calendar': ['date', 'status', 'is_blocked'],
-                'price': ['date', 'price', 'currency'],
+                'price': ['check_in', 'check_out', 'nightly_price'],
+                'price_matrix': ['check_in', 'nights', 'guests', 'quote_status'],
                 'summary': ['Room ID', 'URL']
             }
         }
@@ -44,6 +62,46 @@ class DataExporter:
         
         # 初始化目录结构
         self._init_directories()
+        
+        # 初始化列式快照存储，缺少pyarrow时退回Excel
+        self.backend = self.config['backend']
+        self.snapshot_store = None
+        if self.backend == 'parquet':
+            if PARQUET_AVAILABLE:
+                self.snapshot_store = SnapshotStore(os.path.join(self.config['base_dir'], self.config['snapshot_dir']))
+            else:
+                self.logger.warning("未安装pyarrow，数据导出退回Excel格式")
+                self.backend = 'excel'
+        
+        # 历史库：日历快照和价格报价的索引化存储
+        self.history_db = None
+        if self.config['history_db']:
+            self.history_db = HistoryDB(os.path.join(self.config['base_dir'], self.config['history_db']))
+        
+        # 内容去重：日历/价格内容与上次写入相同时跳过写入
+        self.content_index = None
+        if self.config['content_index']:
+            self.content_index = ContentIndex(os.path.join(self.config['base_dir'], self.config['content_index']))
+        
+        # 后台导出线程，启动后抓取数据只入队
+        self.writer = None
+
+    @contextmanager
+    def isolated(self, base_dir):
+        """
+        临时把导出文件、历史库和去重索引全部写到base_dir，退出后恢复原来的配置
+        用于基准测试等不应写入正式数据的场景
+        """
+        saved = dict(self.__dict__)
+        self.__init__({**self.config, 'base_dir': base_dir})
+        try:
+            yield self
+        finally:
+            self.stop_background_writer()
+            if self.history_db:
+                self.history_db.close()
+            self.__dict__.clear()
+            self.__dict__.update(saved)
 
     def _init_directories(self):
         """初始化目录结构"""
@@ -102,31 +160,28 @@ class DataExporter:
             self.logger.error(traceback.format_exc())
             return None
 
-    def _export_data(self, data, data_type, url=None, additional_info=None):
+    def _export_data(self, data, data_type, url=None, additional_info=None, scraped_at=None, batch=None):
         """
         通用数据导出函数
         data: 要导出的数据
         data_type: 数据类型
         url: 房源URL（可选）
         additional_info: 额外信息（可选）
+        scraped_at: 抓取时间（可选），后台写线程传入入队时的时间，默认为现在
+        batch: 后台写线程合并写入时的列表（可选），列式快照不在这里写文件，由_export_batch统一写入
         """
         try:
             # 生成时间戳
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            scraped_at = scraped_at or datetime.now()
+            timestamp = scraped_at.strftime("%Y%m%d_%H%M%S")
             
             # 验证和清理数据
             cleaned_data = self._validate_and_clean_data(data, data_type)
             if cleaned_data is None:
                 return None
                 
-            # 准备文件名
-            prefix = self.config['file_prefix'][data_type]
             room_id = self._get_room_id(url) if url else 'unknown'
             
-            # 构建文件路径
-            date_file = os.path.join(self.base_dirs['date'], f'{prefix}_{room_id}_{timestamp}.xlsx')
-            room_file = os.path.join(self.base_dirs['room'], room_id, f'{prefix}_{timestamp}.xlsx') if room_id != 'unknown' else None
-            
             # 创建DataFrame
             df = pd.DataFrame(cleaned_data)
             
@@ -135,6 +190,77 @@ class DataExporter:
                 for key, value in additional_info.items():
                     df[key] = value
             
+            # 内容与上次写入完全相同时，只记录看到时间
+            digest = None
+            if self.content_index and room_id != 'unknown':
+                digest = content_hash(data_type, cleaned_data)
+                head = self.content_index.head(data_type, room_id) if digest else None
+                if head and head['content_hash'] == digest:
+                    self.content_index.mark_seen(data_type, room_id, digest, scraped_at)
+                    if self.history_db:
+                        self.history_db.record_seen(data_type, room_id, cleaned_data, scraped_at, head['written_at'])
+                    self.logger.info(f"{data_type}数据与上次相同，跳过写入: {room_id}")
+                    return {
+                        'date_file': head['file'],
+                        'room_file': head['file'],
+                        'timestamp': timestamp,
+                        'room_id': room_id,
+                        'unchanged': True
+                    }
+            
+            # 同时写入历史库，供按房源/日期查询
+            history_written = False
+            if self.history_db and room_id != 'unknown':
+                try:
+                    self.history_db.record(data_type, room_id, cleaned_data, scraped_at)
+                    history_written = True
+                except Exception as e:
+                    self.logger.error(f"写入历史库时发生错误: {str(e)}")
+            
+            # 只保存在历史库中的类型写入成功后不再写文件；写入失败时仍写快照，不丢数据
+            if history_written and data_type in self.config['history_only_types']:
+                result = {
+                    'date_file': self.history_db.db_path,
+                    'room_file': self.history_db.db_path,
+                    'timestamp': timestamp,
+                    'room_id': room_id
+                }
+            # 抓取数据追加到列式快照，报表类数据仍写Excel
+            elif self.snapshot_store and data_type not in self.config['excel_types'] and room_id != 'unknown':
+                if batch is not None:
+                    # 文件路径在合并写入后填入，写入成功后再记录去重索引
+                    result = {'timestamp': timestamp, 'room_id': room_id}
+                    batch.append((room_id, df, scraped_at, digest, result))
+                    return result
+                snapshot_file = self.snapshot_store.append(data_type, room_id, df, scraped_at)
+                result = {
+                    'date_file': snapshot_file,
+                    'room_file': snapshot_file,
+                    'timestamp': timestamp,
+                    'room_id': room_id
+                }
+            else:
+                result = self._write_excel(df, data_type, room_id, timestamp)
+                
+            if result and digest:
+                self.content_index.mark_written(data_type, room_id, digest, result['date_file'], scraped_at)
+            return result
+            
+        except Exception as e:
+            self.logger.error(f"导出{data_type}数据时发生错误: {str(e)}")
+            self.logger.error(traceback.format_exc())
+            return None
+
+    def _write_excel(self, df, data_type, room_id, timestamp):
+        """把数据写入日期目录和房间目录下的xlsx文件"""
+        try:
+            # 准备文件名
+            prefix = self.config['file_prefix'][data_type]
+            
+            # 构建文件路径
+            date_file = os.path.join(self.base_dirs['date'], f'{prefix}_{room_id}_{timestamp}.xlsx')
+            room_file = os.path.join(self.base_dirs['room'], room_id, f'{prefix}_{timestamp}.xlsx') if room_id != 'unknown' else None
+            
             # 保存文件
             df.to_excel(date_file, index=False)
             self.logger.info(f"{data_type}数据已导出到日期目录: {date_file}")
@@ -156,13 +282,116 @@ class DataExporter:
             self.logger.error(traceback.format_exc())
             return None
 
+    def _export_batch(self, data_type, items):
+        """
+        后台写线程的批量导出：items为 [(url, 记录列表, 抓取时间), ...]
+        历史库和去重按房源处理，列式快照把这一批所有房源合并写入一个分片，返回与items对应的结果列表
+        """
+        batch = []
+        results = [
+            self._export_data(records, data_type, url, scraped_at=captured_at, batch=batch)
+            for url, records, captured_at in items
+        ]
+        if batch:
+            try:
+                path = self.snapshot_store.append_batch(
+                    data_type, [(room_id, df, scraped_at) for room_id, df, scraped_at, _, _ in batch]
+                )
+            except Exception as e:
+                self.logger.error(f"合并写入{data_type}快照时发生错误: {str(e)}")
+                self.logger.error(traceback.format_exc())
+                failed = {id(result) for *_, result in batch}
+                return [None if id(result) in failed else result for result in results]
+            for room_id, _, scraped_at, digest, result in batch:
+                result.update({'date_file': path, 'room_file': path})
+                if digest:
+                    self.content_index.mark_written(data_type, room_id, digest, path, scraped_at)
+        return results
+
+    def start_background_writer(self, **options):
+        """启动后台导出线程，之后的日历/价格导出只入队，由写线程按数据类型合并多个房源批量落盘"""
+        if self.writer is None:
+            self.writer = BackgroundExportWriter(self._export_batch, **options)
+            self.logger.info("后台导出线程已启动")
+        return self.writer
+
+    def stop_background_writer(self, timeout=None):
+        """停止后台导出线程，返回前写完所有已入队的数据"""
+        writer, self.writer = self.writer, None
+        if writer:
+            writer.close(timeout)
+
+    def queued_location(self, data_type, room_id):
+        """
+        后台写线程写入的位置：只保存在历史库中的类型为历史库文件，列式快照为多房源合并分片的目录，Excel为按房间目录
+        落盘的文件名要到写入时才确定，也可能因内容未变化而不写新文件，但一定在这个目录下
+        """
+        if self.history_db and data_type in self.config['history_only_types']:
+            return self.history_db.db_path
+        if self.snapshot_store and data_type not in self.config['excel_types']:
+            return self.snapshot_store.batch_dir(data_type)
+        return os.path.join(self.base_dirs['room'], room_id)
+
+    def _submit_or_export(self, data, data_type, url):
+        """后台导出线程运行时入队，否则同步导出"""
+        writer = self.writer
+        if writer is None:
+            return self._export_data(data, data_type, url)
+            
+        writer.submit(data_type, data, url)
+        room_id = self._get_room_id(url)
+        location = self.queued_location(data_type, room_id)
+        return {
+            'queued': True,
+            'date_file': location,
+            'room_file': location,
+            'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+            'room_id': room_id
+        }
+
     def export_calendar_data(self, calendar_data, url):
         """导出日历数据"""
-        return self._export_data(calendar_data, 'calendar', url)
+        return self._submit_or_export(calendar_data, 'calendar', url)
 
     def export_price_data(self, price_data, url):
         """导出价格数据"""
-        return self._export_data(price_data, 'price', url)
+        return self._submit_or_export(price_data, 'price', url)
+
+    def export_price_matrix(self, matrix_data, url):
+        """导出报价矩阵数据"""
+        return self._submit_or_export(matrix_data, 'price_matrix', url)
+
+    def export_excel_report(self, data_type, room_id=None, start_date=None, end_date=None):
+        """
+        按需从列式快照生成Excel报表，只保存在历史库中的类型由历史库展开
+        start_date/end_date: 抓取日期范围，YYYY-MM-DD
+        """
+        if self.history_db and data_type in self.config['history_only_types']:
+            return self._export_history_report(data_type, room_id, start_date, end_date)
+        if not self.snapshot_store:
+            self.logger.error("当前使用Excel后端，没有可用的列式快照")
+            return None
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        prefix = self.config['file_prefix'][data_type]
+        output_file = os.path.join(self.config['base_dir'], 'reports', f'{prefix}_{room_id or "all"}_{timestamp}.xlsx')
+        return self.snapshot_store.export_excel(data_type, output_file, room_id, start_date, end_date)
+
+    def _export_history_report(self, data_type, room_id=None, start_date=None, end_date=None):
+        """由历史库中的紧凑日历展开为按天的Excel报表"""
+        room_ids = [room_id] if room_id else self.history_db.calendar_rooms()
+        frames = [self.history_db.calendar_history(rid, start_date, end_date) for rid in room_ids]
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            self.logger.warning(f"历史库中没有可导出的{data_type}数据")
+            return None
+        df = pd.concat(frames, ignore_index=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        prefix = self.config['file_prefix'][data_type]
+        output_file = os.path.join(self.config['base_dir'], 'reports', f'{prefix}_{room_id or "all"}_{timestamp}.xlsx')
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        df.to_excel(output_file, index=False)
+        self.logger.info(f"{data_type}报表已导出: {output_file} ({len(df)} 行)")
+        return output_file
 
     def export_summary_data(self, summary_data):
         """导出汇总数据"""
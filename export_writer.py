@@ -0,0 +1,125 @@
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
+from logger_config import get_logger
+
+# 队列中的结束标记
+_STOP = object()
+
+class BackgroundExportWriter:
+    """
+    后台导出线程
+    抓取线程只把数据放入有界队列，写线程每次落盘时把同一数据类型的所有房源合并为一批写入，
+    浏览器线程不再等待pandas序列化和磁盘IO
+    """
+
+    def __init__(self, export_func, max_queue_size=200, batch_size=20, flush_interval=5.0):
+        """
+        export_func: 批量导出函数 export_func(data_type, items)，items为 [(url, 记录列表, 抓取时间), ...]，
+                     返回与items一一对应的导出结果列表，失败的为None
+        max_queue_size: 队列上限，队列满时submit会阻塞，限制内存占用
+        batch_size: 累积多少次提交后立即写盘
+        flush_interval: 最长多少秒写一次盘
+        """
+        self.export_func = export_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = get_logger()
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = {}  # {data_type: [(url, 记录列表, 抓取时间), ...]}
+        self._pending_count = 0
+        self._last_flush = time.time()
+        self._closed = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'submitted': 0, 'batches': 0, 'records': 0, 'failed': 0,
+            'max_queue_depth': 0, 'blocked_seconds': 0.0
+        }
+
+        self._thread = threading.Thread(target=self._run, name='export-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, data_type, data, url):
+        """提交一份待导出的数据，队列满时阻塞等待写线程"""
+        if self._closed:
+            raise RuntimeError("后台导出线程已关闭")
+
+        records = data if isinstance(data, list) else [data]
+        # 抓取时间在入队时确定，落盘时间晚于抓取时间
+        captured_at = datetime.now()
+
+        started = time.time()
+        self._queue.put((data_type, (url, [record for record in records if record], captured_at)))
+        with self._lock:
+            self.stats['submitted'] += 1
+            self.stats['blocked_seconds'] += time.time() - started
+            self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._queue.qsize())
+        return True
+
+    def _run(self):
+        while True:
+            timeout = max(self.flush_interval - (time.time() - self._last_flush), 0.1)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush()
+                continue
+
+            if item is _STOP:
+                self._flush()
+                self._queue.task_done()
+                return
+
+            data_type, submission = item
+            self._pending.setdefault(data_type, []).append(submission)
+            self._pending_count += 1
+            self._queue.task_done()
+
+            if self._pending_count >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        """把累积的数据按数据类型各写一批，一批包含多个房源"""
+        pending, self._pending = self._pending, {}
+        self._pending_count = 0
+        self._last_flush = time.time()
+
+        for data_type, items in pending.items():
+            try:
+                results = self.export_func(data_type, items)
+            except Exception as e:
+                self.logger.error(f"后台导出{data_type}数据时发生错误: {str(e)}")
+                results = [None] * len(items)
+            with self._lock:
+                self.stats['batches'] += 1
+                for (url, records, _), result in zip(items, results):
+                    if result:
+                        self.stats['records'] += len(records)
+                    else:
+                        self.stats['failed'] += 1
+                        self.logger.error(f"后台导出{data_type}数据失败: {url}")
+
+    def close(self, timeout=None):
+        """停止接收新数据，写完队列中剩余的数据后返回"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.error("后台导出线程未能在超时时间内写完剩余数据")
+        self.log_stats()
+
+    def log_stats(self):
+        """输出后台导出统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        self.logger.info(
+            f"后台导出统计: 提交 {stats['submitted']} 次, 写入 {stats['batches']} 批/{stats['records']} 条, "
+            f"失败 {stats['failed']} 次提交, 队列最大深度 {stats['max_queue_depth']}, "
+            f"提交阻塞 {stats['blocked_seconds']:.2f} 秒"
+        )
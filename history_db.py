@@ -0,0 +1,482 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from logger_config import get_logger
+from calendar_bitmap import CalendarBitmap, STATUS_NAMES, STATUS_BLOCKED
+from price_parser import PRICE_TEXT_FIELDS, add_price_amounts, amount_column
+
+PRICE_QUOTES_TABLE = """
+CREATE TABLE IF NOT EXISTS price_quotes (
+    room_id       TEXT NOT NULL,
+    check_in      TEXT NOT NULL,
+    check_out     TEXT NOT NULL,
+    guests        INTEGER NOT NULL,
+    scraped_at    TEXT NOT NULL,
+    nights        INTEGER,
+    min_nights    INTEGER,
+    nightly_price TEXT,
+    cleaning_fee  TEXT,
+    service_fee   TEXT,
+    taxes         TEXT,
+    total         TEXT,
+    nightly_price_amount REAL,
+    cleaning_fee_amount  REAL,
+    service_fee_amount   REAL,
+    taxes_amount         REAL,
+    total_amount         REAL,
+    currency      TEXT,
+    -- 内容未变化的重新报价只更新这个时间，不重复写入报价行
+    last_seen_at  TEXT,
+    -- 写入来源（price / price_matrix），同一秒内两种导出不会互相覆盖
+    source        TEXT NOT NULL DEFAULT 'price',
+    PRIMARY KEY (room_id, check_in, scraped_at, check_out, guests, source)
+) WITHOUT ROWID;
+"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS calendar_runs (
+    room_id     TEXT NOT NULL,
+    scraped_at  TEXT NOT NULL,
+    days        INTEGER,
+    -- 内容未变化时只记录一次抓取，data_scraped_at指向实际保存日历行的那次抓取
+    data_scraped_at TEXT NOT NULL,
+    PRIMARY KEY (room_id, scraped_at)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS calendar_latest (
+    room_id     TEXT NOT NULL,
+    stay_date   TEXT NOT NULL,
+    scraped_at  TEXT NOT NULL,
+    status      TEXT,
+    is_blocked  INTEGER,
+    min_nights  INTEGER,
+    PRIMARY KEY (stay_date, room_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS calendar_bitmaps (
+    room_id     TEXT NOT NULL,
+    scraped_at  TEXT NOT NULL,
+    bitmap      BLOB NOT NULL,
+    PRIMARY KEY (room_id, scraped_at)
+) WITHOUT ROWID;
+
+{PRICE_QUOTES_TABLE}
+
+CREATE INDEX IF NOT EXISTS idx_price_quotes_check_in ON price_quotes (check_in, room_id, scraped_at);
+"""
+
+# 价格报价表中保存的字段（除主键外）
+PRICE_FIELDS = ['nights', 'min_nights', 'nightly_price', 'cleaning_fee', 'service_fee', 'taxes', 'total']
+PRICE_AMOUNT_FIELDS = [amount_column(field) for field in PRICE_TEXT_FIELDS] + ['currency']
+
+# 旧版本数据库中缺少的列，打开时自动补齐
+MIGRATIONS = {
+    'calendar_runs': [('data_scraped_at', 'TEXT')],
+    'price_quotes': [(column, 'TEXT' if column == 'currency' else 'REAL') for column in PRICE_AMOUNT_FIELDS]
+                    + [('last_seen_at', 'TEXT')],
+}
+
+def _priced_records(data_type, records):
+    """报价矩阵中未成功报价的组合（failed / unavailable / below_min_stay 等）不写入报价表"""
+    if data_type != 'price_matrix':
+        return records
+    return [record for record in records if record.get('quote_status') == 'ok']
+
+def to_iso_date(date_str):
+    """把日历中的 dd/mm/YYYY 转换为 YYYY-MM-DD，已是ISO格式时原样返回"""
+    if not date_str:
+        return None
+    if len(date_str) == 10 and date_str[4] == '-':
+        return date_str
+    return datetime.strptime(date_str, '%d/%m/%Y').strftime('%Y-%m-%d')
+
+# 日历历史查询返回的列
+CALENDAR_COLUMNS = ['room_id', 'stay_date', 'scraped_at', 'status', 'is_blocked', 'min_nights']
+
+def _bitmap_frame(room_id, scraped_at, bitmap):
+    """把一次紧凑日历展开为每天一行的DataFrame"""
+    codes = bitmap.status.astype(int)
+    return pd.DataFrame({
+        'room_id': room_id,
+        'stay_date': pd.date_range(bitmap.start_date, periods=len(bitmap), freq='D').strftime('%Y-%m-%d'),
+        'scraped_at': scraped_at,
+        'status': [STATUS_NAMES[code] for code in codes],
+        'is_blocked': (codes == STATUS_BLOCKED).astype(int),
+        'min_nights': pd.Series(bitmap.min_nights, dtype='Int64').where(bitmap.min_nights > 0).array,
+    }, columns=CALENDAR_COLUMNS)
+
+class HistoryDB:
+    """
+    嵌入式SQLite历史库：日历快照和价格报价
+    日历历史以 calendar_bitmaps 为准，每个房源只在日历变化时保存一份紧凑快照，按天的历史由它展开；
+    calendar_runs 记录每次抓取，calendar_latest 保存每个房源每天的最新状态，用于按天查看整个市场
+    """
+
+    def __init__(self, db_path=os.path.join('data', 'history.db')):
+        self.db_path = db_path
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """为旧数据库补齐新增的列，并把旧的按天日历快照转换为紧凑日历"""
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    self.logger.info(f"历史库 {table} 表新增列: {column}")
+        # 旧的抓取记录都保存了自己的日历行，指向自身
+        self._conn.execute("UPDATE calendar_runs SET data_scraped_at = scraped_at WHERE data_scraped_at IS NULL")
+        self._migrate_calendar_snapshots()
+        self._migrate_price_quotes_source()
+
+    def _migrate_price_quotes_source(self):
+        """旧版本的 price_quotes 主键不含 source，重建表并把旧报价记为 price"""
+        existing = [row[1] for row in self._conn.execute("PRAGMA table_info(price_quotes)")]
+        if 'source' in existing:
+            return
+        columns = ', '.join(existing)
+        self._conn.execute("ALTER TABLE price_quotes RENAME TO price_quotes_old")
+        self._conn.execute("DROP INDEX IF EXISTS idx_price_quotes_check_in")
+        self._conn.execute(PRICE_QUOTES_TABLE)
+        self._conn.execute(
+            f"INSERT INTO price_quotes ({columns}, source) SELECT {columns}, 'price' FROM price_quotes_old"
+        )
+        self._conn.execute("DROP TABLE price_quotes_old")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_price_quotes_check_in ON price_quotes (check_in, room_id, scraped_at)"
+        )
+        self.logger.info("历史库 price_quotes 表新增列: source（主键）")
+
+    def _migrate_calendar_snapshots(self):
+        """旧版本的 calendar_snapshots（每房源每天每次抓取一行）转换为 calendar_bitmaps 后删除"""
+        exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'calendar_snapshots'"
+        ).fetchone()
+        if not exists:
+            return
+        snapshots = pd.read_sql_query(
+            "SELECT room_id, stay_date, scraped_at, status, min_nights FROM calendar_snapshots "
+            "ORDER BY room_id, scraped_at", self._conn
+        )
+        snapshots['date'] = pd.to_datetime(snapshots['stay_date']).dt.strftime('%d/%m/%Y')
+        snapshots['min_nights'] = snapshots['min_nights'].astype(object).where(snapshots['min_nights'].notna(), None)
+        converted = 0
+        for room_id, room_rows in snapshots.groupby('room_id', sort=False):
+            # 已有紧凑日历之后的抓取在写入时已经保存过，只转换更早的
+            first_bitmap = self._conn.execute(
+                "SELECT MIN(scraped_at) FROM calendar_bitmaps WHERE room_id = ?", (room_id,)
+            ).fetchone()[0]
+            previous = None
+            for scraped_at, rows in room_rows.groupby('scraped_at', sort=True):
+                if first_bitmap and scraped_at >= first_bitmap:
+                    break
+                bitmap = CalendarBitmap.from_calendar_data(rows[['date', 'status', 'min_nights']].to_dict('records'))
+                if bitmap == previous:
+                    continue
+                self._conn.execute(
+                    "INSERT INTO calendar_bitmaps (room_id, scraped_at, bitmap) VALUES (?, ?, ?)",
+                    (room_id, scraped_at, bitmap.to_bytes())
+                )
+                previous = bitmap
+                converted += 1
+        self._conn.execute("DROP TABLE calendar_snapshots")
+        self.logger.info(f"历史库: {len(snapshots)} 行按天日历快照已转换为 {converted} 份紧凑日历")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    def record(self, data_type, room_id, records, scraped_at):
+        """DataExporter的写入入口，按数据类型分发"""
+        if data_type == 'calendar':
+            return self.insert_calendar(room_id, records, scraped_at)
+        if data_type in ('price', 'price_matrix'):
+            return self.insert_prices(room_id, _priced_records(data_type, records), scraped_at, data_type)
+        return 0
+
+    def record_seen(self, data_type, room_id, records, seen_at, data_scraped_at):
+        """DataExporter在内容未变化、跳过写入时调用，只记录这次看到的时间"""
+        if data_type == 'calendar':
+            return self.mark_calendar_seen(room_id, seen_at, data_scraped_at)
+        if data_type in ('price', 'price_matrix'):
+            return self.mark_quotes_seen(room_id, _priced_records(data_type, records), seen_at, data_type)
+        return 0
+
+    def insert_calendar(self, room_id, calendar_data, scraped_at):
+        """写入一次日历抓取：更新每天的最新状态，日历有变化时保存紧凑快照，返回天数"""
+        scraped = scraped_at.isoformat(timespec='seconds')
+        rows = []
+        for date_info in calendar_data:
+            try:
+                stay_date = to_iso_date(date_info['date'])
+            except (KeyError, ValueError):
+                continue
+            rows.append((
+                room_id, stay_date, scraped, date_info.get('status'),
+                int(bool(date_info.get('is_blocked'))), date_info.get('min_nights')
+            ))
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calendar_runs (room_id, scraped_at, days, data_scraped_at) "
+                "VALUES (?, ?, ?, ?)",
+                (room_id, scraped, len(rows), scraped)
+            )
+            self._conn.executemany(
+                "INSERT INTO calendar_latest (room_id, stay_date, scraped_at, status, is_blocked, min_nights) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (stay_date, room_id) DO UPDATE SET scraped_at = excluded.scraped_at, "
+                "status = excluded.status, is_blocked = excluded.is_blocked, min_nights = excluded.min_nights "
+                "WHERE excluded.scraped_at >= calendar_latest.scraped_at",
+                rows
+            )
+        self.insert_calendar_bitmap(room_id, CalendarBitmap.from_calendar_data(calendar_data), scraped_at)
+        return len(rows)
+
+    def mark_calendar_seen(self, room_id, scraped_at, data_scraped_at):
+        """日历内容未变化：只记录这次抓取，指向之前保存的日历行"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calendar_runs (room_id, scraped_at, days, data_scraped_at) "
+                "SELECT room_id, ?, days, data_scraped_at FROM calendar_runs "
+                "WHERE room_id = ? AND data_scraped_at = ? LIMIT 1",
+                (scraped_at.isoformat(timespec='seconds'), room_id, data_scraped_at)
+            )
+
+    def mark_quotes_seen(self, room_id, price_data, seen_at, source='price'):
+        """报价内容未变化：更新这些报价最近一行的看到时间，增量模式按它判断报价是否过期，返回更新行数"""
+        seen = seen_at.isoformat(timespec='seconds')
+        keys = [
+            (room_id, to_iso_date(price_info['check_in']), to_iso_date(price_info['check_out']),
+             int(price_info.get('guests') or 0))
+            for price_info in price_data
+            if price_info.get('check_in') and price_info.get('check_out')
+        ]
+        with self._lock, self._conn:
+            return sum(
+                self._conn.execute(
+                    "UPDATE price_quotes SET last_seen_at = ? "
+                    "WHERE room_id = ? AND check_in = ? AND check_out = ? AND guests = ? AND source = ? "
+                    "AND scraped_at = (SELECT MAX(scraped_at) FROM price_quotes "
+                    "                  WHERE room_id = ? AND check_in = ? AND check_out = ? AND guests = ? "
+                    "                    AND source = ?)",
+                    (seen, *key, source, *key, source)
+                ).rowcount
+                for key in keys
+            )
+
+    def insert_calendar_bitmap(self, room_id, bitmap, scraped_at):
+        """保存紧凑日历，与上一次相同时不写入，返回是否写入"""
+        previous = self.latest_calendar_bitmap(room_id)
+        if previous is not None and previous[1] == bitmap:
+            return False
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO calendar_bitmaps (room_id, scraped_at, bitmap) VALUES (?, ?, ?)",
+                (room_id, scraped_at.isoformat(timespec='seconds'), bitmap.to_bytes())
+            )
+        return True
+
+    def insert_prices(self, room_id, price_data, scraped_at, source='price'):
+        """写入价格报价，source为写入来源（price / price_matrix），返回写入行数"""
+        scraped = scraped_at.isoformat(timespec='seconds')
+        rows = []
+        for price_info in price_data:
+            if not price_info.get('check_in') or not price_info.get('check_out'):
+                continue
+            # 已导出过的缓存报价在原来抓取时已经写入过，不按这次的时间重复写入
+            if price_info.get('exported'):
+                continue
+            # 尚未导出的缓存报价（崩溃前获取的）按实际抓取时间写入
+            quoted = price_info['quoted_at'] if price_info.get('from_cache') else scraped
+            # 旧数据没有数值列时在写入前补充
+            if 'currency' not in price_info:
+                price_info = add_price_amounts(dict(price_info))
+            rows.append((
+                room_id, to_iso_date(price_info['check_in']), to_iso_date(price_info['check_out']),
+                int(price_info.get('guests') or 0), quoted,
+                *[price_info.get(field) for field in PRICE_FIELDS + PRICE_AMOUNT_FIELDS], scraped, source
+            ))
+
+        columns = (['room_id', 'check_in', 'check_out', 'guests', 'scraped_at'] + PRICE_FIELDS + PRICE_AMOUNT_FIELDS
+                   + ['last_seen_at', 'source'])
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO price_quotes ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                rows
+            )
+        return len(rows)
+
+    # ---- 查询接口 ----
+
+    def latest_scraped_at(self, room_id):
+        """房源最近一次日历快照的时间，没有返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(scraped_at) FROM calendar_runs WHERE room_id = ?", (room_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def latest_calendar_bitmap(self, room_id):
+        """最近一次变化的紧凑日历，返回(scraped_at, CalendarBitmap)或None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT scraped_at, bitmap FROM calendar_bitmaps WHERE room_id = ? "
+                "ORDER BY scraped_at DESC LIMIT 1", (room_id,)
+            ).fetchone()
+        return (row[0], CalendarBitmap.from_bytes(row[1])) if row else None
+
+    def calendar_bitmap_history(self, room_id, since=None):
+        """房源日历每次变化后的紧凑快照列表 [(scraped_at, CalendarBitmap)]"""
+        sql = "SELECT scraped_at, bitmap FROM calendar_bitmaps WHERE room_id = ?"
+        params = [room_id]
+        if since:
+            sql += " AND scraped_at >= ?"
+            params.append(since)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY scraped_at", params).fetchall()
+        return [(scraped_at, CalendarBitmap.from_bytes(blob)) for scraped_at, blob in rows]
+
+    def calendar_history(self, room_id, start_date=None, end_date=None):
+        """
+        由紧凑日历展开的按天历史，每次日历变化一组行
+        start_date/end_date: 抓取日期范围，YYYY-MM-DD，含两端
+        """
+        sql = "SELECT scraped_at, bitmap FROM calendar_bitmaps WHERE room_id = ?"
+        params = [room_id]
+        if start_date:
+            sql += " AND scraped_at >= ?"
+            params.append(start_date)
+        if end_date:
+            sql += " AND scraped_at < ?"
+            params.append((datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY scraped_at", params).fetchall()
+        frames = [_bitmap_frame(room_id, scraped_at, CalendarBitmap.from_bytes(blob)) for scraped_at, blob in rows]
+        if not frames:
+            return pd.DataFrame(columns=CALENDAR_COLUMNS)
+        return pd.concat(frames, ignore_index=True)
+
+    def calendar_rooms(self):
+        """有日历历史的所有房源"""
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT room_id FROM calendar_bitmaps ORDER BY room_id").fetchall()
+        return [row[0] for row in rows]
+
+    def latest_snapshot(self, room_id):
+        """房源最近一次的完整日历（由最近的紧凑日历展开）"""
+        latest = self.latest_calendar_bitmap(room_id)
+        if latest is None:
+            return pd.DataFrame(columns=CALENDAR_COLUMNS)
+        return _bitmap_frame(room_id, *latest)
+
+    def date_history(self, room_id, stay_date):
+        """某房源某一天在历次日历变化中的状态，每份紧凑日历只解码这一天"""
+        day = datetime.strptime(to_iso_date(stay_date), '%Y-%m-%d').date()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT scraped_at, bitmap FROM calendar_bitmaps WHERE room_id = ? ORDER BY scraped_at", (room_id,)
+            ).fetchall()
+        days = []
+        for scraped_at, blob in rows:
+            decoded = CalendarBitmap.day_from_bytes(blob, day)
+            if decoded is not None:
+                code, min_nights = decoded
+                days.append((scraped_at, STATUS_NAMES[code], int(code == STATUS_BLOCKED), min_nights or None))
+        history = pd.DataFrame(days, columns=['scraped_at', 'status', 'is_blocked', 'min_nights'])
+        history['min_nights'] = history['min_nights'].astype('Int64')
+        return history
+
+    def price_history(self, room_id, check_in, guests=None):
+        """某房源某个入住日期的历次报价"""
+        sql = "SELECT * FROM price_quotes WHERE room_id = ? AND check_in = ?"
+        params = [room_id, to_iso_date(check_in)]
+        if guests is not None:
+            sql += " AND guests = ?"
+            params.append(guests)
+        return self._query(sql + " ORDER BY scraped_at", params)
+
+    def latest_quotes(self, room_id, guests=None):
+        """房源每个 (入住, 退房, 人数) 组合最近一次取到价格的报价"""
+        sql = ("SELECT q.* FROM price_quotes q WHERE q.room_id = ? AND q.nightly_price_amount IS NOT NULL "
+               "AND q.scraped_at = (SELECT MAX(scraped_at) FROM price_quotes "
+               "                    WHERE room_id = q.room_id AND check_in = q.check_in "
+               "                      AND check_out = q.check_out AND guests = q.guests "
+               "                      AND nightly_price_amount IS NOT NULL)")
+        params = [room_id]
+        if guests is not None:
+            sql += " AND q.guests = ?"
+            params.append(guests)
+        return self._query(sql + " ORDER BY q.check_in, q.check_out", params)
+
+    def price_trend(self, room_id, days=90):
+        """房源最近N天抓取到的所有报价"""
+        since = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        return self._query(
+            "SELECT * FROM price_quotes WHERE room_id = ? AND scraped_at >= ? ORDER BY check_in, scraped_at",
+            (room_id, since)
+        )
+
+    def room_activity(self, days=30, today=None):
+        """
+        每个房源的调度依据（一次分组查询全部房源）:
+        last_scraped_at 最近日历抓取时间, calendar_changes 最近N天日历变化次数（不含首次入库的日历）,
+        price_mean 最近N天每晚价格的均值, price_std 同一住宿组合（入住/退房/人数）在不同抓取时间之间
+        每晚价格标准差的平均值（衡量价格随时间的波动，而不是不同日期之间的季节差异）,
+        nearest_open_date 今天起最近的可预订日期
+        """
+        since = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        today = today or datetime.now().strftime('%Y-%m-%d')
+        queries = [
+            ("SELECT room_id, MAX(scraped_at) AS last_scraped_at FROM calendar_runs GROUP BY room_id", ()),
+            ("SELECT b.room_id, COUNT(*) AS calendar_changes FROM calendar_bitmaps b "
+             "WHERE b.scraped_at >= ? AND b.scraped_at > "
+             "  (SELECT MIN(scraped_at) FROM calendar_bitmaps WHERE room_id = b.room_id) "
+             "GROUP BY b.room_id", (since,)),
+            ("SELECT room_id, AVG(nightly_price_amount) AS price_mean FROM price_quotes "
+             "WHERE scraped_at >= ? AND nightly_price_amount IS NOT NULL GROUP BY room_id", (since,)),
+            ("SELECT room_id, MIN(stay_date) AS nearest_open_date FROM calendar_latest "
+             "WHERE status = '可预订' AND stay_date >= ? GROUP BY room_id", (today,)),
+        ]
+        activity = pd.DataFrame(columns=['room_id']).set_index('room_id')
+        for sql, params in queries:
+            activity = activity.join(self._query(sql, params).set_index('room_id'), how='outer')
+        
+        # 同一住宿组合至少报价两次才能看出随时间的波动
+        stays = self._query(
+            "SELECT room_id, AVG(nightly_price_amount) AS mean, "
+            "AVG(nightly_price_amount * nightly_price_amount) AS square_mean FROM price_quotes "
+            "WHERE scraped_at >= ? AND nightly_price_amount IS NOT NULL "
+            "GROUP BY room_id, check_in, check_out, guests HAVING COUNT(*) > 1", (since,)
+        )
+        stays['price_std'] = (stays['square_mean'] - stays['mean'] ** 2).clip(lower=0) ** 0.5
+        return activity.join(stays.groupby('room_id')['price_std'].mean(), how='left')
+
+    def market_view(self, stay_date):
+        """某一天所有房源的最新状态，以及该日入住的最新报价"""
+        return self._query(
+            "SELECT c.room_id, c.status, c.is_blocked, c.min_nights, c.scraped_at, "
+            "       p.nights, p.guests, p.nightly_price, p.total, "
+            "       p.nightly_price_amount, p.total_amount, p.currency, p.scraped_at AS quoted_at "
+            "FROM calendar_latest c "
+            "LEFT JOIN price_quotes p ON p.check_in = c.stay_date AND p.room_id = c.room_id "
+            "  AND p.scraped_at = (SELECT MAX(scraped_at) FROM price_quotes "
+            "                      WHERE check_in = c.stay_date AND room_id = c.room_id) "
+            "WHERE c.stay_date = ? ORDER BY c.room_id",
+            (to_iso_date(stay_date),)
+        )
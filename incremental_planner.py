@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from logger_config import get_logger
+from stay_planner import DATE_FORMAT, CHECKIN_STATUSES, DEFAULT_GUESTS
+from price_parser import PRICE_TEXT_FIELDS, amount_column
+
+# 报价超过这个小时数后即使日历未变化也重新报价
+QUOTE_TTL_HOURS = 72
+
+# 沿用旧报价时从历史库带出的字段
+CARRIED_FIELDS = PRICE_TEXT_FIELDS + [amount_column(field) for field in PRICE_TEXT_FIELDS] + ['currency']
+
+def _iso_to_display(iso_date):
+    return datetime.strptime(iso_date, '%Y-%m-%d').strftime(DATE_FORMAT)
+
+def load_previous_state(history_db, room_id, guests=DEFAULT_GUESTS):
+    """
+    在抓取新日历之前读取房源上一次的日历和报价
+    返回 {'calendar': {日期: (状态, 最小入住天数)}, 'scraped_at': 日历时间, 'quotes': {(入住, 退房): 报价行}}
+    没有历史时返回None
+    """
+    logger = get_logger()
+    if history_db is None:
+        return None
+    try:
+        latest = history_db.latest_calendar_bitmap(room_id)
+        if latest is None:
+            return None
+        scraped_at, bitmap = latest
+        calendar = {
+            row['date']: (row['status'], row['min_nights'])
+            for row in bitmap.to_calendar_data()
+        }
+        rows = history_db.latest_quotes(room_id, guests)
+        rows = rows.astype(object).where(rows.notna(), None)
+        quotes = {
+            (_iso_to_display(row['check_in']), _iso_to_display(row['check_out'])): row
+            for row in rows.to_dict('records')
+        }
+        logger.info(f"房源 {room_id} 上次日历: {scraped_at}, {len(calendar)} 天, 已有报价 {len(quotes)} 个")
+        return {'calendar': calendar, 'scraped_at': scraped_at, 'quotes': quotes}
+    except Exception as e:
+        logger.error(f"读取房源 {room_id} 的历史状态失败: {str(e)}")
+        return None
+
+def _stay_dates(quote):
+    """报价涉及的日期：住宿期间每晚"""
+    check_in = datetime.strptime(quote['check_in'], DATE_FORMAT)
+    return [(check_in + timedelta(days=offset)).strftime(DATE_FORMAT) for offset in range(quote['nights'])]
+
+def _find_previous_quote(previous_quotes, quote):
+    """查找同一入住/退房组合的旧报价；按最小入住天数报价时，入住日相同且当时按最小天数报价的也可以沿用"""
+    row = previous_quotes.get((quote['check_in'], quote['check_out']))
+    if row is not None or quote['nights'] != (quote['min_nights'] or 1):
+        return row
+    for (check_in, _), candidate in previous_quotes.items():
+        if check_in == quote['check_in'] and candidate.get('nights') == candidate.get('min_nights'):
+            return candidate
+    return None
+
+def _quoted_at(row):
+    """报价最近一次确认的时间：内容未变化的重新报价只更新last_seen_at"""
+    return row.get('last_seen_at') or row['scraped_at']
+
+def _to_int(value):
+    return int(value) if value is not None else None
+
+def _carried_quote(row):
+    """由历史报价行构建与get_price_info格式一致的价格信息"""
+    price_info = {
+        'check_in': _iso_to_display(row['check_in']),
+        'check_out': _iso_to_display(row['check_out']),
+        'min_nights': _to_int(row.get('min_nights')),
+        'nights': _to_int(row.get('nights')),
+        'guests': _to_int(row.get('guests')),
+    }
+    price_info.update({field: row.get(field) for field in CARRIED_FIELDS})
+    price_info.update({'quoted_at': _quoted_at(row), 'carried_forward': True})
+    return price_info
+
+def select_requotes(quotes, calendar_data, previous, ttl_hours=None, now=None):
+    """
+    增量模式：把报价计划分为需要重新报价的和可以沿用旧报价的
+    需要重新报价: 没有旧报价(new)、住宿期间任何一天的状态或最小入住天数有变化(changed)、旧报价过期(stale)
+    返回 (需要报价的计划列表（带reason）, 沿用的价格信息列表, 统计)
+    """
+    ttl = timedelta(hours=QUOTE_TTL_HOURS if ttl_hours is None else ttl_hours)
+    now = now or datetime.now()
+    fresh_calendar = {
+        date_info['date']: (date_info.get('status'), date_info.get('min_nights') or None)
+        for date_info in calendar_data
+    }
+    stats = {'planned': len(quotes), 'new': 0, 'changed': 0, 'stale': 0, 'carried': 0}
+    to_quote, carried = [], []
+
+    for quote in quotes:
+        row = _find_previous_quote(previous['quotes'], quote)
+        if row is None:
+            reason = 'new'
+        elif any(fresh_calendar.get(day) != previous['calendar'].get(day) for day in _stay_dates(quote)):
+            reason = 'changed'
+        elif now - datetime.fromisoformat(_quoted_at(row)) > ttl:
+            reason = 'stale'
+        else:
+            reason = None
+
+        if reason:
+            stats[reason] += 1
+            to_quote.append(dict(quote, reason=reason))
+        else:
+            stats['carried'] += 1
+            carried.append(_carried_quote(row))
+
+    # 新开放的入住日期（上次不可入住）一定会因为 new 或 changed 重新报价
+    stats['opened'] = sum(
+        1 for day, (status, _) in fresh_calendar.items()
+        if status in CHECKIN_STATUSES and (previous['calendar'].get(day) or (None,))[0] not in CHECKIN_STATUSES
+    )
+    return to_quote, carried, stats
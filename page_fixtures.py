@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from logger_config import get_logger
+
+# 页面快照阶段名
+CALENDAR_STAGE = 'calendar_open'
+
+_SCRIPT_PATTERN = re.compile(r'<script\b[^>]*>.*?</script>', re.IGNORECASE | re.DOTALL)
+
+def price_stage(check_in, check_out, adults):
+    """价格页面快照的阶段名，与带日期URL的查询参数一一对应（日期格式YYYY-MM-DD）"""
+    return f"price_{check_in}_{check_out}_{adults}"
+
+class PageRecorder:
+    """在真实运行中保存页面快照（JS执行后的DOM）"""
+
+    def __init__(self, base_dir='fixtures'):
+        self.base_dir = base_dir
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def _manifest_path(self, room_id):
+        return os.path.join(self.base_dir, room_id, 'manifest.json')
+
+    def record(self, driver, url, stage, **extra):
+        """保存当前页面的DOM快照，返回文件路径"""
+        try:
+            room_id = url.split('rooms/')[-1].split('?')[0]
+            room_dir = os.path.join(self.base_dir, room_id)
+            os.makedirs(room_dir, exist_ok=True)
+
+            html = driver.page_source
+            filename = os.path.join(room_dir, f'{stage}.html')
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(html)
+
+            # 更新该房源的快照清单
+            with self._lock:
+                manifest_path = self._manifest_path(room_id)
+                manifest = {}
+                if os.path.exists(manifest_path):
+                    with open(manifest_path, 'r', encoding='utf-8') as f:
+                        manifest = json.load(f)
+                manifest[stage] = {
+                    'url': url,
+                    'file': f'{stage}.html',
+                    'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                    'size': len(html),
+                    **extra
+                }
+                with open(manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+            self.logger.info(f"已保存页面快照: {filename} ({len(html)/1024:.1f} KB)")
+            return filename
+
+        except Exception as e:
+            self.logger.error(f"保存页面快照失败: {str(e)}")
+            return None
+
+# 当前生效的录制器，None表示不录制
+_active_recorder = None
+
+def set_recorder(recorder):
+    """设置全局录制器，传入None关闭录制"""
+    global _active_recorder
+    _active_recorder = recorder
+
+def record_page(driver, url, stage, **extra):
+    """录制开启时保存当前页面快照，否则不做任何事"""
+    if _active_recorder is not None:
+        return _active_recorder.record(driver, url, stage, **extra)
+    return None
+
+def list_fixture_rooms(fixture_dir):
+    """列出快照目录中的所有房源ID"""
+    if not os.path.isdir(fixture_dir):
+        return []
+    return sorted(
+        name for name in os.listdir(fixture_dir)
+        if os.path.exists(os.path.join(fixture_dir, name, 'manifest.json'))
+    )
+
+def load_fixture(fixture_dir, room_id, stage):
+    """读取快照HTML，不存在返回None"""
+    filename = os.path.join(fixture_dir, room_id, f'{stage}.html')
+    if not os.path.exists(filename):
+        return None
+    with open(filename, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _make_handler(fixture_dir):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        """按 /rooms/<room_id>?check_in=..&check_out=..&adults=.. 返回对应快照"""
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = parse_qs(parsed.query)
+            parts = [part for part in parsed.path.split('/') if part]
+            if len(parts) != 2 or parts[0] != 'rooms':
+                self.send_error(404)
+                return
+
+            room_id = parts[1]
+            if 'check_in' in params:
+                stage = price_stage(params['check_in'][0], params.get('check_out', [''])[0],
+                                    params.get('adults', ['3'])[0])
+            else:
+                stage = params.get('stage', [CALENDAR_STAGE])[0]
+
+            html = load_fixture(fixture_dir, room_id, stage)
+            if html is None:
+                self.send_error(404, f'no fixture for {room_id}/{stage}')
+                return
+
+            # 去掉页面脚本，让快照保持静态，避免重新渲染或跳转
+            body = _SCRIPT_PATTERN.sub('', html).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            get_logger().debug(f"快照服务: {format % args}")
+
+    return FixtureHandler
+
+class ReplayServer:
+    """在本地HTTP服务中回放页面快照，供Selenium访问"""
+
+    def __init__(self, fixture_dir='fixtures', host='127.0.0.1', port=0):
+        self.fixture_dir = fixture_dir
+        self.logger = get_logger()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(fixture_dir))
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def room_url(self, room_id):
+        """房源在回放服务中的URL，可直接传给check_calendar_availability/get_price_info"""
+        return f"{self.base_url}/rooms/{room_id}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        self.logger.info(f"快照回放服务已启动: {self.base_url}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.logger.info("快照回放服务已停止")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+def replay_calendar(fixture_dir, room_id):
+    """不经过浏览器，直接用解析器处理日历快照，返回calendar_data"""
+    from airbnb_calendar_checker import extract_calendar_cells_html, build_calendar_data
+
+    html = load_fixture(fixture_dir, room_id, CALENDAR_STAGE)
+    if html is None:
+        return None
+    calendar_data, _ = build_calendar_data(extract_calendar_cells_html(html))
+    return calendar_data
+
+@contextmanager
+def isolated_pipeline():
+    """
+    回放基准测试的运行环境：导出和历史库写到临时目录，关闭报价缓存、限速和录制，
+    保证计时可重复，且不污染正式的数据文件
+    """
+    import price_checker
+    from data_export import exporter
+    from rate_limiter import rate_limiter
+
+    global _active_recorder
+    saved_recorder, saved_cache = _active_recorder, price_checker.USE_QUOTE_CACHE
+    with tempfile.TemporaryDirectory(prefix='fixture_bench_', ignore_cleanup_errors=True) as data_dir, \
+            exporter.isolated(data_dir), rate_limiter.disabled():
+        _active_recorder, price_checker.USE_QUOTE_CACHE = None, False
+        try:
+            yield data_dir
+        finally:
+            _active_recorder, price_checker.USE_QUOTE_CACHE = saved_recorder, saved_cache
+
+def benchmark_fixtures(fixture_dir='fixtures', repeat=3, driver=None):
+    """
+    对快照进行无网络的基准测试
+    不传driver时只测试日历解析；传入driver时通过回放服务跑完整的 日历+报价 流程
+    返回 {room_id: {'parse_seconds', 'pipeline_seconds', 'calendar_rows', 'price_quotes'}}
+    """
+    logger = get_logger()
+    results = {}
+    rooms = list_fixture_rooms(fixture_dir)
+    if not rooms:
+        logger.warning(f"快照目录中没有房源: {fixture_dir}")
+        return results
+
+    for room_id in rooms:
+        timings = []
+        calendar_data = None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            calendar_data = replay_calendar(fixture_dir, room_id)
+            timings.append(time.perf_counter() - started)
+        results[room_id] = {
+            'parse_seconds': min(timings),
+            'calendar_rows': len(calendar_data or []),
+            'pipeline_seconds': None,
+            'price_quotes': None
+        }
+
+    if driver is not None:
+        with ReplayServer(fixture_dir) as server, isolated_pipeline():
+            from advanced_analyzer import analyze_listing
+
+            for room_id in rooms:
+                started = time.perf_counter()
+                result = analyze_listing({'url': server.room_url(room_id)}, driver)
+                results[room_id]['pipeline_seconds'] = time.perf_counter() - started
+                if result and result.get('price_info'):
+                    results[room_id]['price_quotes'] = len(result['price_info'])
+
+    logger.info("\n=== 快照基准测试 ===")
+    for room_id, stats in results.items():
+        pipeline = f"{stats['pipeline_seconds']:.2f} 秒" if stats['pipeline_seconds'] is not None else '-'
+        logger.info(
+            f"Room ID {room_id}: 日历 {stats['calendar_rows']} 行, "
+            f"解析 {stats['parse_seconds']*1000:.1f} 毫秒, 完整流程 {pipeline}"
+        )
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="页面快照回放与基准测试")
+    parser.add_argument('--fixtures', default='fixtures', help="快照目录")
+    parser.add_argument('--repeat', type=int, default=3, help="解析重复次数（取最快一次）")
+    parser.add_argument('--serve', action='store_true', help="只启动回放服务，供手动调试")
+    args = parser.parse_args()
+
+    if args.serve:
+        server = ReplayServer(args.fixtures).start()
+        print(f"回放服务: {server.base_url}/rooms/<room_id>")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        benchmark_fixtures(args.fixtures, args.repeat)
@@ -0,0 +1,110 @@
+import time
+import threading
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+from logger_config import get_logger
+
+# 本次运行各类等待的累计统计 {描述: {'count', 'timeouts', 'total_seconds', 'max_seconds'}}
+_wait_stats = {}
+_stats_lock = threading.Lock()
+# 当前线程（一个线程同时只处理一个房源）的等待统计
+_thread_local = threading.local()
+
+def _thread_stats():
+    if not hasattr(_thread_local, 'stats'):
+        _thread_local.stats = {}
+    return _thread_local.stats
+
+def _add_wait(wait_stats, description, elapsed, timed_out):
+    stats = wait_stats.setdefault(description, {
+        'count': 0, 'timeouts': 0, 'total_seconds': 0.0, 'max_seconds': 0.0
+    })
+    stats['count'] += 1
+    stats['total_seconds'] += elapsed
+    stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+    if timed_out:
+        stats['timeouts'] += 1
+
+def _record_wait(description, elapsed, timed_out):
+    """记录一次等待的实际耗时，同时计入当前线程和本次运行的统计"""
+    _add_wait(_thread_stats(), description, elapsed, timed_out)
+    with _stats_lock:
+        _add_wait(_wait_stats, description, elapsed, timed_out)
+
+def wait_until(driver, condition, timeout, description, poll_frequency=0.2):
+    """等待条件满足并记录实际耗时，超时返回None而不是抛出异常"""
+    logger = get_logger()
+    started = time.time()
+    try:
+        result = WebDriverWait(driver, timeout, poll_frequency=poll_frequency).until(condition)
+        elapsed = time.time() - started
+        _record_wait(description, elapsed, False)
+        logger.info(f"就绪等待[{description}]完成，耗时 {elapsed:.2f} 秒 (上限 {timeout} 秒)")
+        return result
+    except TimeoutException:
+        elapsed = time.time() - started
+        _record_wait(description, elapsed, True)
+        logger.warning(f"就绪等待[{description}]超时，耗时 {elapsed:.2f} 秒")
+        return None
+
+def document_complete(driver):
+    """页面readyState为complete"""
+    return driver.execute_script("return document.readyState") == "complete"
+
+def price_container_populated(driver):
+    """预订价格容器已渲染出价格文本"""
+    return driver.execute_script("""
+        const container = document.querySelector("[data-testid='book-it-default']");
+        return !!container && (container.innerText || '').includes('$');
+    """)
+
+def price_details_rendered(driver):
+    """价格明细（清洁费/服务费/税费/总价）已渲染"""
+    return driver.execute_script("""
+        const container = document.querySelector('._1n7cvm7') || document.querySelector('._1avmy66');
+        return !!container && (container.textContent || '').includes('$');
+    """)
+
+def element_in_viewport(element):
+    """元素已滚动到可视区域内"""
+    def condition(driver):
+        return driver.execute_script("""
+            const rect = arguments[0].getBoundingClientRect();
+            return rect.top >= 0 && rect.top < window.innerHeight;
+        """, element)
+    return condition
+
+def element_rerendered(element, previous_html):
+    """元素的outerHTML发生变化，或元素已被替换"""
+    def condition(driver):
+        try:
+            return element.get_attribute('outerHTML') != previous_html
+        except StaleElementReferenceException:
+            return True
+    return condition
+
+def reset_wait_stats(run=False):
+    """清空当前线程（房源开始时）的等待统计，run=True时清空本次运行的统计"""
+    if run:
+        with _stats_lock:
+            _wait_stats.clear()
+    else:
+        _thread_stats().clear()
+
+def log_wait_stats(run=False):
+    """输出当前线程（当前房源）的等待耗时统计，run=True时输出本次运行的统计"""
+    logger = get_logger()
+    if run:
+        with _stats_lock:
+            snapshot = {key: dict(value) for key, value in _wait_stats.items()}
+    else:
+        snapshot = {key: dict(value) for key, value in _thread_stats().items()}
+    if not snapshot:
+        return
+    logger.info(f"\n=== 页面就绪等待统计（{'本次运行' if run else '当前房源'}） ===")
+    for description, stats in sorted(snapshot.items()):
+        average = stats['total_seconds'] / stats['count']
+        logger.info(
+            f"{description}: {stats['count']} 次, 平均 {average:.2f} 秒, "
+            f"最长 {stats['max_seconds']:.2f} 秒, 超时 {stats['timeouts']} 次"
+        )
@@ -10,12 +10,41 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.action_chains import ActionChains
 from webdriver_manager.chrome import ChromeDriverManager
-from airbnb_calendar_checker import check_calendar_availability
+from airbnb_calendar_checker import check_calendar_availability, parse_min_nights
 from logger_config import get_logger
 import re
 from selenium.common.exceptions import TimeoutException
 import traceback
 from data_export import exporter
+from stay_planner import plan_stay_quotes, stay_feasibility, index_calendar, DEFAULT_GUESTS
+from page_fixtures import record_page, price_stage
+from price_parser import PRICE_TEXT_FIELDS, add_price_amounts, amount_column
+from incremental_planner import select_requotes
+from quote_cache import quote_cache
+from run_journal import journal_quote, journaled_quotes
+from rate_limiter import rate_limiter
+from page_readiness import (wait_until, element_rerendered, element_in_viewport,
+                            price_container_populated, price_details_rendered, reset_wait_stats,
+                            log_wait_stats)
+
+# 打开报价页面之前先查询持久化报价缓存（quote_cache.QUOTE_CACHE_TTL_HOURS内有效）
+USE_QUOTE_CACHE = True
+
+# 报价计划配置：full 覆盖所有可入住夜晚的最少报价; every_n / weekends / stay_lengths 见stay_planner
+STAY_PLAN_STRATEGY = 'full'
+STAY_PLAN_OPTIONS = {}
+
+# 报价矩阵模式：每个入住日期按多种住宿天数和入住人数报价
+MATRIX_STAY_LENGTHS = (1, 2, 4, 7)
+MATRIX_GUEST_COUNTS = (1, 2, 3, 4)
+MATRIX_PLAN_STRATEGY = 'every_n'
+
+# 错误页面/拦截页（验证码等）的特征，只有出现这些时才让限速器退避
+BLOCK_PAGE_SELECTORS = [
+    "[data-testid*='error']",
+    "iframe[src*='captcha']",
+    "#px-captcha",
+]
 
 # 更新价格选择器配置
 PRICE_SELECTORS = [
@@ -142,6 +171,13 @@ def find_price_element(driver, selectors_config):
     
     return None
 
+def _safe_outer_html(element):
+    """获取元素outerHTML，元素已失效时返回None"""
+    try:
+        return element.get_attribute('outerHTML')
+    except Exception:
+        return None
+
 def min_nights_check(driver, date_element):
     """
     检查日期元素的最小入住天数要求
@@ -165,17 +201,17 @@ def min_nights_check(driver, date_element):
         logger.info("点击日期元素...")
         try:
             date_element.click()
-            time.sleep(1)  # 等待状态更新
         except Exception as e:
             logger.warning(f"点击日期元素失败，尝试使用JavaScript点击: {str(e)}")
             driver.execute_script("arguments[0].click();", date_element)
-            time.sleep(1)
+        wait_until(driver, element_rerendered(date_element, initial_html), 2, "日期单元格点击后重新渲染")
             
         # 移动到日期元素上
         logger.info("移动到日期元素...")
+        clicked_html = _safe_outer_html(date_element)
         actions = ActionChains(driver)
         actions.move_to_element(date_element).perform()
-        time.sleep(1)
+        wait_until(driver, element_rerendered(date_element, clicked_html), 1, "日期单元格悬停后重新渲染")
         
         # 重新获取更新后的元素
         try:
@@ -222,19 +258,10 @@ def min_nights_check(driver, date_element):
         
         # 使用正则表达式查找最小入住要求
         if aria_label:
-            patterns = [
-                r'(\d+)\s*night minimum stay',
-                r'minimum stay[:\s]+(\d+)',
-                r'至少住(\d+)晚',
-                r'最少(\d+)晚'
-            ]
-            
-            for pattern in patterns:
-                min_stay_match = re.search(pattern, aria_label, re.IGNORECASE)
-                if min_stay_match:
-                    min_nights = int(min_stay_match.group(1))
-                    logger.info(f"✓ 成功找到最小入住要求: {min_nights}晚 (匹配模式: {pattern})")
-                    return min_nights
+            min_nights = parse_min_nights(aria_label)
+            if min_nights:
+                logger.info(f"✓ 成功找到最小入住要求: {min_nights}晚")
+                return min_nights
                     
             logger.info("未在aria-label中找到最小入住要求")
         
@@ -249,199 +276,393 @@ def min_nights_check(driver, date_element):
         logger.warning("使用默认值1晚")
         return 1
 
-def get_price_info(driver, url, checkin_date, min_nights=None):
-    """获取价格信息"""
+def _detail_field(selector):
+    """根据价格详情选择器的内容判断对应的字段"""
+    if "Cleaning fee" in selector or "cleaning fee" in selector.lower():
+        return 'cleaning_fee'
+    if "service fee" in selector.lower():
+        return 'service_fee'
+    if "tax" in selector.lower():
+        return 'taxes'
+    if "_j1kt73" in selector or "_1qs94rc" in selector:
+        return 'total'
+    return None
+
+# 在浏览器内一次性评估所有价格选择器，返回每晚价格文本和各项费用文本
+PRICE_PROBE_SCRIPT = """
+const priceSelectors = arguments[0];
+const detailSelectors = arguments[1];
+function query(type, selector) {
+    if (type === 'css') {
+        return Array.from(document.querySelectorAll(selector));
+    }
+    const snapshot = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const nodes = [];
+    for (let i = 0; i < snapshot.snapshotLength; i++) {
+        nodes.push(snapshot.snapshotItem(i));
+    }
+    return nodes;
+}
+function isVisible(el) {
+    return !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+}
+const detailContainer = document.querySelector('._1n7cvm7');
+if (detailContainer) {
+    detailContainer.scrollIntoView(true);
+}
+const result = {nightly_text: null, nightly_selector: null, details: {}, detail_selectors: {}};
+for (const [type, selector] of priceSelectors) {
+    try {
+        for (const el of query(type, selector)) {
+            const text = (el.innerText || el.textContent || '').trim();
+            if (isVisible(el) && text.includes('$') && text.includes('NZD')) {
+                result.nightly_text = text;
+                result.nightly_selector = selector;
+                break;
+            }
+        }
+    } catch (e) {}
+    if (result.nightly_text) {
+        break;
+    }
+}
+for (const [type, selector, field] of detailSelectors) {
+    try {
+        for (const el of query(type, selector)) {
+            result.details[field] = (el.textContent || '').trim();
+            result.detail_selectors[field] = selector;
+        }
+    } catch (e) {}
+}
+return result;
+"""
+
+def parse_nightly_price(price_text):
+    """从价格文本中解析每晚价格，优先使用折扣价格"""
     logger = get_logger()
-    logger.info(f"开始获取价格信息: {url}")
-    logger.info(f"入住日期: {checkin_date}")
-    
     try:
-        # 先访问页面
-        driver.get(url)
-        time.sleep(5)
-        
-        # 找到日期单元格
-        date_str = datetime.strptime(checkin_date, '%d/%m/%Y').strftime('%d/%m/%Y')
-        date_element = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located(
-                (By.XPATH, f"//div[@data-testid='calendar-day-{date_str}']/..")
-            )
+        discounted_price = re.search(r'\$(\d[\d,]*(?:\.\d+)?)\s*NZD\s+per night', price_text)
+        if discounted_price:
+            nightly_price = f"${discounted_price.group(1)} NZD"
+            logger.info(f"成功解析折扣价格: {nightly_price}")
+            return nightly_price
+            
+        # 尝试获取原始价格
+        original_price = re.search(r'\$(\d[\d,]*(?:\.\d+)?)\s*NZD', price_text)
+        if original_price:
+            nightly_price = f"${original_price.group(1)} NZD"
+            logger.info(f"成功解析原始价格: {nightly_price}")
+            return nightly_price
+            
+        logger.warning(f"价格文本格式不符合预期: {price_text}")
+    except Exception as e:
+        logger.error(f"解析价格文本时出错: {str(e)}")
+    return None
+
+def probe_price_elements(driver):
+    """一次WebDriver调用评估PRICE_SELECTORS和PRICE_DETAIL_SELECTORS，失败返回None"""
+    logger = get_logger()
+    try:
+        detail_selectors = [
+            [selector_type, selector, _detail_field(selector)]
+            for selector_type, selector in PRICE_DETAIL_SELECTORS
+            if _detail_field(selector)
+        ]
+        started = time.time()
+        probe = driver.execute_script(
+            PRICE_PROBE_SCRIPT,
+            [list(item) for item in PRICE_SELECTORS],
+            detail_selectors
         )
-        
-        # 检查最小入住要求
-        logger.info(f"开始检查日期 {checkin_date} 的最小入住要求...")
-        actual_min_nights = min_nights_check(driver, date_element) if min_nights is None else min_nights
-        logger.info(f"最终使用的最小入住天数: {actual_min_nights}晚 ({'自动检测' if min_nights is None else '手动指定'})")
-        
-        # 计算退房日期
-        checkin_dt = datetime.strptime(checkin_date, '%d/%m/%Y')
-        checkout_dt = checkin_dt + timedelta(days=actual_min_nights)
-        
-        # 初始化价格信息字典
-        price_info = {
-            'check_in': checkin_date,
-            'check_out': checkout_dt.strftime('%d/%m/%Y'),
-            'min_nights': actual_min_nights,
-            'guests': 3,
-            'nightly_price': None,
-            'cleaning_fee': None,
-            'service_fee': None,
-            'taxes': None,
-            'total': None
-        }
-        
-        # 构建带日期参数的URL
-        checkin_str = checkin_dt.strftime('%Y-%m-%d')
-        checkout_str = checkout_dt.strftime('%Y-%m-%d')
-        url_with_dates = f"{url}?check_in={checkin_str}&check_out={checkout_str}&adults=3&children=0&infants=0"
-        logger.info(f"访问URL: {url_with_dates}")
-        
-        # 访问页面
-        driver.get(url_with_dates)
-        time.sleep(5)  # 等待页面加载
-        
-        # 记录页面状态
-        logger.info("检查页面状态...")
-        page_state = driver.execute_script("return document.readyState")
-        logger.info(f"页面状态: {page_state}")
-        
-        # 等待价格容器加载并确保可见
+        logger.info(f"价格批量探测完成，耗时 {time.time() - started:.2f} 秒")
+        return probe
+    except Exception as e:
+        logger.error(f"价格批量探测出错: {str(e)}")
+        return None
+
+def apply_price_probe(probe, price_info):
+    """把批量探测结果写入price_info，返回是否找到任何价格详情"""
+    logger = get_logger()
+    if probe.get('nightly_text'):
+        logger.info(f"找到每晚价格元素: {probe['nightly_text']} (选择器: {probe['nightly_selector']})")
+        nightly_price = parse_nightly_price(probe['nightly_text'])
+        if nightly_price:
+            price_info['nightly_price'] = nightly_price
+            
+    details = probe.get('details') or {}
+    for field, text in details.items():
+        price_info[field] = text
+        logger.info(f"✓ 成功设置{field}: {text} (选择器: {probe['detail_selectors'].get(field)})")
+    return bool(details)
+
+def find_nightly_price(driver):
+    """逐个尝试PRICE_SELECTORS查找每晚价格"""
+    logger = get_logger()
+    nightly_price_element = None
+    for selector_type, selector in PRICE_SELECTORS:
         try:
-            WebDriverWait(driver, 20).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
-            price_container = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "[data-testid='book-it-default']"))
+            logger.info(f"尝试价格选择器: {selector_type} - {selector}")
+            elements = driver.find_elements(
+                By.CSS_SELECTOR if selector_type == "css" else By.XPATH,
+                selector
             )
-            # 确保价格容器可见
-            driver.execute_script("arguments[0].scrollIntoView(true);", price_container)
-            time.sleep(2)  # 等待滚动完成
-            logger.info("价格容器已加载并可见")
+            logger.info(f"找到 {len(elements)} 个价格元素")
+            
+            for element in elements:
+                if element.is_displayed():
+                    price_text = element.text.strip()
+                    logger.info(f"找到可见价格元素: {price_text}")
+                    if "$" in price_text and "NZD" in price_text:
+                        nightly_price_element = element
+                        break
+                        
+            if nightly_price_element:
+                break
         except Exception as e:
-            logger.error(f"等待价格容器超时: {str(e)}")
-            return None
+            logger.warning(f"使用选择器 {selector} 时出错: {str(e)}")
+            continue
             
-        # 获取每晚价格
-        nightly_price_element = None
-        for selector_type, selector in PRICE_SELECTORS:
-            try:
-                logger.info(f"尝试价格选择器: {selector_type} - {selector}")
-                elements = driver.find_elements(
-                    By.CSS_SELECTOR if selector_type == "css" else By.XPATH,
-                    selector
-                )
-                logger.info(f"找到 {len(elements)} 个价格元素")
-                
-                for element in elements:
-                    if element.is_displayed():
-                        price_text = element.text.strip()
-                        logger.info(f"找到可见价格元素: {price_text}")
-                        if "$" in price_text and "NZD" in price_text:
-                            nightly_price_element = element
-                            break
-                            
-                if nightly_price_element:
-                    break
-            except Exception as e:
-                logger.warning(f"使用选择器 {selector} 时出错: {str(e)}")
-                continue
-                
-        if nightly_price_element:
-            price_text = nightly_price_element.text.strip()
-            logger.info(f"找到每晚价格元素: {price_text}")
-            try:
-                # 优先获取折扣价格
-                discounted_price = re.search(r'\$(\d+)\s*NZD\s+per night', price_text)
-                if discounted_price:
-                    price_info['nightly_price'] = f"${discounted_price.group(1)} NZD"
-                    logger.info(f"成功解析折扣价格: {price_info['nightly_price']}")
-                else:
-                    # 尝试获取原始价格
-                    original_price = re.search(r'\$(\d+)\s*NZD', price_text)
-                    if original_price:
-                        price_info['nightly_price'] = f"${original_price.group(1)} NZD"
-                        logger.info(f"成功解析原始价格: {price_info['nightly_price']}")
-                    else:
-                        logger.warning(f"价格文本格式不符合预期: {price_text}")
-            except Exception as e:
-                logger.error(f"解析价格文本时出错: {str(e)}")
-                
-        # 修改价格详情获取部分
-        logger.info("开始获取价格详情...")
-        price_details_found = False
+    if nightly_price_element:
+        price_text = nightly_price_element.text.strip()
+        logger.info(f"找到每晚价格元素: {price_text}")
+        return parse_nightly_price(price_text)
+    return None
+
+def find_price_details(driver, price_info):
+    """逐个尝试PRICE_DETAIL_SELECTORS获取价格详情，返回是否找到任何详情"""
+    logger = get_logger()
+    logger.info("开始获取价格详情...")
+    price_details_found = False
+    
+    # 等待价格详情容器加载，缩短等待时间
+    try:
+        price_container = WebDriverWait(driver, 3).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "_1n7cvm7"))
+        )
+        logger.info("价格详情容器已加载")
         
-        # 等待价格详情容器加载，缩短等待时间
+        # 确保价格容器可见
+        driver.execute_script("arguments[0].scrollIntoView(true);", price_container)
+        wait_until(driver, element_in_viewport(price_container), 1, "价格详情容器滚动到可视区域")
+        
+    except TimeoutException:
+        logger.warning("等待价格详情容器超时")
+    
+    # 遍历所有价格详情选择器
+    for selector_type, selector in PRICE_DETAIL_SELECTORS:
         try:
-            price_container = WebDriverWait(driver, 3).until(
-                EC.presence_of_element_located((By.CLASS_NAME, "_1n7cvm7"))
+            logger.info(f"尝试使用选择器获取价格详情: {selector}")
+            
+            # 缩短等待时间到2秒
+            elements = WebDriverWait(driver, 2).until(
+                EC.presence_of_all_elements_located(
+                    (By.XPATH if selector_type == "xpath" else By.CSS_SELECTOR, selector)
+                )
             )
-            logger.info("价格详情容器已加载")
             
-            # 确保价格容器可见
-            driver.execute_script("arguments[0].scrollIntoView(true);", price_container)
-            time.sleep(0.5)  # 短暂等待滚动完成
+            logger.info(f"找到 {len(elements)} 个匹配元素")
             
-        except TimeoutException:
-            logger.warning("等待价格详情容器超时")
-        
-        # 遍历所有价格详情选择器
-        for selector_type, selector in PRICE_DETAIL_SELECTORS:
-            try:
-                logger.info(f"尝试使用选择器获取价格详情: {selector}")
+            field = _detail_field(selector)
+            for element in elements:
+                price_text = element.get_attribute('textContent').strip()
+                element_html = element.get_attribute('outerHTML')
+                logger.info(f"找到价格元素: {price_text} (HTML: {element_html})")
                 
-                # 缩短等待时间到2秒
-                elements = WebDriverWait(driver, 2).until(
-                    EC.presence_of_all_elements_located(
-                        (By.XPATH if selector_type == "xpath" else By.CSS_SELECTOR, selector)
-                    )
-                )
-                
-                logger.info(f"找到 {len(elements)} 个匹配元素")
-                
-                for element in elements:
-                    price_text = element.get_attribute('textContent').strip()
-                    element_html = element.get_attribute('outerHTML')
-                    logger.info(f"找到价格元素: {price_text} (HTML: {element_html})")
+                # 根据选择器内容设置价格信息
+                if field:
+                    price_info[field] = price_text
+                    logger.info(f"✓ 成功设置{field}: {price_text}")
+                    price_details_found = True
                     
-                    # 根据选择器内容设置价格信息
-                    if "Cleaning fee" in selector or "cleaning fee" in selector.lower():
-                        price_info['cleaning_fee'] = price_text
-                        logger.info(f"✓ 成功设置清洁费: {price_text}")
-                        price_details_found = True
-                    elif "service fee" in selector.lower():
-                        price_info['service_fee'] = price_text
-                        logger.info(f"✓ 成功设置服务费: {price_text}")
-                        price_details_found = True
-                    elif "tax" in selector.lower():
-                        price_info['taxes'] = price_text
-                        logger.info(f"✓ 成功设置税费: {price_text}")
-                        price_details_found = True
-                    elif "_j1kt73" in selector or "_1qs94rc" in selector:
-                        price_info['total'] = price_text
-                        logger.info(f"✓ 成功设置总价: {price_text}")
-                        price_details_found = True
-                        
-            except TimeoutException:
-                continue
-            except Exception as e:
-                logger.warning(f"使用选择器 {selector} 获取价格详情时出错: {str(e)}")
-                continue
+        except TimeoutException:
+            continue
+        except Exception as e:
+            logger.warning(f"使用选择器 {selector} 获取价格详情时出错: {str(e)}")
+            continue
             
-        # 如果没有找到任何价格详情，尝试点击展开按钮
-        if not price_details_found:
-            try:
-                # 尝试点击价格展开按钮
-                show_price_button = driver.find_element(By.XPATH, "//button[contains(@class, '_12wl7g09')]")
-                show_price_button.click()
-                time.sleep(1)
-                
-                # 重新执行一次价格获取
-                logger.info("点击展开按钮后重新获取价格详情...")
-                # 递归调用，但不再尝试点击展开
-                return get_price_info(driver, url, checkin_date, min_nights)
-                
-            except Exception as e:
-                logger.warning(f"尝试点击价格展开按钮失败: {str(e)}")
+    return price_details_found
+
+# 从带日期的页面读取入住日单元格的aria-label和预订区域文本，用于解析最小入住天数
+PAGE_MIN_NIGHTS_SCRIPT = """
+const dateDiv = document.querySelector("div[data-testid='calendar-day-" + arguments[0] + "']");
+const cell = dateDiv ? dateDiv.closest('td') : null;
+const bookIt = document.querySelector("[data-testid='book-it-default']");
+return [cell ? (cell.getAttribute('aria-label') || '') : '', bookIt ? (bookIt.innerText || '') : ''];
+"""
+
+def build_dated_url(url, checkin_dt, nights, adults=3):
+    """构建带入住/退房日期参数的房源URL"""
+    checkout_dt = checkin_dt + timedelta(days=nights)
+    return (f"{url}?check_in={checkin_dt.strftime('%Y-%m-%d')}&check_out={checkout_dt.strftime('%Y-%m-%d')}"
+            f"&adults={adults}&children=0&infants=0")
+
+def load_dated_page(driver, url_with_dates):
+    """打开带日期的房源页面并等待价格容器可见，成功返回True"""
+    logger = get_logger()
+    logger.info(f"访问URL: {url_with_dates}")
+    driver.get(url_with_dates)
+    
+    # 等待价格容器渲染出价格并确保可见
+    try:
+        if not wait_until(driver, price_container_populated, 20, "价格容器填充价格"):
+            logger.error("等待价格容器超时")
+            return False
+        price_container = driver.find_element(By.CSS_SELECTOR, "[data-testid='book-it-default']")
+        driver.execute_script("arguments[0].scrollIntoView(true);", price_container)
+        wait_until(driver, element_in_viewport(price_container), 2, "价格容器滚动到可视区域")
+        logger.info("价格容器已加载并可见")
+        return True
+    except Exception as e:
+        logger.error(f"等待价格容器超时: {str(e)}")
+        return False
+
+def read_min_nights_from_page(driver, checkin_date):
+    """从当前带日期的页面读取最小入住天数，未找到返回None"""
+    logger = get_logger()
+    try:
+        aria_label, book_it_text = driver.execute_script(PAGE_MIN_NIGHTS_SCRIPT, checkin_date)
+        min_nights = parse_min_nights(aria_label) or parse_min_nights(book_it_text)
+        if min_nights:
+            logger.info(f"从页面读取到最小入住天数: {min_nights}晚")
+        return min_nights
+    except Exception as e:
+        logger.warning(f"从页面读取最小入住天数失败: {str(e)}")
+        return None
+
+def read_price_fields(driver, price_info):
+    """在当前页面读取每晚价格和各项费用，返回是否找到任何价格详情"""
+    logger = get_logger()
+    # 一次脚本调用评估所有价格选择器，失败时退回逐个选择器查找
+    probe = probe_price_elements(driver)
+    if probe is not None:
+        return apply_price_probe(probe, price_info)
+        
+    logger.warning("价格批量探测失败，改用逐个选择器查找")
+    nightly_price = find_nightly_price(driver)
+    if nightly_price:
+        price_info['nightly_price'] = nightly_price
+    return find_price_details(driver, price_info)
+
+def _new_price_info(checkin_dt, nights, min_nights, guests=DEFAULT_GUESTS):
+    """初始化价格信息字典"""
+    return add_price_amounts({
+        'check_in': checkin_dt.strftime('%d/%m/%Y'),
+        'check_out': (checkin_dt + timedelta(days=nights)).strftime('%d/%m/%Y'),
+        'min_nights': min_nights,
+        'nights': nights,
+        'guests': guests,
+        'nightly_price': None,
+        'cleaning_fee': None,
+        'service_fee': None,
+        'taxes': None,
+        'total': None
+    })
+
+def read_quote_page(driver, price_info):
+    """读取当前页面的价格，没有价格详情时点击展开按钮后在同一页面再读一次"""
+    logger = get_logger()
+    # 价格容器出现后明细行可能还在渲染，先等明细再一次性探测
+    wait_until(driver, price_details_rendered, 3, "价格明细渲染")
+    if read_price_fields(driver, price_info):
+        return True
+        
+    try:
+        show_price_button = driver.find_element(By.XPATH, "//button[contains(@class, '_12wl7g09')]")
+        show_price_button.click()
+        wait_until(driver, price_details_rendered, 3, "展开后价格明细渲染")
+        
+        logger.info("点击展开按钮后重新获取价格详情...")
+        return read_price_fields(driver, price_info)
+        
+    except Exception as e:
+        logger.warning(f"尝试点击价格展开按钮失败: {str(e)}")
+        return False
+
+def _record_quote_page(driver, url, checkin_dt, nights, guests):
+    """录制开启时保存价格页面快照"""
+    checkout_dt = checkin_dt + timedelta(days=nights)
+    record_page(driver, url, price_stage(checkin_dt.strftime('%Y-%m-%d'), checkout_dt.strftime('%Y-%m-%d'), guests),
+                check_in=checkin_dt.strftime('%d/%m/%Y'), nights=nights, guests=guests)
+
+def fetch_quote_page(driver, url, checkin_dt, nights, min_nights, guests=DEFAULT_GUESTS):
+    """
+    按浏览器配置文件限速打开带日期的页面并读取价格，页面加载失败返回None
+    页面耗时和错误/拦截页反馈给限速器，由它调整该配置文件的请求速率
+    没有价格本身不算失败（日期不可订、未达最小入住天数都会这样），只按耗时计入
+    """
+    limiter = rate_limiter.for_driver(driver)
+    limiter.acquire()
+    started = time.monotonic()
+    try:
+        if not load_dated_page(driver, build_dated_url(url, checkin_dt, nights, guests)):
+            limiter.report('error' if page_blocked(driver) else 'ok', time.monotonic() - started)
+            return None
+        elapsed = time.monotonic() - started
+        
+        price_info = _new_price_info(checkin_dt, nights, min_nights, guests)
+        read_quote_page(driver, price_info)
+    except Exception:
+        # 页面加载超时或WebDriver出错也要反馈给限速器，异常继续抛出
+        limiter.report('error' if page_blocked(driver) else 'slow')
+        raise
+    blocked = not price_info.get('nightly_price') and page_blocked(driver)
+    limiter.report('blocked' if blocked else 'ok', elapsed)
+    _record_quote_page(driver, url, checkin_dt, nights, guests)
+    return price_info
+
+def get_price_info(driver, url, checkin_date, min_nights=None, nights=None, guests=DEFAULT_GUESTS):
+    """
+    获取价格信息，直接打开带日期的页面，在同一次页面加载中读取最小入住天数和价格
+    min_nights: 已知的最小入住天数，None时从页面读取
+    nights: 查询的住宿天数，None时使用最小入住天数
+    guests: 入住人数
+    """
+    logger = get_logger()
+    logger.info(f"开始获取价格信息: {url}")
+    logger.info(f"入住日期: {checkin_date}")
+    
+    try:
+        checkin_dt = datetime.strptime(checkin_date, '%d/%m/%Y')
+        stay_nights = nights or min_nights or 1
+        
+        # 打开页面之前先查报价缓存
+        room_id = url.split('rooms/')[-1].split('?')[0]
+        requested_checkout = (checkin_dt + timedelta(days=stay_nights)).strftime('%d/%m/%Y')
+        if USE_QUOTE_CACHE:
+            cached = quote_cache.get(room_id, checkin_date, requested_checkout, guests)
+            if cached:
+                logger.info(f"使用缓存报价: {checkin_date} -> {requested_checkout} ({cached['quoted_at']})")
+                # quoted_at是实际抓取时间；exported为False时（例如抓取后运行崩溃）仍需导出
+                return dict(cached, from_cache=True)
+        
+        # 访问带日期的页面，先读取当前页面的价格，之后的点击检测会改变页面上的日期选择
+        price_info = fetch_quote_page(driver, url, checkin_dt, stay_nights, min_nights, guests)
+        if price_info is None:
+            return None
+            
+        # 最小入住天数：日历数据 > 页面文本 > 点击当前页面上的日期单元格
+        actual_min_nights = min_nights
+        source = '日历数据'
+        if actual_min_nights is None:
+            actual_min_nights = read_min_nights_from_page(driver, checkin_date)
+            source = '页面读取'
+        if actual_min_nights is None:
+            date_elements = driver.find_elements(By.XPATH, f"//div[@data-testid='calendar-day-{checkin_date}']/..")
+            actual_min_nights = min_nights_check(driver, date_elements[0]) if date_elements else 1
+            source = '点击检测' if date_elements else '默认值'
+        logger.info(f"最终使用的最小入住天数: {actual_min_nights}晚 ({source})")
+        price_info['min_nights'] = actual_min_nights
+        
+        # 未指定住宿天数且实际最小入住天数更长时，只需重新打开一次页面
+        if nights is None and actual_min_nights > stay_nights:
+            logger.info(f"住宿天数不足最小入住要求，按 {actual_min_nights} 晚重新加载")
+            stay_nights = actual_min_nights
+            price_info = fetch_quote_page(driver, url, checkin_dt, stay_nights, actual_min_nights, guests)
+            if price_info is None:
+                return None
+        
+        # 在抓取时把价格文本解析为数值金额和货币，下游直接使用数值列
+        add_price_amounts(price_info)
         
         # 验证价格信息完整性
         logger.info("验证价格信息完整性:")
@@ -456,6 +677,12 @@ def get_price_info(driver, url, checkin_date, min_nights=None):
         logger.info("终价格信息获取结果:")
         for key, value in price_info.items():
             logger.info(f"{key}: {value}")
+        
+        # 只缓存取到价格的报价；实际退房日期与请求不同时两个键都缓存
+        if USE_QUOTE_CACHE and price_info.get('nightly_price_amount') is not None:
+            quote_cache.put(room_id, price_info)
+            if price_info['check_out'] != requested_checkout:
+                quote_cache.put(room_id, price_info, check_out=requested_checkout)
             
         return price_info
             
@@ -477,11 +704,20 @@ def find_all_available_dates(calendar_data):
     logger.info(f"找到 {len(available_dates)} 个可预订日期")
     return available_dates
 
-def check_room_price(url_info, calendar_data, driver):
-    """检查房间价格"""
+def check_room_price(url_info, calendar_data, driver, strategy=None, plan_options=None,
+                     previous_state=None, quote_ttl_hours=None):
+    """
+    检查房间价格
+    strategy: 报价计划策略（见stay_planner.PLAN_STRATEGIES），默认使用STAY_PLAN_STRATEGY
+    plan_options: 传给plan_stay_quotes的额外参数，默认使用STAY_PLAN_OPTIONS
+    previous_state: 增量模式下房源上一次的日历和报价（incremental_planner.load_previous_state），
+                    只重新报价新增、日历有变化或过期的组合，其余沿用旧报价
+    quote_ttl_hours: 增量模式下旧报价的有效期，默认QUOTE_TTL_HOURS
+    """
     logger = get_logger()
     url = url_info['url']
     logger.info(f"开始检查房源价格: {url}")
+    reset_wait_stats()
     
     try:
         # 查找所有可预订日期
@@ -490,35 +726,55 @@ def check_room_price(url_info, calendar_data, driver):
             logger.error(f"房 {url} 未找到可预订日期")
             return None
         
+        # 根据日历和最小入住天数计算需要查询的入住/退房组合
+        strategy = strategy or STAY_PLAN_STRATEGY
+        quotes = plan_stay_quotes(calendar_data, strategy=strategy, **(plan_options or STAY_PLAN_OPTIONS))
+        
+        # 增量模式：日历未变化且未过期的组合沿用旧报价
+        carried_quotes = []
+        if previous_state:
+            quotes, carried_quotes, stats = select_requotes(quotes, calendar_data, previous_state, quote_ttl_hours)
+            logger.info(
+                f"增量报价: 计划 {stats['planned']} 个, 重新报价 {len(quotes)} 个 "
+                f"(新增 {stats['new']}, 日历变化 {stats['changed']}, 过期 {stats['stale']}), "
+                f"沿用 {stats['carried']} 个, 新开放入住日期 {stats['opened']} 个"
+            )
+        
         # 存储所有日期的价格信息
         all_price_info = []
         failed_dates = []
         
-        # 遍历每个可预订日期
-        for index, check_in_date in enumerate(available_dates, 1):
+        # 继续中断的运行时，本次运行已完成的报价直接使用
+        room_id = url.split('rooms/')[-1].split('?')[0]
+        resumed_quotes = journaled_quotes(room_id)
+        if resumed_quotes:
+            logger.info(f"运行日志中已有 {len(resumed_quotes)} 个报价，跳过这些日期")
+        
+        # 遍历报价计划
+        for index, quote in enumerate(quotes, 1):
+            check_in_date = quote['check_in']
             try:
-                logger.info(f"[{index}/{len(available_dates)}] 处理日期: {check_in_date}")
+                resumed = resumed_quotes.get((check_in_date, quote['check_out'], DEFAULT_GUESTS))
+                if resumed:
+                    all_price_info.append(resumed)
+                    continue
+                    
+                logger.info(f"[{index}/{len(quotes)}] 处理日期: {check_in_date} ({quote['nights']}晚)")
                 
-                # 获取该日期的价格信息，让函数自动检查最小入住天数
-                price_info = get_price_info(driver, url, check_in_date)
+                # 计划天数就是最小入住天数时，由get_price_info按实际最小入住天数计算退房日期
+                nights = quote['nights'] if quote['nights'] != (quote['min_nights'] or 1) else None
+                price_info = get_price_info(driver, url, check_in_date, quote['min_nights'], nights, DEFAULT_GUESTS)
                 if price_info:
                     all_price_info.append(price_info)
+                    journal_quote(room_id, check_in_date, quote['check_out'], DEFAULT_GUESTS, price_info)
                     logger.info(f"✓ 成功获取 {check_in_date} 的价格信息")
-                    
-                    # 根据最小入住天数跳过后续日期
-                    min_nights = price_info['min_nights']
-                    if min_nights > 1:
-                        skip_count = min_nights - 1
-                        logger.info(f"根据最小入住要求({min_nights}晚)跳过接下来的 {skip_count} 天")
-                        index += skip_count
                 else:
                     failed_dates.append(check_in_date)
                     logger.warning(f"✗ 获取 {check_in_date} 的价格信息失败")
                 
-                # 每处理5个日期暂停一
+                # 请求间隔由rate_limiter按浏览器配置文件控制，这里只输出进度
                 if index % 5 == 0:
-                    logger.info(f"已完成 {index}/{len(available_dates)} 个日期的处理")
-                    time.sleep(10)
+                    logger.info(f"已完成 {index}/{len(quotes)} 个日期的处理")
                     
             except Exception as e:
                 failed_dates.append(check_in_date)
@@ -528,22 +784,36 @@ def check_room_price(url_info, calendar_data, driver):
         # 统计处理结果
         logger.info("\n=== 价格数据收集统计 ===")
         logger.info(f"总可预订日期: {len(available_dates)}")
+        logger.info(f"计划报价次数: {len(quotes)}")
         logger.info(f"成功收集: {len(all_price_info)}")
+        if previous_state:
+            logger.info(f"沿用旧报价: {len(carried_quotes)}")
         logger.info(f"失败日期: {len(failed_dates)}")
+        log_wait_stats()
         
         if failed_dates:
             logger.warning("失败日期列表:")
             for date in failed_dates:
                 logger.warning(f"- {date}")
         
-        # 导出数据
-        if all_price_info:
-            export_result = exporter.export_price_data(all_price_info, url_info['url'])
+        # 导出数据：沿用的报价和已导出过的缓存报价不重复导出，缓存中尚未导出的报价（崩溃前获取的）照常导出
+        fresh_quotes = [price_info for price_info in all_price_info if not price_info.get('exported')]
+        exported_count = len(all_price_info) - len(fresh_quotes)
+        if exported_count:
+            logger.info(f"来自报价缓存且已导出过: {exported_count} 个（不重新导出）")
+        if fresh_quotes:
+            export_result = exporter.export_price_data(fresh_quotes, url_info['url'])
             if not export_result:
                 logger.error("价格数据导出失败")
                 return None
+            if USE_QUOTE_CACHE:
+                quote_cache.mark_exported(room_id, fresh_quotes)
             
-            return all_price_info
+        if all_price_info:
+            return all_price_info + carried_quotes
+        elif carried_quotes:
+            logger.info("日历和报价均无变化，全部沿用旧报价")
+            return carried_quotes
         else:
             logger.error("未能获取任何价格信息")
             return None
@@ -617,4 +887,111 @@ def check_page_state(driver):
         
     except Exception as e:
         logger.error(f"检查页面状态时出错: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+
+def page_blocked(driver):
+    """当前页面是否为错误页面或拦截页"""
+    logger = get_logger()
+    try:
+        for selector in BLOCK_PAGE_SELECTORS:
+            elements = driver.find_elements(By.CSS_SELECTOR, selector)
+            if elements:
+                logger.warning(f"页面为错误/拦截页: {selector} {elements[0].text[:100]}")
+                return True
+        return False
+    except Exception as e:
+        logger.error(f"检查错误/拦截页时出错: {str(e)}")
+        return False
+
+def _confirmed_status(price_info, nights):
+    """最小入住天数未知的组合报价后的状态：取到价格为ok，页面读到的最小天数更长为below_min_stay"""
+    if price_info.get('nightly_price_amount') is not None:
+        return 'ok'
+    if price_info.get('min_nights') and nights < price_info['min_nights']:
+        return 'below_min_stay'
+    return 'unknown_min'
+
+def get_price_matrix(driver, url, checkin_dates, calendar_data, stay_lengths=None, guest_counts=None):
+    """
+    在同一个标签页中按 入住日期 x 住宿天数 x 入住人数 获取报价
+    日历数据用于跳过不满足最小入住或被占用的组合，不会为它们打开页面
+    返回一张整洁的DataFrame，每个组合一行
+    """
+    logger = get_logger()
+    stay_lengths = stay_lengths or MATRIX_STAY_LENGTHS
+    guest_counts = guest_counts or MATRIX_GUEST_COUNTS
+    room_id = url.split('rooms/')[-1].split('?')[0]
+    min_nights_by_date = {date_info['date']: date_info.get('min_nights') for date_info in calendar_data}
+    calendar = index_calendar(calendar_data)
+    # 继续中断的运行时，本次运行已完成的报价直接使用
+    resumed_quotes = journaled_quotes(room_id)
+    rows = []
+    
+    for checkin_date in checkin_dates:
+        checkin_dt = datetime.strptime(checkin_date, '%d/%m/%Y')
+        min_nights = min_nights_by_date.get(checkin_date)
+        for nights in stay_lengths:
+            feasibility = stay_feasibility(calendar, checkin_date, nights)
+            for guests in guest_counts:
+                row = _new_price_info(checkin_dt, nights, min_nights, guests)
+                row.update({'room_id': room_id, 'quote_status': feasibility, 'from_cache': False, 'exported': False})
+                
+                # 最小入住天数未知的组合也打开页面，由页面确认是否可订
+                if feasibility in ('ok', 'unknown_min'):
+                    logger.info(f"报价矩阵: {checkin_date} {nights}晚 {guests}人")
+                    price_info = resumed_quotes.get((checkin_date, row['check_out'], guests))
+                    if price_info is None:
+                        price_info = get_price_info(driver, url, checkin_date, min_nights, nights, guests)
+                        if price_info:
+                            journal_quote(room_id, checkin_date, row['check_out'], guests, price_info)
+                    if price_info:
+                        row.update(price_info)
+                        if feasibility == 'unknown_min':
+                            row['quote_status'] = _confirmed_status(price_info, nights)
+                    else:
+                        row['quote_status'] = 'failed'
+                rows.append(row)
+                
+    matrix = pd.DataFrame(rows, columns=[
+        'room_id', 'check_in', 'check_out', 'nights', 'min_nights', 'guests', 'quote_status',
+        *PRICE_TEXT_FIELDS, *[amount_column(field) for field in PRICE_TEXT_FIELDS], 'currency',
+        'quoted_at', 'from_cache', 'exported'
+    ])
+    quoted = int((matrix['quote_status'] == 'ok').sum())
+    logger.info(f"报价矩阵完成: {len(matrix)} 个组合, 成功报价 {quoted} 个")
+    return matrix
+
+def check_room_price_matrix(url_info, calendar_data, driver, stay_lengths=None, guest_counts=None,
+                            strategy=None, plan_options=None):
+    """报价矩阵模式：按报价计划选出入住日期，再对每个日期批量报价并导出一张表"""
+    logger = get_logger()
+    url = url_info['url']
+    logger.info(f"开始获取房源报价矩阵: {url}")
+    reset_wait_stats()
+    
+    try:
+        quotes = plan_stay_quotes(
+            calendar_data,
+            strategy=strategy or MATRIX_PLAN_STRATEGY,
+            **(plan_options or {})
+        )
+        checkin_dates = list(dict.fromkeys(quote['check_in'] for quote in quotes))
+        if not checkin_dates:
+            logger.error(f"房源 {url} 没有可报价的入住日期")
+            return None
+            
+        matrix = get_price_matrix(driver, url, checkin_dates, calendar_data, stay_lengths, guest_counts)
+        log_wait_stats()
+        
+        export_result = exporter.export_price_matrix(matrix.to_dict('records'), url)
+        if not export_result:
+            logger.error("报价矩阵导出失败")
+        elif USE_QUOTE_CACHE:
+            room_id = url.split('rooms/')[-1].split('?')[0]
+            quoted = matrix[(matrix['quote_status'] == 'ok') & ~matrix['exported']]
+            quote_cache.mark_exported(room_id, quoted.to_dict('records'))
+        return matrix
+        
+    except Exception as e:
+        logger.error(f"获取报价矩阵时发生错误: {str(e)}")
+        return None
@@ -0,0 +1,138 @@
+import os
+import re
+import argparse
+import pandas as pd
+from logger_config import get_logger
+
+# 页面上以文本显示的价格字段，解析后新增 <字段>_amount 数值列和一个 currency 列
+PRICE_TEXT_FIELDS = ['nightly_price', 'cleaning_fee', 'service_fee', 'taxes', 'total']
+
+# 只有 "$" 没有货币代码时使用的默认货币（抓取的都是新西兰站点）
+DEFAULT_CURRENCY = 'NZD'
+
+# 货币符号（含前缀）对应的货币代码
+SYMBOL_CURRENCIES = {
+    '$': DEFAULT_CURRENCY,
+    'NZ$': 'NZD',
+    'US$': 'USD',
+    'A$': 'AUD',
+    'AU$': 'AUD',
+    'C$': 'CAD',
+    'CA$': 'CAD',
+    '€': 'EUR',
+    '£': 'GBP',
+    '¥': 'JPY',
+}
+
+# 例: "$165 NZD", "$1,234.50 NZD", "-$20 NZD", "NZ$165", "€99"
+PRICE_PATTERN = (
+    r'(?P<sign>[-−–])?\s*(?P<prefix>NZ|US|AU|CA|A|C)?(?P<symbol>[$€£¥])\s*'
+    r'(?P<number>\d[\d,]*(?:\.\d+)?)(?:\s*(?P<code>[A-Z]{3})\b)?'
+)
+PRICE_REGEX = re.compile(PRICE_PATTERN)
+
+def amount_column(field):
+    """价格文本字段对应的数值列名"""
+    return f'{field}_amount'
+
+def parse_price(text):
+    """
+    解析一个价格文本，返回 (金额, 货币代码)
+    金额为float（保留小数，去掉千分位），无法解析时返回 (None, None)
+    """
+    if text is None:
+        return None, None
+    if isinstance(text, (int, float)):
+        return (None, None) if text != text else (float(text), None)
+
+    match = PRICE_REGEX.search(str(text))
+    if not match:
+        return None, None
+    amount = float(match.group('number').replace(',', ''))
+    if match.group('sign'):
+        amount = -amount
+    currency = match.group('code') or SYMBOL_CURRENCIES.get((match.group('prefix') or '') + match.group('symbol'))
+    return amount, currency
+
+def add_price_amounts(price_info):
+    """在抓取时为一条价格信息补充数值金额和货币，原地修改并返回"""
+    currency = None
+    for field in PRICE_TEXT_FIELDS:
+        amount, field_currency = parse_price(price_info.get(field))
+        price_info[amount_column(field)] = amount
+        currency = currency or field_currency
+    price_info['currency'] = currency
+    return price_info
+
+def parse_price_series(series):
+    """向量化解析一列价格文本，返回包含 amount 和 currency 两列的DataFrame"""
+    extracted = series.astype('string').str.extract(PRICE_PATTERN)
+    amount = pd.to_numeric(extracted['number'].str.replace(',', '', regex=False), errors='coerce')
+    amount = amount.where(extracted['sign'].isna(), -amount)
+    symbol_currency = (extracted['prefix'].fillna('') + extracted['symbol']).map(SYMBOL_CURRENCIES)
+    currency = extracted['code'].fillna(symbol_currency)
+
+    # 已经是数值的单元格（例如回填过的文件）直接使用
+    numeric = pd.to_numeric(series, errors='coerce')
+    return pd.DataFrame({
+        'amount': amount.astype('float64').fillna(numeric),
+        'currency': currency.astype(object).where(currency.notna(), None)
+    }, index=series.index)
+
+def add_price_columns(df):
+    """
+    批量回填：为DataFrame中的价格文本列添加数值列和currency列
+    已有的数值保持不变，只补充缺失的部分
+    """
+    df = df.copy()
+    currency = pd.Series(None, index=df.index, dtype=object)
+    for field in PRICE_TEXT_FIELDS:
+        if field not in df.columns:
+            continue
+        parsed = parse_price_series(df[field])
+        column = amount_column(field)
+        df[column] = df[column].combine_first(parsed['amount']) if column in df.columns else parsed['amount']
+        currency = currency.combine_first(parsed['currency'])
+    if 'currency' in df.columns:
+        df['currency'] = df['currency'].combine_first(currency)
+    else:
+        df['currency'] = currency
+    return df
+
+def backfill_export(path, output=None):
+    """为旧的价格导出文件（xlsx/parquet）补充数值列，默认原地覆盖，返回写入的文件路径"""
+    logger = get_logger()
+    output = output or path
+    try:
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_excel(path)
+        if not any(field in df.columns for field in PRICE_TEXT_FIELDS):
+            logger.info(f"文件中没有价格列，跳过: {path}")
+            return None
+
+        df = add_price_columns(df)
+        # 先写临时文件再替换，中途失败不会破坏原文件
+        root, ext = os.path.splitext(output)
+        tmp_path = f'{root}.tmp{ext}'
+        if ext == '.parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_excel(tmp_path, index=False)
+        os.replace(tmp_path, output)
+
+        parsed = int(df[amount_column('nightly_price')].notna().sum()) if amount_column('nightly_price') in df.columns else 0
+        logger.info(f"价格数值列已回填: {output} ({len(df)} 行, 每晚价格 {parsed} 条)")
+        return output
+    except Exception as e:
+        logger.error(f"回填价格数值列失败 {path}: {str(e)}")
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为旧的价格导出文件回填数值金额和货币列")
+    parser.add_argument('paths', nargs='+', help="价格导出文件 (.xlsx/.parquet)")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        backfill_export(path)
@@ -0,0 +1,167 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from logger_config import get_logger
+
+# 缓存的报价在这个小时数内有效
+QUOTE_CACHE_TTL_HOURS = 12
+
+# 缓存条目上限，超过后按最近访问时间淘汰最旧的
+QUOTE_CACHE_MAX_ENTRIES = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS quotes (
+    room_id      TEXT NOT NULL,
+    check_in     TEXT NOT NULL,
+    check_out    TEXT NOT NULL,
+    guests       INTEGER NOT NULL,
+    price_info   TEXT NOT NULL,
+    cached_at    TEXT NOT NULL,
+    last_access  TEXT NOT NULL,
+    -- 报价是否已经导出/写入历史库，崩溃前获取但未导出的报价命中缓存后仍需导出
+    exported     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (room_id, check_in, check_out, guests)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_quotes_last_access ON quotes (last_access);
+"""
+
+# 旧版本缓存库中缺少的列，打开时自动补齐
+MIGRATIONS = {
+    'quotes': [('exported', 'INTEGER NOT NULL DEFAULT 0')],
+}
+
+class QuoteCache:
+    """
+    持久化的报价缓存，键为 (房源, 入住, 退房, 人数)
+    get_price_info在打开页面之前先查缓存，崩溃后重跑或两次运行重叠时不会重复获取相同的报价
+    """
+
+    def __init__(self, db_path=os.path.join('data', 'quote_cache.db'), ttl_hours=QUOTE_CACHE_TTL_HOURS,
+                 max_entries=QUOTE_CACHE_MAX_ENTRIES):
+        self.logger = get_logger()
+        self.ttl = timedelta(hours=ttl_hours)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM quotes").fetchone()[0]
+        self.reset_stats()
+
+    def _migrate(self):
+        """为旧的缓存库补齐新增的列"""
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    self.logger.info(f"报价缓存 {table} 表新增列: {column}")
+
+    def reset_stats(self):
+        """开始新一轮运行时清零命中统计"""
+        with self._lock:
+            self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'stores': 0, 'evictions': 0}
+
+    def get(self, room_id, check_in, check_out, guests):
+        """返回未过期的缓存报价（带quoted_at和exported），没有时返回None"""
+        now = datetime.now()
+        key = (room_id, check_in, check_out, int(guests))
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT price_info, cached_at, exported FROM quotes "
+                "WHERE room_id = ? AND check_in = ? AND check_out = ? AND guests = ?", key
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            price_info, cached_at, exported = row
+            if now - datetime.fromisoformat(cached_at) > self.ttl:
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute(
+                "UPDATE quotes SET last_access = ? "
+                "WHERE room_id = ? AND check_in = ? AND check_out = ? AND guests = ?",
+                (now.isoformat(timespec='seconds'), *key)
+            )
+            self.stats['hits'] += 1
+        return dict(json.loads(price_info), quoted_at=cached_at, exported=bool(exported))
+
+    def put(self, room_id, price_info, check_in=None, check_out=None):
+        """
+        缓存一条报价，默认以报价自身的入住/退房日期为键
+        check_in/check_out: 另外指定的键（例如请求的退房日期与实际报价不同时）
+        """
+        now = datetime.now().isoformat(timespec='seconds')
+        key = (room_id, check_in or price_info['check_in'], check_out or price_info['check_out'],
+               int(price_info.get('guests') or 0))
+        payload = json.dumps(price_info, ensure_ascii=False, default=str)
+        with self._lock, self._conn:
+            inserted = self._conn.execute(
+                "SELECT 1 FROM quotes WHERE room_id = ? AND check_in = ? AND check_out = ? AND guests = ?", key
+            ).fetchone() is None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quotes "
+                "(room_id, check_in, check_out, guests, price_info, cached_at, last_access, exported) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 0)", (*key, payload, now, now)
+            )
+            self.stats['stores'] += 1
+            self._entries += int(inserted)
+            if self._entries > self.max_entries:
+                self._evict()
+
+    def mark_exported(self, room_id, price_data):
+        """
+        报价导出后标记为已导出，之后命中缓存时不再重复导出
+        按报价实际的退房日期匹配，请求退房日期不同的另一个键一起标记
+        """
+        keys = [
+            (room_id, price_info['check_in'], int(price_info.get('guests') or 0), price_info['check_out'])
+            for price_info in price_data
+            if price_info.get('check_in') and price_info.get('check_out')
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE quotes SET exported = 1 WHERE room_id = ? AND check_in = ? AND guests = ? "
+                "AND json_extract(price_info, '$.check_out') = ?", keys
+            )
+
+    def _evict(self):
+        """淘汰最近最少访问的条目，一次多淘汰10%，避免每次写入都触发"""
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM quotes WHERE (room_id, check_in, check_out, guests) IN "
+            "(SELECT room_id, check_in, check_out, guests FROM quotes ORDER BY last_access LIMIT ?)",
+            (excess,)
+        )
+        self._entries -= excess
+        self.stats['evictions'] += excess
+
+    def purge_expired(self):
+        """删除所有过期条目，返回删除数"""
+        cutoff = (datetime.now() - self.ttl).isoformat(timespec='seconds')
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM quotes WHERE cached_at < ?", (cutoff,)).rowcount
+            self._entries -= deleted
+        return deleted
+
+    def log_stats(self):
+        """输出本轮运行的缓存命中统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            entries = self._entries
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0.0
+        self.logger.info(
+            f"报价缓存统计: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次 (其中过期 {stats['expired']}), "
+            f"命中率 {hit_rate:.1%}, 写入 {stats['stores']} 次, 淘汰 {stats['evictions']} 条, 当前 {entries} 条"
+        )
+
+# 提供一个便捷的全局实例
+quote_cache = QuoteCache()
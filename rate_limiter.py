@@ -0,0 +1,177 @@
+import time
+import threading
+from contextlib import contextmanager
+from logger_config import get_logger
+
+# 每个浏览器配置文件（各自使用独立代理）的页面请求速率，单位: 次/分钟
+INITIAL_RATE_PER_MINUTE = 12
+MIN_RATE_PER_MINUTE = 2
+MAX_RATE_PER_MINUTE = 40
+# 令牌桶容量，允许的短时突发请求数
+BURST = 3
+
+# 响应正常时每次加速的幅度（次/分钟，加法增加），异常时的降速比例（乘法减少）
+RECOVERY_STEP_PER_MINUTE = 1
+SLOW_FACTOR = 0.8
+BACKOFF_FACTOR = 0.5
+# 超过这个秒数的页面加载视为慢响应
+SLOW_RESPONSE_SECONDS = 8
+# 错误页面/拦截页后的暂停时间，连续失败时翻倍
+BASE_COOLDOWN_SECONDS = 10
+MAX_COOLDOWN_SECONDS = 300
+
+OUTCOMES = ('ok', 'slow', 'error', 'blocked')
+
+class AdaptiveTokenBucket:
+    """
+    自适应令牌桶：每次打开页面前取一个令牌
+    响应正常时逐步提高速率，慢响应时降速，错误页面或拦截页时减半并暂停一段时间（加法增加/乘法减少）
+    """
+
+    def __init__(self, name, rate_per_minute=INITIAL_RATE_PER_MINUTE, burst=BURST,
+                 min_rate_per_minute=MIN_RATE_PER_MINUTE, max_rate_per_minute=MAX_RATE_PER_MINUTE):
+        self.name = name
+        self.logger = get_logger()
+        self.rate_per_minute = rate_per_minute
+        self.min_rate_per_minute = min_rate_per_minute
+        self.max_rate_per_minute = max_rate_per_minute
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'waited_seconds': 0.0, 'backoffs': 0, **{outcome: 0 for outcome in OUTCOMES}}
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def acquire(self):
+        """等待直到可以发出下一个请求，返回等待的秒数"""
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - started
+                    self.stats['requests'] += 1
+                    self.stats['waited_seconds'] += waited
+                    return waited
+                else:
+                    wait = (1 - self._tokens) * 60 / self.rate_per_minute
+            time.sleep(wait)
+
+    def report(self, outcome, elapsed=None):
+        """
+        报告一次请求的结果，elapsed为页面加载耗时
+        ok: 页面正常（包括没有价格的正常页面）; slow: 慢响应; error: 加载失败且为错误/拦截页;
+        blocked: 页面已加载但没有价格，且为错误/拦截页
+        """
+        if outcome == 'ok' and elapsed is not None and elapsed > SLOW_RESPONSE_SECONDS:
+            outcome = 'slow'
+        with self._lock:
+            self.stats[outcome] += 1
+            previous_rate = self.rate_per_minute
+            if outcome == 'ok':
+                self._failures = 0
+                self.rate_per_minute = min(self.rate_per_minute + RECOVERY_STEP_PER_MINUTE, self.max_rate_per_minute)
+                return
+            if outcome == 'slow':
+                self.rate_per_minute = max(self.rate_per_minute * SLOW_FACTOR, self.min_rate_per_minute)
+                return
+
+            # 错误页面或拦截页：减速、清空令牌并暂停，连续失败时暂停时间翻倍
+            self._failures += 1
+            self.stats['backoffs'] += 1
+            self.rate_per_minute = max(self.rate_per_minute * BACKOFF_FACTOR, self.min_rate_per_minute)
+            cooldown = min(BASE_COOLDOWN_SECONDS * 2 ** (self._failures - 1), MAX_COOLDOWN_SECONDS)
+            self._tokens = 0.0
+            self._paused_until = time.monotonic() + cooldown
+        self.logger.warning(
+            f"限速 [{self.name}]: {outcome}，速率 {previous_rate:.1f} -> {self.rate_per_minute:.1f} 次/分钟，"
+            f"暂停 {cooldown} 秒 (连续 {self._failures} 次)"
+        )
+
+class _Unlimited:
+    """限速关闭时使用的令牌桶：不等待，不统计"""
+
+    def acquire(self):
+        return 0.0
+
+    def report(self, outcome, elapsed=None):
+        pass
+
+_UNLIMITED = _Unlimited()
+
+class RateLimiterRegistry:
+    """按浏览器配置文件管理令牌桶，driver通过bind关联到所属的配置文件"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._driver_keys = {}
+        self._lock = threading.Lock()
+        self.enabled = True
+
+    @contextmanager
+    def disabled(self):
+        """临时关闭限速（离线回放基准测试时使用）"""
+        previous, self.enabled = self.enabled, False
+        try:
+            yield self
+        finally:
+            self.enabled = previous
+
+    def bind(self, driver, key):
+        """把driver关联到配置文件（BrowserPool借出时调用）"""
+        with self._lock:
+            self._driver_keys[id(driver)] = key
+
+    def for_key(self, key):
+        if not self.enabled:
+            return _UNLIMITED
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = AdaptiveTokenBucket(key)
+            return self._buckets[key]
+
+    def for_driver(self, driver):
+        """driver所属配置文件的令牌桶，未关联的driver共用一个默认令牌桶"""
+        with self._lock:
+            key = self._driver_keys.get(id(driver), 'default')
+        return self.for_key(key)
+
+    def open_page(self, driver, url):
+        """
+        按driver所属配置文件限速后打开页面，加载耗时反馈给令牌桶
+        加载超时等异常只按慢响应降速（错误/拦截页由调用方识别后报告），异常继续抛出
+        """
+        bucket = self.for_driver(driver)
+        bucket.acquire()
+        started = time.monotonic()
+        try:
+            driver.get(url)
+        except Exception:
+            bucket.report('slow')
+            raise
+        bucket.report('ok', time.monotonic() - started)
+
+    def log_stats(self):
+        """输出每个配置文件的限速统计"""
+        logger = get_logger()
+        with self._lock:
+            buckets = list(self._buckets.values())
+        for bucket in buckets:
+            stats = dict(bucket.stats)
+            logger.info(
+                f"限速统计 [{bucket.name}]: 请求 {stats['requests']} 次, 等待 {stats['waited_seconds']:.1f} 秒, "
+                f"正常 {stats['ok']}, 慢 {stats['slow']}, 错误页 {stats['error']}, 拦截页 {stats['blocked']}, "
+                f"退避 {stats['backoffs']} 次, 当前速率 {bucket.rate_per_minute:.1f} 次/分钟"
+            )
+
+# 提供一个便捷的全局实例
+rate_limiter = RateLimiterRegistry()
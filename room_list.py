@@ -0,0 +1,137 @@
+import os
+import re
+import json
+import hashlib
+import pandas as pd
+from logger_config import get_logger
+
+# 解析结果缓存目录，按文件路径+修改时间+大小命中
+ROOM_LIST_CACHE_DIR = os.path.join('data', 'cache')
+
+# Airbnb房源ID为纯数字
+ROOM_ID_PATTERN = r'^\d{5,20}$'
+
+# 报告中每类问题最多列出的示例数
+REPORT_EXAMPLES = 5
+
+# 解析规则变化时递增，使旧的缓存结果失效
+ROOM_LIST_CACHE_VERSION = 2
+
+_memory_cache = {}
+
+def normalize_room_ids(values):
+    """
+    向量化规范房源ID：去空白、去掉Excel浮点导致的 ".0"、从房源URL中提取ID
+    返回规范后的字符串Series（空值为<NA>）
+    """
+    ids = pd.Series(values, dtype='string').str.strip()
+    from_url = ids.str.extract(r'rooms/(\d+)', expand=False)
+    ids = from_url.fillna(ids)
+    ids = ids.str.replace(r'^(\d+)\.0+$', r'\1', regex=True)
+    return ids.mask(ids == '')
+
+def validate_room_ids(raw, ids):
+    """去重并检查格式，返回 (有效ID列表, 校验报告)"""
+    empty = ids.isna()
+    # 科学计数法说明Excel已经把ID当作数字存储并丢失了精度，无法还原
+    scientific = ~empty & ids.str.contains(r'^\d(?:\.\d+)?[eE][+-]?\d+$', regex=True)
+    valid_format = ~empty & ids.str.match(ROOM_ID_PATTERN)
+    invalid = ~empty & ~valid_format & ~scientific
+    duplicated = valid_format & ids.duplicated()
+
+    room_ids = ids[valid_format & ~duplicated].tolist()
+    report = {
+        'rows': int(len(ids)),
+        'valid': len(room_ids),
+        'empty': int(empty.sum()),
+        'duplicates': int(duplicated.sum()),
+        'scientific_notation': int(scientific.sum()),
+        'invalid': int(invalid.sum()),
+        'duplicate_examples': ids[duplicated].head(REPORT_EXAMPLES).tolist(),
+        'scientific_examples': raw[scientific].astype(str).head(REPORT_EXAMPLES).tolist(),
+        'invalid_examples': raw[invalid].astype(str).head(REPORT_EXAMPLES).tolist(),
+    }
+    return room_ids, report
+
+def _drop_header(column):
+    """第一行不含任何数字时视为表头去掉；没有表头的纯ID列表不丢第一个ID"""
+    first = column.iloc[0] if len(column) else None
+    if isinstance(first, str) and not re.search(r'\d', first):
+        return column.iloc[1:]
+    return column
+
+def read_raw_ids(filename):
+    """读取房源列表文件的第一列，支持 xlsx/xls、csv 和每行一个ID的文本文件，表头可有可无"""
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in ('.xlsx', '.xls'):
+        df = pd.read_excel(filename, usecols=[0], dtype=str, header=None)
+        return _drop_header(df.iloc[:, 0])
+    if ext == '.csv':
+        df = pd.read_csv(filename, usecols=[0], dtype=str, skipinitialspace=True, header=None)
+        return _drop_header(df.iloc[:, 0])
+    # 纯文本：每行一个ID，忽略空行和#注释
+    with open(filename, encoding='utf-8-sig') as f:
+        lines = [line.split('#', 1)[0].strip() for line in f]
+    return pd.Series([line for line in lines if line], dtype='string')
+
+def _cache_path(filename):
+    digest = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(ROOM_LIST_CACHE_DIR, f'room_list_{digest}.json')
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_mtime_ns, stat.st_size, ROOM_LIST_CACHE_VERSION]
+
+def load_room_list(filename, use_cache=True):
+    """
+    读取并校验房源列表，返回 (房源ID列表, 校验报告)
+    解析结果按文件修改时间缓存在内存和 ROOM_LIST_CACHE_DIR 中，文件未变化时不重新解析
+    """
+    logger = get_logger()
+    signature = _file_signature(filename)
+    cache_path = _cache_path(filename)
+
+    if use_cache:
+        cached = _memory_cache.get(signature[0])
+        if cached and cached['signature'] == signature:
+            return list(cached['room_ids']), dict(cached['report'], cached=True)
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached['signature'] == signature:
+                _memory_cache[signature[0]] = cached
+                return list(cached['room_ids']), dict(cached['report'], cached=True)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    raw = read_raw_ids(filename)
+    room_ids, report = validate_room_ids(raw.reset_index(drop=True), normalize_room_ids(raw).reset_index(drop=True))
+
+    cached = {'signature': signature, 'room_ids': room_ids, 'report': report}
+    _memory_cache[signature[0]] = cached
+    if use_cache:
+        try:
+            os.makedirs(ROOM_LIST_CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cached, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"写入房源列表缓存失败: {str(e)}")
+    return room_ids, dict(report, cached=False)
+
+def log_report(filename, report):
+    """输出房源列表校验报告"""
+    logger = get_logger()
+    logger.info(
+        f"房源列表 {filename}{' (缓存)' if report.get('cached') else ''}: 共 {report['rows']} 行, "
+        f"有效 {report['valid']} 个, 空行 {report['empty']}, 重复 {report['duplicates']}, "
+        f"科学计数法 {report['scientific_notation']}, 格式错误 {report['invalid']}"
+    )
+    if report['duplicates']:
+        logger.warning(f"重复的房源ID已去除，例如: {', '.join(report['duplicate_examples'])}")
+    if report['scientific_notation']:
+        logger.warning(f"以下ID被Excel存为科学计数法，精度已丢失，请把该列设为文本后重新填写: "
+                       f"{', '.join(report['scientific_examples'])}")
+    if report['invalid']:
+        logger.warning(f"以下内容不是有效的房源ID，已跳过: {', '.join(report['invalid_examples'])}")
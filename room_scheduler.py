@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from logger_config import get_logger
+
+# 各项得分的权重
+SCHEDULE_WEIGHTS = {
+    'staleness': 0.5,   # 距离上次抓取越久越优先
+    'volatility': 0.3,  # 历史上日历/价格变化越频繁越优先
+    'urgency': 0.2,     # 最近的可预订日期越近越优先
+}
+
+# 距离上次抓取超过这个小时数按最陈旧计算；从未抓取过的房源也按最陈旧计算
+STALENESS_CAP_HOURS = 72
+
+# 统计历史变化的天数
+VOLATILITY_DAYS = 30
+# 日历变化次数和价格变异系数达到这些值时按最不稳定计算
+CALENDAR_CHANGES_CAP = 10
+PRICE_CV_CAP = 0.3
+
+# 最近的可预订日期在这个天数之外时紧迫度为0
+URGENCY_HORIZON_DAYS = 30
+
+def score_rooms(room_ids, activity, now=None):
+    """
+    按历史数据为房源打分，返回按得分从高到低排序的DataFrame
+    activity: HistoryDB.room_activity() 的结果
+    """
+    now = now or datetime.now()
+    scores = pd.DataFrame(index=pd.Index(room_ids, name='room_id')).join(activity, how='left')
+
+    last_scraped = pd.to_datetime(scores['last_scraped_at'], errors='coerce')
+    hours = (pd.Timestamp(now) - last_scraped).dt.total_seconds() / 3600
+    scores['staleness'] = (hours / STALENESS_CAP_HOURS).clip(0, 1).fillna(1.0)
+
+    calendar_volatility = (scores['calendar_changes'].fillna(0) / CALENDAR_CHANGES_CAP).clip(0, 1)
+    price_cv = (scores['price_std'] / scores['price_mean'].where(scores['price_mean'] > 0)).fillna(0)
+    scores['volatility'] = 0.5 * calendar_volatility + 0.5 * (price_cv / PRICE_CV_CAP).clip(0, 1)
+
+    nearest_open = pd.to_datetime(scores['nearest_open_date'], errors='coerce')
+    days_until_open = (nearest_open - pd.Timestamp(now.date())).dt.days
+    scores['urgency'] = (1 - days_until_open / URGENCY_HORIZON_DAYS).clip(0, 1).fillna(0)
+
+    scores['score'] = sum(scores[name] * weight for name, weight in SCHEDULE_WEIGHTS.items())
+    # 得分相同时保持原来的顺序
+    scores['position'] = np.arange(len(scores))
+    return scores.sort_values(['score', 'position'], ascending=[False, True], kind='stable')
+
+def prioritize_room_ids(room_ids, history_db, now=None):
+    """按 陈旧度 / 波动性 / 最近可预订日期 排序房源，没有历史库或查询失败时保持原顺序"""
+    logger = get_logger()
+    if history_db is None or not room_ids:
+        return list(room_ids)
+    try:
+        scores = score_rooms(room_ids, history_db.room_activity(VOLATILITY_DAYS), now)
+    except Exception as e:
+        logger.error(f"计算房源优先级失败，按原顺序抓取: {str(e)}")
+        return list(room_ids)
+
+    never_scraped = int(scores['last_scraped_at'].isna().sum())
+    logger.info(f"房源优先级: {len(scores)} 个房源, 从未抓取 {never_scraped} 个")
+    for room_id, row in scores.head(5).iterrows():
+        logger.info(
+            f"  {room_id}: 得分 {row['score']:.2f} (陈旧 {row['staleness']:.2f}, "
+            f"波动 {row['volatility']:.2f}, 紧迫 {row['urgency']:.2f})"
+        )
+    return scores.index.tolist()
@@ -0,0 +1,217 @@
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from logger_config import get_logger
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at   TEXT NOT NULL,
+    finished_at  TEXT,
+    total_rooms  INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS run_rooms (
+    run_id       INTEGER NOT NULL,
+    position     INTEGER NOT NULL,
+    room_id      TEXT NOT NULL,
+    PRIMARY KEY (run_id, position)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS completed_rooms (
+    run_id       INTEGER NOT NULL,
+    room_id      TEXT NOT NULL,
+    finished_at  TEXT NOT NULL,
+    summary      TEXT,
+    -- done: 已完成; failed: 失败次数达到上限，--resume不再重试
+    status       TEXT NOT NULL DEFAULT 'done',
+    PRIMARY KEY (run_id, room_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS room_failures (
+    run_id       INTEGER NOT NULL,
+    room_id      TEXT NOT NULL,
+    failures     INTEGER NOT NULL,
+    last_error   TEXT,
+    failed_at    TEXT NOT NULL,
+    PRIMARY KEY (run_id, room_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS completed_quotes (
+    run_id       INTEGER NOT NULL,
+    room_id      TEXT NOT NULL,
+    check_in     TEXT NOT NULL,
+    check_out    TEXT NOT NULL,
+    guests       INTEGER NOT NULL,
+    price_info   TEXT NOT NULL,
+    finished_at  TEXT NOT NULL,
+    PRIMARY KEY (run_id, room_id, check_in, check_out, guests)
+) WITHOUT ROWID;
+"""
+
+# 房源在同一次运行中（包括用--resume继续）最多失败几次，之后记为失败不再重试
+MAX_ROOM_FAILURES = 3
+
+# 旧版本日志中缺少的列，打开时自动补齐
+MIGRATIONS = {
+    'completed_rooms': [('status', "TEXT NOT NULL DEFAULT 'done'")],
+}
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+class RunJournal:
+    """
+    批量运行的持久化日志：记录本次运行的房源列表、已完成的房源和已完成的报价
+    运行中断后用 --resume 继续上一次未完成的运行，已完成的工作直接跳过
+    """
+
+    def __init__(self, db_path=os.path.join('data', 'run_journal.db')):
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.commit()
+
+    def _migrate(self):
+        """为旧的日志库补齐新增的列"""
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+            for column, column_type in columns:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+                    self.logger.info(f"运行日志 {table} 表新增列: {column}")
+
+    def start_run(self, room_ids):
+        """开始新的运行，保存房源列表，返回run_id"""
+        with self._lock, self._conn:
+            run_id = self._conn.execute(
+                "INSERT INTO runs (started_at, total_rooms) VALUES (?, ?)", (_now(), len(room_ids))
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO run_rooms (run_id, position, room_id) VALUES (?, ?, ?)",
+                [(run_id, position, room_id) for position, room_id in enumerate(room_ids)]
+            )
+        self.logger.info(f"运行日志: 开始第 {run_id} 次运行, 共 {len(room_ids)} 个房源")
+        return run_id
+
+    def last_unfinished_run(self):
+        """最近一次未完成的运行，返回run_id或None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id FROM runs WHERE finished_at IS NULL ORDER BY run_id DESC LIMIT 1"
+            ).fetchone()
+        return row[0] if row else None
+
+    def run_rooms(self, run_id):
+        """运行开始时保存的房源列表"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT room_id FROM run_rooms WHERE run_id = ? ORDER BY position", (run_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def completed_rooms(self, run_id):
+        """已结束的房源（包括失败次数达到上限的） {room_id: 汇总用的精简结果，失败的为None}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT room_id, summary FROM completed_rooms WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        return {room_id: json.loads(summary) if summary else None for room_id, summary in rows}
+
+    def failed_rooms(self, run_id):
+        """失败次数达到上限的房源 {room_id: 最后一次错误}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT c.room_id, f.last_error FROM completed_rooms c "
+                "LEFT JOIN room_failures f ON f.run_id = c.run_id AND f.room_id = c.room_id "
+                "WHERE c.run_id = ? AND c.status = 'failed'", (run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def record_failure(self, run_id, room_id, error=None, max_failures=MAX_ROOM_FAILURES):
+        """房源处理失败时记录，失败次数达到max_failures后记为失败（运行可以结束），返回是否已记为失败"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO room_failures (run_id, room_id, failures, last_error, failed_at) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT (run_id, room_id) DO UPDATE SET failures = failures + 1, "
+                "last_error = excluded.last_error, failed_at = excluded.failed_at",
+                (run_id, room_id, error, _now())
+            )
+            failures = self._conn.execute(
+                "SELECT failures FROM room_failures WHERE run_id = ? AND room_id = ?", (run_id, room_id)
+            ).fetchone()[0]
+            if failures < max_failures:
+                return False
+            self._conn.execute(
+                "INSERT OR IGNORE INTO completed_rooms (run_id, room_id, finished_at, summary, status) "
+                "VALUES (?, ?, ?, NULL, 'failed')", (run_id, room_id, _now())
+            )
+        self.logger.error(f"运行日志: Room ID {room_id} 已失败 {failures} 次，记为失败，不再重试")
+        return True
+
+    def mark_room_done(self, run_id, room_id, summary=None):
+        """房源完成后记录，summary为该房源汇总用的精简结果（SummaryAccumulator.add的返回值）"""
+        payload = json.dumps(summary, ensure_ascii=False, default=str) if summary is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completed_rooms (run_id, room_id, finished_at, summary, status) "
+                "VALUES (?, ?, ?, ?, 'done')",
+                (run_id, room_id, _now(), payload)
+            )
+
+    def record_quote(self, run_id, room_id, check_in, check_out, guests, price_info):
+        """记录一个已完成的报价，键为报价计划中的入住/退房日期"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completed_quotes "
+                "(run_id, room_id, check_in, check_out, guests, price_info, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id, room_id, check_in, check_out, int(guests),
+                 json.dumps(price_info, ensure_ascii=False, default=str), _now())
+            )
+
+    def completed_quotes(self, run_id, room_id):
+        """房源在本次运行中已完成的报价 {(check_in, check_out, guests): 价格信息}"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT check_in, check_out, guests, price_info FROM completed_quotes WHERE run_id = ? AND room_id = ?",
+                (run_id, room_id)
+            ).fetchall()
+        return {(check_in, check_out, guests): json.loads(info) for check_in, check_out, guests, info in rows}
+
+    def finish_run(self, run_id):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE runs SET finished_at = ? WHERE run_id = ?", (_now(), run_id))
+        self.logger.info(f"运行日志: 第 {run_id} 次运行已完成")
+
+# 当前运行的日志，check_room_price通过下面的函数读写报价进度
+_active_journal = None
+_active_run_id = None
+
+def set_journal(journal, run_id):
+    """设置当前运行的日志，传入None关闭"""
+    global _active_journal, _active_run_id
+    _active_journal, _active_run_id = journal, run_id
+
+def journal_quote(room_id, check_in, check_out, guests, price_info):
+    """日志开启时记录一个完成的报价"""
+    if _active_journal is not None:
+        _active_journal.record_quote(_active_run_id, room_id, check_in, check_out, guests, price_info)
+
+def journal_room_failed(room_id, error=None):
+    """日志开启时记录房源失败，返回是否已达到失败上限"""
+    if _active_journal is None:
+        return False
+    return _active_journal.record_failure(_active_run_id, room_id, error)
+
+def journaled_quotes(room_id):
+    """本次运行中该房源已完成的报价，日志未开启时返回空dict"""
+    if _active_journal is None:
+        return {}
+    return _active_journal.completed_quotes(_active_run_id, room_id)
@@ -0,0 +1,122 @@
+import os
+import glob
+import uuid
+import importlib.util
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from logger_config import get_logger
+
+# Parquet需要pyarrow，未安装时DataExporter会退回Excel
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+class SnapshotStore:
+    """
+    按 房源/抓取日期 分区的列式快照存储
+    目录结构: <base_dir>/<data_type>/room_id=<room_id>/scrape_date=<YYYY-MM-DD>/part-<时间>-<随机>.parquet
+    后台写线程合并多个房源写入: <base_dir>/<data_type>/batches/scrape_date=<YYYY-MM-DD>/part-<时间>-<随机>.parquet
+    每次写入新增一个分片文件，不修改已有文件，多个线程可以同时写入
+    """
+
+    def __init__(self, base_dir=os.path.join('data', 'snapshots')):
+        if not PARQUET_AVAILABLE:
+            raise ImportError("SnapshotStore需要安装pyarrow")
+        self.base_dir = base_dir
+        self.logger = get_logger()
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    def room_dir(self, data_type, room_id):
+        """房源的快照目录，包含该房源所有抓取日期的分区"""
+        return os.path.join(self.base_dir, data_type, f'room_id={room_id}')
+
+    def partition_dir(self, data_type, room_id, scrape_date):
+        """分区目录"""
+        return os.path.join(self.room_dir(data_type, room_id), f'scrape_date={scrape_date}')
+
+    def batch_dir(self, data_type):
+        """多个房源合并写入的分片目录"""
+        return os.path.join(self.base_dir, data_type, 'batches')
+
+    def _write_part(self, partition, df, scraped_at):
+        """先写临时文件再改名，读取方不会看到写了一半的分片，返回分片文件路径"""
+        os.makedirs(partition, exist_ok=True)
+        filename = f"part-{scraped_at.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(partition, filename)
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        return path
+
+    def append(self, data_type, room_id, df, scraped_at=None):
+        """追加一份快照，返回分片文件路径"""
+        scraped_at = scraped_at or datetime.now()
+        df = df.copy()
+        df['room_id'] = room_id
+        df['scraped_at'] = pd.Timestamp(scraped_at)
+        path = self._write_part(self.partition_dir(data_type, room_id, scraped_at.strftime('%Y-%m-%d')), df, scraped_at)
+        self.logger.info(f"{data_type}快照已写入: {path} ({len(df)} 行)")
+        return path
+
+    def append_batch(self, data_type, snapshots):
+        """
+        把多个房源的快照合并写入一个分片，返回分片文件路径
+        snapshots: [(room_id, df, scraped_at), ...]，每行保留各自的房源和抓取时间
+        """
+        frames = []
+        for room_id, df, scraped_at in snapshots:
+            df = df.copy()
+            df['room_id'] = room_id
+            df['scraped_at'] = pd.Timestamp(scraped_at)
+            frames.append(df)
+        written_at = max(scraped_at for _, _, scraped_at in snapshots)
+        partition = os.path.join(self.batch_dir(data_type), f"scrape_date={written_at.strftime('%Y-%m-%d')}")
+        path = self._write_part(partition, pd.concat(frames, ignore_index=True), written_at)
+        self.logger.info(f"{data_type}快照已合并写入: {path} ({len(snapshots)} 个房源, {sum(len(f) for f in frames)} 行)")
+        return path
+
+    def list_parts(self, data_type, room_id=None, start_date=None, end_date=None):
+        """列出满足条件的分片文件（包括多房源合并的分片），日期为YYYY-MM-DD字符串，含两端"""
+        room_pattern = f'room_id={room_id}' if room_id else 'room_id=*'
+        patterns = [
+            os.path.join(self.base_dir, data_type, room_pattern, 'scrape_date=*', '*.parquet'),
+            os.path.join(self.batch_dir(data_type), 'scrape_date=*', '*.parquet'),
+        ]
+        parts = []
+        for path in (path for pattern in patterns for path in glob.glob(pattern)):
+            scrape_date = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+            if start_date and scrape_date < start_date:
+                continue
+            if end_date and scrape_date > end_date:
+                continue
+            parts.append(path)
+        return sorted(parts)
+
+    def read(self, data_type, room_id=None, start_date=None, end_date=None):
+        """读取快照并合并为一个DataFrame"""
+        parts = self.list_parts(data_type, room_id, start_date, end_date)
+        if not parts:
+            return pd.DataFrame()
+        frames = [pd.read_parquet(path) for path in parts]
+        # 合并分片中包含其他房源的行
+        if room_id:
+            frames = [df[df['room_id'] == room_id] for df in frames]
+        return pd.concat(frames, ignore_index=True)
+
+    def export_excel(self, data_type, output_file, room_id=None, start_date=None, end_date=None):
+        """按需把快照导出为Excel报表"""
+        df = self.read(data_type, room_id, start_date, end_date)
+        if df.empty:
+            self.logger.warning(f"没有可导出的{data_type}快照")
+            return None
+
+        # Excel不支持列表类型的单元格，转换为空格分隔的文本
+        for column in df.columns:
+            if df[column].map(lambda v: isinstance(v, (list, tuple, np.ndarray))).any():
+                df[column] = df[column].map(
+                    lambda v: ' '.join(map(str, v)) if isinstance(v, (list, tuple, np.ndarray)) else v
+                )
+
+        os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        df.to_excel(output_file, index=False)
+        self.logger.info(f"{data_type}报表已导出: {output_file} ({len(df)} 行)")
+        return output_file
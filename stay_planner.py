@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from logger_config import get_logger
+
+DATE_FORMAT = '%d/%m/%Y'
+
+# 可作为入住日期的状态
+CHECKIN_STATUSES = ("可预订",)
+# 夜晚本身未被占用的状态（可以作为住宿中间的夜晚）
+FREE_NIGHT_STATUSES = ("可预订", "无法选择退房日期")
+
+PLAN_STRATEGIES = ('full', 'every_n', 'weekends', 'stay_lengths')
+
+# 普通报价（非报价矩阵）的入住人数
+DEFAULT_GUESTS = 3
+
+def _parse_date(date_str):
+    return datetime.strptime(date_str, DATE_FORMAT).date()
+
+def _quote(check_in, nights, min_nights):
+    """构建一条报价计划"""
+    return {
+        'check_in': check_in.strftime(DATE_FORMAT),
+        'check_out': (check_in + timedelta(days=nights)).strftime(DATE_FORMAT),
+        'nights': nights,
+        'min_nights': min_nights
+    }
+
+def index_calendar(calendar_data):
+    """把日历数据整理为 {日期: 日历行}，同一房源多次判断时只需整理一次"""
+    calendar = {}
+    for date_info in calendar_data:
+        try:
+            calendar[_parse_date(date_info['date'])] = date_info
+        except (KeyError, ValueError):
+            continue
+    return calendar
+
+def _is_feasible(calendar, check_in, nights):
+    """住宿期间每晚都未被占用"""
+    return all(
+        calendar.get(check_in + timedelta(days=offset), {}).get('status') in FREE_NIGHT_STATUSES
+        for offset in range(nights)
+    )
+
+def _stay_nights(date_info, default_min_nights):
+    return date_info.get('min_nights') or default_min_nights
+
+def _plan_full(calendar, checkin_dates, default_min_nights):
+    """最少报价覆盖所有可入住的夜晚
+
+    对第一个未覆盖的日期，在所有能覆盖它的可行入住日中选择覆盖最远的一个，
+    这是区间覆盖问题的贪心最优解。
+    """
+    logger = get_logger()
+    quotes = []
+    covered_until = None
+    for target in checkin_dates:
+        if covered_until and target < covered_until:
+            continue
+
+        best = None
+        for start in checkin_dates:
+            if start > target:
+                break
+            nights = _stay_nights(calendar[start], default_min_nights)
+            reach = start + timedelta(days=nights)
+            if reach > target and _is_feasible(calendar, start, nights):
+                if best is None or reach > best[0]:
+                    best = (reach, start, nights)
+
+        if best is None:
+            logger.debug(f"日期 {target.strftime(DATE_FORMAT)} 无法满足最小入住要求，跳过")
+            continue
+
+        reach, start, nights = best
+        quotes.append(_quote(start, nights, calendar[start].get('min_nights')))
+        covered_until = reach
+    return quotes
+
+def _plan_every_n(calendar, checkin_dates, default_min_nights, every_n):
+    """每隔N个可入住日期报价一次"""
+    quotes = []
+    for start in checkin_dates[::max(every_n, 1)]:
+        nights = _stay_nights(calendar[start], default_min_nights)
+        if _is_feasible(calendar, start, nights):
+            quotes.append(_quote(start, nights, calendar[start].get('min_nights')))
+    return quotes
+
+def _plan_weekends(calendar, checkin_dates, default_min_nights, weekend_nights):
+    """只报价周末：周五入住，周五不可入住时改用周六"""
+    quotes = []
+    checkin_set = set(checkin_dates)
+    for start in checkin_dates:
+        weekday = start.weekday()
+        if weekday == 5 and (start - timedelta(days=1)) in checkin_set:
+            continue
+        if weekday not in (4, 5):
+            continue
+        nights = max(_stay_nights(calendar[start], default_min_nights), weekend_nights if weekday == 4 else 1)
+        if _is_feasible(calendar, start, nights):
+            quotes.append(_quote(start, nights, calendar[start].get('min_nights')))
+    return quotes
+
+def _plan_stay_lengths(calendar, checkin_dates, stay_lengths):
+    """按指定的住宿天数报价，每种天数首尾相接地铺满可入住日期"""
+    quotes = []
+    for nights in sorted(set(stay_lengths)):
+        next_start = None
+        for start in checkin_dates:
+            if next_start and start < next_start:
+                continue
+            min_nights = calendar[start].get('min_nights')
+            if min_nights and nights < min_nights:
+                continue
+            if _is_feasible(calendar, start, nights):
+                quotes.append(_quote(start, nights, min_nights))
+                next_start = start + timedelta(days=nights)
+    return quotes
+
+def plan_stay_quotes(calendar_data, strategy='full', every_n=7, stay_lengths=(1, 2, 7),
+                     weekend_nights=2, default_min_nights=1):
+    """
+    根据日历数据计算需要查询的(入住, 退房)组合
+    calendar_data: check_calendar_availability返回的日历数据
+    strategy: full / every_n / weekends / stay_lengths
+    返回按入住日期排序的列表，每项包含check_in、check_out、nights、min_nights
+    """
+    logger = get_logger()
+    if strategy not in PLAN_STRATEGIES:
+        raise ValueError(f"未知的报价计划策略: {strategy}")
+
+    calendar = index_calendar(calendar_data)
+    checkin_dates = sorted(d for d, info in calendar.items() if info.get('status') in CHECKIN_STATUSES)
+
+    if strategy == 'full':
+        quotes = _plan_full(calendar, checkin_dates, default_min_nights)
+    elif strategy == 'every_n':
+        quotes = _plan_every_n(calendar, checkin_dates, default_min_nights, every_n)
+    elif strategy == 'weekends':
+        quotes = _plan_weekends(calendar, checkin_dates, default_min_nights, weekend_nights)
+    else:
+        quotes = _plan_stay_lengths(calendar, checkin_dates, stay_lengths)
+
+    quotes.sort(key=lambda q: (_parse_date(q['check_in']), q['nights']))
+    logger.info(f"报价计划({strategy}): {len(checkin_dates)} 个可入住日期 -> {len(quotes)} 次报价")
+    return quotes
+
+def stay_feasibility(calendar_data, check_in, nights):
+    """
+    判断一次住宿能否报价
+    calendar_data: 日历数据，或index_calendar整理好的 {日期: 日历行}
+    返回 'ok' / 'below_min_stay'（短于最小入住天数）/ 'unavailable'（入住日不可入住或期间有占用）
+         / 'unknown_min'（期间未被占用，但日历中没有最小入住天数，需要打开页面确认）
+    """
+    calendar = calendar_data if isinstance(calendar_data, dict) else index_calendar(calendar_data)
+    start = _parse_date(check_in)
+    date_info = calendar.get(start)
+    if not date_info or date_info.get('status') not in CHECKIN_STATUSES:
+        return 'unavailable'
+    if date_info.get('min_nights') and nights < date_info['min_nights']:
+        return 'below_min_stay'
+    if not _is_feasible(calendar, start, nights):
+        return 'unavailable'
+    if not date_info.get('min_nights'):
+        return 'unknown_min'
+    return 'ok'
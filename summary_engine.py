@@ -0,0 +1,206 @@
+import os
+import threading
+from itertools import chain
+from operator import methodcaller
+import numpy as np
+import pandas as pd
+from stay_planner import FREE_NIGHT_STATUSES
+from price_parser import parse_price_series
+from logger_config import get_logger
+
+# 汇总表的列顺序
+SUMMARY_COLUMNS = [
+    'Room ID', 'URL', '总天数', '可预订天数', '不可预订天数', '不可入住天数', '不可入住率',
+    '平均每晚价格', '中位每晚价格', 'P25每晚价格', 'P75每晚价格', '最高每晚价格', '最低每晚价格',
+    '价格样本数', '预估收入上限', '数据文件'
+]
+
+def _room_id(url):
+    return url.split('rooms/')[-1].split('?')[0]
+
+def compact_result(result):
+    """
+    只保留汇总需要的字段（可JSON序列化），原始日历和价格数据随后即可释放
+    返回 {'room_id', 'url', 'calendar_excel', 'dates', 'statuses', 'nightly_price', 'nightly_price_amount'}
+    """
+    calendar = result.get('calendar_data') or []
+    quotes = result['price_info'] if isinstance(result.get('price_info'), list) else []
+    return {
+        'room_id': _room_id(result['url']),
+        'url': result['url'],
+        'calendar_excel': result.get('calendar_excel'),
+        'dates': list(map(methodcaller('get', 'date'), calendar)),
+        'statuses': list(map(methodcaller('get', 'status'), calendar)),
+        'nightly_price': list(map(methodcaller('get', 'nightly_price'), quotes)),
+        'nightly_price_amount': list(map(methodcaller('get', 'nightly_price_amount'), quotes)),
+    }
+
+def frames_from_compact(records):
+    """
+    把所有房源的精简结果合并为三张表，每个房源只做一次列表拼接，不逐行构造字典
+    rooms: room_id, url, calendar_excel（行号即房源编号）
+    calendar: room（房源编号）, date, status（每个房源每天一行，状态为分类类型）
+    prices: room（房源编号）, nightly_price, nightly_price_amount（每次报价一行）
+    """
+    rooms = pd.DataFrame({
+        'room_id': [record['room_id'] for record in records],
+        'url': [record['url'] for record in records],
+        'calendar_excel': [record.get('calendar_excel') for record in records],
+    })
+    positions = np.arange(len(records))
+
+    def column(name):
+        return list(chain.from_iterable(record[name] for record in records))
+
+    # 各房源的日期大量重复，只解析不重复的日期
+    dates = pd.Categorical(column('dates'))
+    parsed = pd.to_datetime(dates.categories, format='%d/%m/%Y', errors='coerce').append(pd.DatetimeIndex([pd.NaT]))
+    calendar = pd.DataFrame({
+        'room': np.repeat(positions, [len(record['dates']) for record in records]),
+        'date': parsed.take(dates.codes),
+        'status': pd.Categorical(column('statuses')),
+    })
+    prices = pd.DataFrame({
+        'room': np.repeat(positions, [len(record['nightly_price']) for record in records]),
+        'nightly_price': column('nightly_price'),
+        'nightly_price_amount': column('nightly_price_amount'),
+    })
+    return rooms, calendar, prices
+
+def build_frames(results):
+    """把analyze_listing的结果合并为 rooms / calendar / prices 三张表（见frames_from_compact）"""
+    return frames_from_compact([compact_result(result) for result in results if result])
+
+def summarize_frames(rooms, calendar, prices, today=None):
+    """
+    在合并后的表上一次性计算所有房源的汇总，天数只统计今天及以后的日期（日历中过去的日期都显示为不可订）
+    不可入住天数为不能入住过夜的天数。日历无法区分已被预订和房东屏蔽，所以这不是入住天数，
+    不可入住率 = 不可入住天数 / 总天数，预估收入上限 = 不可入住天数 x 中位每晚价格（假设不可入住的天都已售出）
+    """
+    room_count = len(rooms)
+    today = pd.Timestamp(today or pd.Timestamp.now()).normalize()
+    calendar = calendar[calendar['date'] >= today]
+    statuses = calendar['status'].astype('category')
+    categories = list(statuses.cat.categories)
+    # 房源编号 x 状态 的计数矩阵
+    codes = statuses.cat.codes.to_numpy()
+    valid = codes >= 0
+    counts = np.bincount(
+        calendar['room'].to_numpy()[valid] * len(categories) + codes[valid],
+        minlength=room_count * len(categories)
+    ).reshape(room_count, len(categories))
+
+    def status_days(names):
+        columns = [categories.index(name) for name in names if name in categories]
+        return counts[:, columns].sum(axis=1)
+
+    total_days = np.bincount(calendar['room'].to_numpy(), minlength=room_count)
+    unavailable = total_days - status_days(FREE_NIGHT_STATUSES)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        unavailable_rate = np.where(total_days > 0, unavailable / total_days, np.nan)
+
+    summary = pd.DataFrame({
+        'Room ID': rooms['room_id'],
+        'URL': rooms['url'],
+        '总天数': total_days,
+        '可预订天数': status_days(['可预订']),
+        '不可预订天数': status_days(['不可预订']),
+        '不可入住天数': unavailable,
+        '不可入住率': np.round(unavailable_rate, 4),
+        '数据文件': rooms['calendar_excel'],
+    })
+
+    # 没有数值列的旧数据按文本批量解析
+    amount = pd.to_numeric(prices['nightly_price_amount'], errors='coerce')
+    if amount.isna().any():
+        amount = amount.fillna(parse_price_series(prices['nightly_price'])['amount'])
+    valid = amount.notna()
+    by_room = amount[valid].groupby(prices['room'][valid])
+    quantiles = by_room.quantile([0.25, 0.5, 0.75]).unstack()
+    price_stats = pd.DataFrame({
+        '平均每晚价格': by_room.mean(),
+        '中位每晚价格': quantiles.get(0.5),
+        'P25每晚价格': quantiles.get(0.25),
+        'P75每晚价格': quantiles.get(0.75),
+        '最高每晚价格': by_room.max(),
+        '最低每晚价格': by_room.min(),
+        '价格样本数': by_room.size(),
+    }).reindex(range(room_count))
+
+    summary = summary.join(price_stats)
+    summary['价格样本数'] = summary['价格样本数'].fillna(0).astype(int)
+    summary['预估收入上限'] = summary['不可入住天数'] * summary['中位每晚价格']
+    price_columns = [c for c in summary.columns if c.endswith('每晚价格')] + ['预估收入上限']
+    summary[price_columns] = summary[price_columns].round(2)
+
+    # 同一房源出现多次时保留最后一次结果
+    summary = summary.drop_duplicates('Room ID', keep='last').reset_index(drop=True)
+    return summary[SUMMARY_COLUMNS]
+
+def build_summary(results):
+    """由analyze_multiple_listings的结果生成汇总DataFrame，每个房源一行"""
+    return summarize_frames(*build_frames(results))
+
+class SummaryAccumulator:
+    """
+    流式汇总：每完成一个房源只保留它的精简结果（日期、状态和每晚价格），原始日历和价格数据即可释放
+    取汇总时把尚未汇总的房源合并后用summarize_frames一次性计算，已汇总的房源只保留汇总行，
+    每个房源只计算一次，运行过程中随时可以取得部分汇总
+    """
+
+    def __init__(self):
+        self.logger = get_logger()
+        self._pending = {}  # {room_id: 精简结果}，尚未汇总
+        self._summary = pd.DataFrame(columns=SUMMARY_COLUMNS)
+        self._room_ids = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._room_ids)
+
+    def _put(self, record):
+        self._pending[record['room_id']] = record
+        self._room_ids.add(record['room_id'])
+
+    def add(self, result):
+        """保存一个房源的精简结果并返回它（可写入运行日志），无效结果返回None"""
+        if not result:
+            return None
+        record = compact_result(result)
+        with self._lock:
+            self._put(record)
+        return record
+
+    def restore(self, records):
+        """载入之前已完成房源的精简结果（继续中断的运行时使用）"""
+        with self._lock:
+            for record in records:
+                if record:
+                    self._put(record)
+
+    def summary(self):
+        """当前已完成房源的汇总DataFrame，同一房源保留最后一次结果"""
+        with self._lock:
+            if self._pending:
+                fresh = summarize_frames(*frames_from_compact(list(self._pending.values())))
+                kept = self._summary[~self._summary['Room ID'].isin(fresh['Room ID'])]
+                self._summary = pd.concat([kept, fresh], ignore_index=True) if len(kept) else fresh
+                self._pending = {}
+            return self._summary.copy()
+
+    def write_excel(self, path):
+        """把当前汇总写入Excel，先写临时文件再替换，读取方不会看到写了一半的文件"""
+        summary = self.summary()
+        if summary.empty:
+            return None
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            root, ext = os.path.splitext(path)
+            tmp_path = f'{root}.tmp{ext}'
+            summary.to_excel(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            return path
+        except Exception as e:
+            self.logger.error(f"写入汇总报告失败 {path}: {str(e)}")
+            return None
@@ -0,0 +1,103 @@
+import importlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from history_db import HistoryDB
+from incremental_planner import QUOTE_TTL_HOURS, load_previous_state, select_requotes
+
+ROOM_ID = '42'
+
+def _calendar():
+    return [
+        {'date': f'{day:02d}/03/2030', 'status': '可预订', 'is_blocked': False, 'min_nights': 2}
+        for day in range(1, 11)
+    ]
+
+def _quotes():
+    return [
+        {'check_in': f'{day:02d}/03/2030', 'check_out': f'{day + 2:02d}/03/2030', 'nights': 2, 'min_nights': 2}
+        for day in (1, 3, 5, 7)
+    ]
+
+def _price_data():
+    return [
+        dict(quote, guests=3, nightly_price='$120 NZD', total='$300 NZD')
+        for quote in _quotes()
+    ]
+
+@pytest.fixture
+def history_db(tmp_path):
+    db = HistoryDB(str(tmp_path / 'history.db'))
+    yield db
+    db.close()
+
+def test_unchanged_requote_is_not_stale(history_db):
+    scraped_at = datetime(2030, 1, 1, 8)
+    history_db.insert_calendar(ROOM_ID, _calendar(), scraped_at)
+    history_db.insert_prices(ROOM_ID, _price_data(), scraped_at)
+
+    # 过期后重新报价得到相同的价格，只记录看到时间
+    requoted_at = scraped_at + timedelta(hours=QUOTE_TTL_HOURS + 1)
+    assert history_db.mark_quotes_seen(ROOM_ID, _price_data(), requoted_at) == len(_quotes())
+
+    previous = load_previous_state(history_db, ROOM_ID)
+    to_quote, carried, stats = select_requotes(
+        _quotes(), _calendar(), previous, now=requoted_at + timedelta(hours=1)
+    )
+    assert to_quote == []
+    assert stats['stale'] == 0
+    assert all(quote['quoted_at'] == requoted_at.isoformat(timespec='seconds') for quote in carried)
+
+def test_quote_without_new_sighting_goes_stale(history_db):
+    scraped_at = datetime(2030, 1, 1, 8)
+    history_db.insert_calendar(ROOM_ID, _calendar(), scraped_at)
+    history_db.insert_prices(ROOM_ID, _price_data(), scraped_at)
+
+    previous = load_previous_state(history_db, ROOM_ID)
+    _, _, stats = select_requotes(
+        _quotes(), _calendar(), previous, now=scraped_at + timedelta(hours=QUOTE_TTL_HOURS + 1)
+    )
+    assert stats['stale'] == len(_quotes())
+
+def test_exporter_dedup_refreshes_quote_time(tmp_path, monkeypatch):
+    # data_export在导入时会在当前目录下创建全局导出器
+    monkeypatch.chdir(tmp_path)
+    data_export = importlib.import_module('data_export')
+    exporter = data_export.DataExporter({'base_dir': str(tmp_path / 'data'), 'backend': 'excel'})
+    url = f'https://www.airbnb.co.nz/rooms/{ROOM_ID}'
+    exporter.export_calendar_data(_calendar(), url)
+    exporter.export_price_data(_price_data(), url)
+
+    # 把第一次报价改为很早以前，再导出相同内容
+    old = (datetime.now() - timedelta(hours=QUOTE_TTL_HOURS * 2)).isoformat(timespec='seconds')
+    with exporter.history_db._conn:
+        exporter.history_db._conn.execute("UPDATE price_quotes SET scraped_at = ?, last_seen_at = ?", (old, old))
+    assert exporter.export_price_data(_price_data(), url)['unchanged']
+
+    previous = load_previous_state(exporter.history_db, ROOM_ID)
+    _, _, stats = select_requotes(_quotes(), _calendar(), previous)
+    assert stats['stale'] == 0
+    exporter.history_db.close()
+
+def test_failed_matrix_row_does_not_hide_quote(history_db):
+    scraped_at = datetime(2030, 1, 1, 8)
+    history_db.insert_calendar(ROOM_ID, _calendar(), scraped_at)
+    history_db.record('price', ROOM_ID, _price_data(), scraped_at)
+
+    # 几分钟后报价矩阵中同一组合报价失败，没有价格
+    failed = [dict(quote, guests=3, quote_status='failed') for quote in _quotes()]
+    assert history_db.record('price_matrix', ROOM_ID, failed, scraped_at + timedelta(minutes=5)) == 0
+    history_db.insert_prices(ROOM_ID, [dict(_quotes()[0], guests=3)], scraped_at + timedelta(minutes=6))
+
+    previous = load_previous_state(history_db, ROOM_ID)
+    _, carried, stats = select_requotes(_quotes(), _calendar(), previous, now=scraped_at + timedelta(hours=1))
+    assert stats['carried'] == len(_quotes())
+    assert all(quote['nightly_price'] == '$120 NZD' for quote in carried)
+
+def test_price_and_matrix_exports_in_same_second_both_kept(history_db):
+    scraped_at = datetime(2030, 1, 1, 8)
+    matrix = [dict(quote, guests=3, quote_status='ok', nightly_price='$130 NZD') for quote in _quotes()]
+    history_db.record('price', ROOM_ID, _price_data(), scraped_at)
+    history_db.record('price_matrix', ROOM_ID, matrix, scraped_at)
+    assert len(history_db.price_trend(ROOM_ID, days=100000)) == 2 * len(_quotes())